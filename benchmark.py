@@ -0,0 +1,123 @@
+from src.benchmark.benchmark import compare_results, run_benchmarks, synthetic_videos
+from src.video_quality_eval.deep_learning.simpleVQA.precision import compare_precision
+from constants.benchmark.constants import (
+    BENCHMARK_RESULTS_PATH,
+    BENCHMARK_REPEATS,
+    BENCHMARK_TOLERANCE,
+    BENCHMARK_MAX_SCORE_DRIFT,
+)
+from constants.video_quality_eval.constants import (
+    BACKBONE_PRECISION,
+    QUANTIZE_REGRESSION_HEAD,
+    CHANNELS_LAST,
+    MOTION_BATCH_SIZE,
+)
+import argparse
+import json
+import os
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the video quality evaluation on synthetic videos."
+    )
+    parser.add_argument("--output", default=BENCHMARK_RESULTS_PATH)
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--repeats", type=int, default=BENCHMARK_REPEATS)
+    parser.add_argument("--tolerance", type=float, default=BENCHMARK_TOLERANCE)
+    parser.add_argument("--no-vqa", action="store_true", help="skip the networks")
+    parser.add_argument(
+        "--backbone-precision", choices=["fp32", "bf16"], default=BACKBONE_PRECISION
+    )
+    # store_true/store_false pairs rather than BooleanOptionalAction, which needs
+    # Python 3.9
+    parser.add_argument("--quantize-head", action="store_true")
+    parser.add_argument(
+        "--no-quantize-head", dest="quantize_head", action="store_false"
+    )
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument(
+        "--no-channels-last", dest="channels_last", action="store_false"
+    )
+    parser.set_defaults(
+        quantize_head=QUANTIZE_REGRESSION_HEAD, channels_last=CHANNELS_LAST
+    )
+    parser.add_argument(
+        "--motion-batch-size",
+        type=int,
+        default=MOTION_BATCH_SIZE,
+        help="clips per SlowFast forward in the motion_forward stage",
+    )
+    parser.add_argument(
+        "--check-precision",
+        action="store_true",
+        help="compare the SimpleVQA scores of the chosen precision with float32",
+    )
+    parser.add_argument("--max-drift", type=float, default=BENCHMARK_MAX_SCORE_DRIFT)
+    return parser.parse_args()
+
+
+def check_precision(args, scorer_options):
+    video_paths = [video_path for _, video_path in synthetic_videos()]
+    comparison = compare_precision(video_paths, **scorer_options)
+    print(f"\n{comparison['precision']} compared to fp32:")
+    for video_path, video in comparison["videos"].items():
+        print(
+            f"{os.path.basename(video_path):<38}{video['fp32']:>10.4f}"
+            f"{video['reduced']:>12.4f}{video['drift']:>10.4f}"
+        )
+    speedup = comparison["speedup"]
+    speedup = f"{speedup:.2f}x" if speedup is not None else None
+    print(
+        f"max drift {comparison['max_drift']}, mean drift {comparison['mean_drift']}, "
+        f"rank correlation {comparison['rank_correlation']}, speedup {speedup}"
+    )
+    return comparison["max_drift"] is not None and (
+        comparison["max_drift"] <= args.max_drift
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    scorer_options = {
+        "backbone_precision": args.backbone_precision,
+        "quantize_head": args.quantize_head,
+        "channels_last": args.channels_last,
+    }
+    if args.check_precision:
+        sys.exit(0 if check_precision(args, scorer_options) else 1)
+
+    results = run_benchmarks(
+        repeats=args.repeats,
+        simple_vqa=not args.no_vqa,
+        scorer_options={**scorer_options, "motion_batch_size": args.motion_batch_size},
+    )
+
+    out_dir = os.path.dirname(args.output)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    with open(args.output, "w") as json_file:
+        json.dump(results, json_file, indent=4)
+
+    print(f"{'stage':<38}{'seconds':>10}{'frames/s':>12}{'share':>8}")
+    for stage, result in results["totals"]["stages"].items():
+        print(
+            f"{stage:<38}{result['seconds']:>10.2f}"
+            f"{result['frames_per_second']:>12.1f}{result['share']:>8.1%}"
+        )
+    print(f"peak RSS: {results['totals']['peak_rss_mb']:.0f} MiB")
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as json_file:
+            baseline = json.load(json_file)
+        regressions = 0
+        print(f"\n{'compared to ' + args.baseline:<38}{'before':>10}{'after':>12}")
+        for name, before, after, change, regressed in compare_results(
+            baseline, results, args.tolerance
+        ):
+            regressions += regressed
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name:<38}{before:>10.2f}{after:>12.2f}{change:>+8.1%}{flag}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,2 @@
+# Keeps the repository root on sys.path, so tests import `src` and `constants` with a
+# plain `pytest` as well as with `python -m pytest`.
@@ -0,0 +1,16 @@
+BENCHMARK_DIR = "output/benchmark"
+BENCHMARK_RESULTS_PATH = "output/benchmark/results.json"
+# synthetic videos: resolution, frame rate, duration and the Gaussian blur sigma and
+# noise standard deviation applied to every frame (SimpleVQA needs at least 8 seconds)
+BENCHMARK_VIDEOS = [
+    {"width": 360, "height": 640, "fps": 30, "seconds": 10, "blur": 0, "noise": 0},
+    {"width": 540, "height": 960, "fps": 30, "seconds": 10, "blur": 2, "noise": 0},
+    {"width": 720, "height": 1280, "fps": 30, "seconds": 10, "blur": 0, "noise": 8},
+    {"width": 540, "height": 960, "fps": 60, "seconds": 10, "blur": 1, "noise": 4},
+]
+# runs per stage; the fastest one is reported
+BENCHMARK_REPEATS = 1
+# slowdown against the baseline reported as a regression, e.g. 0.1 for 10%
+BENCHMARK_TOLERANCE = 0.1
+# largest SimpleVQA score change against float32 accepted by --check-precision
+BENCHMARK_MAX_SCORE_DRIFT = 0.01
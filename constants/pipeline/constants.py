@@ -0,0 +1,12 @@
+RUN_PIPELINED = True
+# scraped links waiting for a download slot
+LINK_QUEUE_SIZE = 32
+# downloaded videos waiting to be scored; caps how far downloads run ahead of scoring
+VIDEO_QUEUE_SIZE = 8
+# bytes of videos the pipeline may keep in DOWNLOADED_VIDS_DIR before the downloader
+# stops taking new links (None for no cap); downloads in flight may still overshoot it
+VIDEOS_MAX_BYTES = 10 * 1024**3
+# delete every video once it is scored, so the cap only holds videos waiting to be
+# scored and downloading goes on; otherwise downloading ends once the cap is reached.
+# Deleted videos are downloaded again by re-runs, which reuse their cached results
+DELETE_SCORED_VIDEOS = False
@@ -1,2 +1,21 @@
 DOWNLOADED_VIDS_DIR = "/Users/mac/Documents/personal_projs/tiktok-vids-processing/tiktok-api-testing/videos"
 TIKTOK_URL = "https://www.tiktok.com/tag/dance"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
+SSSTIK_URL = "https://ssstik.io"
+DOWNLOAD_CONCURRENCY = 4
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 2.0
+DOWNLOAD_TIMEOUT = 120
+# minimum seconds between two requests to the same host, instead of fixed sleeps
+DOWNLOAD_MIN_INTERVAL = 0.5
+DOWNLOAD_HOST_INTERVALS = {"ssstik.io": 5.0}
+BROWSER_POOL_SIZE = 1
+BROWSER_MAX_USES = 20
+DOWNLOAD_WAIT_TIMEOUT = 60
+# seconds to wait for a scroll step to load new videos, and failed steps before stopping
+SCROLL_STEP_TIMEOUT = 5
+SCROLL_MAX_STALLS = 3
+# stop scraping after this many links or seconds of scrolling (None for no limit)
+SCRAPE_MAX_LINKS = None
+SCRAPE_TIME_BUDGET = None
+VIDEO_INDEX_PATH = "output/video_index.sqlite3"
@@ -1,2 +1,60 @@
 MODEL_PATH = "src/video_quality_eval/deep_learning/simpleVQA/ckpts/UGC_BVQA_model.pth"
 OUT_PATH = "output/quality_scores.json"
+# stream one JSON record per scored video instead of writing OUT_PATH at the end
+STREAM_RESULTS = True
+OUT_JSONL_PATH = "output/quality_scores.jsonl"
+JSONL_FSYNC_EVERY = 32
+JSONL_FSYNC_INTERVAL = 5.0
+# OpenMetrics file rewritten after every video (None disables) and optional port
+# serving the same metrics on http://127.0.0.1:<port>/metrics
+METRICS_PATH = "output/metrics.prom"
+METRICS_PORT = None
+# optional NumPy structured-array export of the streamed results, e.g. "output/quality_scores.npy"
+OUT_COLUMNS_PATH = None
+# clips per SlowFast forward, shared by consecutive videos when evaluating in one
+# process. On one CPU core 2 clips per batch were 4-25% faster per clip than 1, while
+# 4 and 8 were slower; GPUs take larger batches
+MOTION_BATCH_SIZE = 2
+# SimpleVQA inference precision: "fp32" or "bf16" autocast for the ResNet and SlowFast
+# backbones, dynamic int8 quantization of the regression head (CPU only), and
+# channels-last memory format for the convolutions. Check the score drift against
+# fp32 with `python benchmark.py --check-precision` before switching.
+BACKBONE_PRECISION = "fp32"
+QUANTIZE_REGRESSION_HEAD = False
+CHANNELS_LAST = False
+# SimpleVQA runtime: "eager" PyTorch, or the graphs written by export_models.py to
+# EXPORT_DIR run as frozen "torchscript" or with "onnxruntime" (CPU, optional package)
+VQA_BACKEND = "eager"
+EXPORT_DIR = "src/video_quality_eval/deep_learning/simpleVQA/exported"
+NUM_WORKERS = 1
+THREADS_PER_WORKER = None
+RESULTS_DB_PATH = "output/quality_scores.sqlite3"
+METRICS_VERSION = "2"
+FRAME_BATCH_SIZE = 16
+ANALYSIS_SHORT_SIDE = None
+USE_FRAME_CACHE = False
+FRAME_CACHE_DIR = "output/frame_cache"
+FRAME_CACHE_MAX_BYTES = 20 * 1024**3
+FRAME_CACHE_SHORT_SIDE = None
+USE_FEATURE_CACHE = False
+FEATURE_CACHE_DIR = "output/feature_cache"
+# Clear/Blur thresholds of the traditional metrics per analysis short side (None is
+# full resolution). Downscaling sharpens edges per pixel and smooths noise, so the
+# downscaled rows are only starting points measured on synthetic footage; refit
+# them on reference videos with calibrate_thresholds.
+QUALITY_THRESHOLDS = {
+    None: {"laplacian": 100, "structural_similarity": 0.75, "psnr": 30},
+    720: {"laplacian": 110, "structural_similarity": 0.80, "psnr": 30.4},
+    540: {"laplacian": 200, "structural_similarity": 0.81, "psnr": 30.5},
+    360: {"laplacian": 450, "structural_similarity": 0.83, "psnr": 31},
+}
+# near-duplicate detection, which copies the scores of a representative to its
+# copies: hashed frames per video, maximum mean differing bits of the 64-bit frame
+# hashes, maximum difference in duration in seconds, and maximum relative difference
+# in bitrate and in the mean variance of the Laplacian. Resolutions must be equal.
+DEDUPLICATE = False
+DEDUP_FRAMES = 8
+DEDUP_MAX_DISTANCE = 10
+DEDUP_DURATION_TOLERANCE = 0.5
+DEDUP_BITRATE_TOLERANCE = 0.05
+DEDUP_SHARPNESS_TOLERANCE = 0.05
@@ -0,0 +1,47 @@
+from src.video_quality_eval.deep_learning.simpleVQA.export import (
+    backends_for,
+    export_models,
+    verify_export,
+)
+from constants.video_quality_eval.constants import MODEL_PATH, EXPORT_DIR
+import argparse
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Exports the SimpleVQA networks to TorchScript and/or ONNX."
+    )
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--export-dir", default=EXPORT_DIR)
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=["torchscript", "onnx"],
+        default=["torchscript", "onnx"],
+    )
+    parser.add_argument(
+        "--no-verify",
+        action="store_true",
+        help="skip comparing the exported graphs with the eager networks",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    export_models(args.export_dir, args.model_path, tuple(args.format))
+    if args.no_verify:
+        sys.exit(0)
+
+    matches = True
+    for backend in backends_for(args.format):
+        try:
+            result = verify_export(backend, args.export_dir, args.model_path)
+        except ImportError as e:
+            print(f"Cannot verify {backend}: {e}")
+            continue
+        matches &= result["matches"]
+        status = "matches" if result["matches"] else "DOES NOT MATCH"
+        print(f"{backend} {status} eager PyTorch: {result['max_abs_difference']}")
+    sys.exit(0 if matches else 1)
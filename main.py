@@ -1,8 +1,16 @@
 from src.scraper.tiktok_scraping import download_tiktok_videos
 from src.video_quality_eval import evaluate_videos_quality
+from src.pipeline.runner import run_pipelined
 from constants.scraper.constants import TIKTOK_URL
+from constants.pipeline.constants import RUN_PIPELINED
+import logging
 
 
 if __name__ == "__main__":
-    download_tiktok_videos(TIKTOK_URL)
-    evaluate_videos_quality()
+    # the evaluation logs its per-stage profile as one JSON object per line
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if RUN_PIPELINED:
+        run_pipelined(TIKTOK_URL)
+    else:
+        download_tiktok_videos(TIKTOK_URL)
+        evaluate_videos_quality()
@@ -0,0 +1,299 @@
+from constants.benchmark.constants import (
+    BENCHMARK_DIR,
+    BENCHMARK_VIDEOS,
+    BENCHMARK_REPEATS,
+    BENCHMARK_TOLERANCE,
+)
+from src.video_quality_eval.deep_learning.simpleVQA.infer import (
+    SimpleVQAScorer,
+    get_scorer,
+    video_processing_motion,
+    video_processing_spatial,
+)
+from src.video_quality_eval.frame_pipeline import FrameConsumer, run_consumers
+from src.video_quality_eval.instrumentation import peak_rss_mb
+from src.video_quality_eval.traditional.video_quality_eval import (
+    laplacian_video_quality,
+    structural_similarity_video_quality,
+    psnr_video_quality,
+)
+import os
+import platform
+import subprocess
+import time
+import cv2
+import numpy as np
+import torch
+
+
+class DecodeOnlyConsumer(FrameConsumer):
+    """
+    Ignores every frame, so a pipeline running it only measures decoding.
+    """
+
+    def consume(self, frame_idx, frame):
+        pass
+
+
+def synthetic_video_name(spec):
+    return (
+        f"{spec['width']}x{spec['height']}_{spec['fps']}fps_{spec['seconds']}s"
+        f"_blur{spec['blur']}_noise{spec['noise']}.mp4"
+    )
+
+
+def make_synthetic_video(video_path, width, height, fps, seconds, blur=0, noise=0):
+    """
+    Writes a deterministic test video with `cv2.VideoWriter`: a smooth random texture
+    with sharp shapes that pans across the frame, so the consecutive-frame metrics and
+    the motion branch see real motion, then Gaussian blur and noise on every frame.
+
+    Args:
+        video_path (str): Path of the .mp4 file to write.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        fps (int): Frame rate.
+        seconds (int): Duration in seconds.
+        blur (float): Sigma of the Gaussian blur, 0 for none.
+        noise (float): Standard deviation of the additive Gaussian noise, 0 for none.
+    """
+    rng = np.random.default_rng(0)
+    texture = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), np.uint8)
+    texture = cv2.resize(texture, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(12):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        size = int(rng.integers(10, max(11, min(width, height) // 4)))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(texture, (x, y), (x + size, y + size), color, -1)
+
+    writer = cv2.VideoWriter(
+        video_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+    )
+    try:
+        for frame_idx in range(fps * seconds):
+            frame = np.roll(texture, (frame_idx, 2 * frame_idx), axis=(0, 1))
+            if blur:
+                frame = cv2.GaussianBlur(frame, (0, 0), blur)
+            if noise:
+                frame = frame + rng.normal(0, noise, frame.shape)
+                frame = np.clip(frame, 0, 255).astype(np.uint8)
+            writer.write(frame)
+    finally:
+        writer.release()
+
+
+def synthetic_videos(video_specs=BENCHMARK_VIDEOS, video_dir=BENCHMARK_DIR):
+    """
+    Returns the paths of the synthetic benchmark videos, writing the missing ones.
+
+    Args:
+        video_specs (list): Keyword arguments of `make_synthetic_video` per video.
+        video_dir (str): Directory the videos are kept in between runs.
+
+    Returns:
+        list: (spec, video_path) pairs.
+    """
+    os.makedirs(video_dir, exist_ok=True)
+    videos = []
+    for spec in video_specs:
+        video_path = os.path.join(video_dir, synthetic_video_name(spec))
+        if not os.path.exists(video_path):
+            print(f"Writing {video_path}...")
+            make_synthetic_video(video_path, **spec)
+        videos.append((spec, video_path))
+    return videos
+
+
+def video_frame_count(video_path):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        cap.release()
+
+
+def benchmark_video(video_path, scorer=None, repeats=BENCHMARK_REPEATS):
+    """
+    Times every evaluation stage on one video, each run on its own.
+
+    The metric and preprocessing stages decode the video themselves, as they do in
+    production, so subtract `decode` for their compute time. The network stages time
+    the spatial ResNet backbone and the SlowFast forwards on the preprocessed inputs.
+
+    Args:
+        video_path (str): Path to the video file.
+        scorer (SimpleVQAScorer): Scorer whose networks are timed. None skips them.
+        repeats (int): Runs per stage; the fastest is reported.
+
+    Returns:
+        dict: Frame count and, per stage, its seconds, video frames per second, share
+            of the video's total time and the peak RSS after it.
+    """
+    frame_count = video_frame_count(video_path)
+    stages = {}
+
+    def timed(stage, run):
+        best = None
+        for _ in range(max(1, repeats)):
+            started = time.perf_counter()
+            result = run()
+            seconds = time.perf_counter() - started
+            best = seconds if best is None else min(best, seconds)
+        stages[stage] = {
+            "seconds": best,
+            "frames_per_second": frame_count / best if best else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        return result
+
+    timed("decode", lambda: run_consumers(video_path, DecodeOnlyConsumer()))
+    timed("laplacian_video_quality", lambda: laplacian_video_quality(video_path))
+    timed(
+        "structural_similarity_video_quality",
+        lambda: structural_similarity_video_quality(video_path),
+    )
+    timed("psnr_video_quality", lambda: psnr_video_quality(video_path))
+    spatial_frames, _ = timed(
+        "video_processing_spatial", lambda: video_processing_spatial(video_path)
+    )
+    clips, _ = timed(
+        "video_processing_motion", lambda: video_processing_motion(video_path)
+    )
+
+    if scorer is not None:
+        batch_size = scorer.batcher.batch_size
+        timed("spatial_forward", lambda: scorer.spatial_features(spatial_frames))
+        timed(
+            "motion_forward",
+            lambda: [
+                scorer.motion_features(clips[start : start + batch_size])
+                for start in range(0, len(clips), batch_size)
+            ],
+        )
+
+    total = sum(stage["seconds"] for stage in stages.values())
+    for stage in stages.values():
+        stage["share"] = stage["seconds"] / total if total else None
+    return {"frame_count": frame_count, "stages": stages}
+
+
+def environment():
+    """
+    Describes the machine and code a benchmark ran on.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "cuda": torch.cuda.is_available(),
+    }
+
+
+def run_benchmarks(
+    video_specs=BENCHMARK_VIDEOS,
+    video_dir=BENCHMARK_DIR,
+    repeats=BENCHMARK_REPEATS,
+    simple_vqa=True,
+    scorer_options=None,
+):
+    """
+    Benchmarks every stage of the evaluation on the synthetic videos.
+
+    Args:
+        video_specs (list): Keyword arguments of `make_synthetic_video` per video.
+        video_dir (str): Directory the synthetic videos are kept in.
+        repeats (int): Runs per stage; the fastest is reported.
+        simple_vqa (bool): Whether to time the two SimpleVQA network forwards, which
+            need the checkpoint.
+        scorer_options (dict): Keyword arguments of `SimpleVQAScorer`, e.g. its
+            precision. Defaults to the process-wide scorer.
+
+    Returns:
+        dict: The environment, the results per video, and per stage totals over all
+            videos with their frames per second and share of the total time.
+    """
+    scorer = None
+    if simple_vqa:
+        try:
+            if scorer_options:
+                scorer = SimpleVQAScorer(**scorer_options)
+            else:
+                scorer = get_scorer()
+        except Exception as e:
+            print(f"Error loading model state dict, skipping the network stages: {e}")
+
+    videos = {}
+    for spec, video_path in synthetic_videos(video_specs, video_dir):
+        print(f"Benchmarking {os.path.basename(video_path)}...")
+        videos[os.path.basename(video_path)] = {
+            "spec": spec,
+            **benchmark_video(video_path, scorer, repeats),
+        }
+
+    frame_count = sum(video["frame_count"] for video in videos.values())
+    totals = {}
+    for video in videos.values():
+        for stage, result in video["stages"].items():
+            totals[stage] = totals.get(stage, 0) + result["seconds"]
+    total = sum(totals.values())
+    return {
+        "environment": environment(),
+        "repeats": repeats,
+        "precision": (scorer.precision or "fp32") if scorer is not None else None,
+        "videos": videos,
+        "totals": {
+            "frame_count": frame_count,
+            "seconds": total,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": {
+                stage: {
+                    "seconds": seconds,
+                    "frames_per_second": frame_count / seconds if seconds else None,
+                    "share": seconds / total if total else None,
+                }
+                for stage, seconds in totals.items()
+            },
+        },
+    }
+
+
+def compare_results(baseline, results, tolerance=BENCHMARK_TOLERANCE):
+    """
+    Compares the stage totals and peak RSS of two benchmark runs.
+
+    Args:
+        baseline (dict): Results of the reference run, as returned by `run_benchmarks`.
+        results (dict): Results of the run to check.
+        tolerance (float): Relative increase reported as a regression.
+
+    Returns:
+        list: (name, baseline value, new value, relative change, is regression) rows for
+            every stage present in both runs, then for peak RSS.
+    """
+    rows = []
+    baseline_stages = baseline["totals"]["stages"]
+    for stage, result in results["totals"]["stages"].items():
+        if stage not in baseline_stages:
+            continue
+        before, after = baseline_stages[stage]["seconds"], result["seconds"]
+        change = after / before - 1 if before else 0.0
+        rows.append((stage, before, after, change, change > tolerance))
+
+    before, after = baseline["totals"]["peak_rss_mb"], results["totals"]["peak_rss_mb"]
+    change = after / before - 1 if before else 0.0
+    rows.append(("peak_rss_mb", before, after, change, change > tolerance))
+    return rows
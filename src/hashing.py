@@ -0,0 +1,19 @@
+import hashlib
+
+
+def file_content_hash(file_path, chunk_size=1 << 20):
+    """
+    Computes the SHA-256 of a file's content, reading it in chunks.
+
+    Args:
+        file_path (str): Path to the file.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hex digest of the content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,209 @@
+from constants.pipeline.constants import (
+    LINK_QUEUE_SIZE,
+    VIDEO_QUEUE_SIZE,
+    VIDEOS_MAX_BYTES,
+    DELETE_SCORED_VIDEOS,
+)
+from src.scraper.async_downloader import AsyncDownloader
+from src.scraper.tiktok_scraping import scrape_tiktok_video_links
+from src.scraper.video_index import VideoIndex
+from src.video_quality_eval import evaluate_videos_quality
+import asyncio
+import os
+import queue
+import threading
+
+
+def put_until_stopped(output, item, stopped):
+    """
+    Puts an item on a bounded queue, giving up once `stopped` is set, so a stage never
+    blocks forever on a queue nobody reads anymore.
+
+    Returns:
+        bool: Whether the item was queued.
+    """
+    while not stopped.is_set():
+        try:
+            output.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def run_stage(name, target, output, stopped):
+    """
+    Runs a pipeline stage in a daemon thread and closes its output queue with a None
+    sentinel when it ends, whether it finished or failed.
+
+    Args:
+        name (str): Name of the stage, for error messages.
+        target (callable): The stage, filling `output`.
+        output (queue.Queue): The queue read by the next stage.
+        stopped (threading.Event): Set when the pipeline stops early, after which the
+            sentinel is dropped since the next stage no longer reads it.
+
+    Returns:
+        threading.Thread: The started thread.
+    """
+
+    def run():
+        try:
+            target()
+        except Exception as e:
+            print(f"{name} stage failed: {e}")
+        finally:
+            put_until_stopped(output, None, stopped)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+class DiskBudget:
+    """
+    Caps the bytes of videos the pipeline keeps in the videos directory.
+
+    Every downloaded video is counted from the moment it is handed to scoring until it
+    is deleted after scoring. Before every new link, the downloader waits for room:
+    with `delete_scored`, the videos waiting to be scored free it once they are scored,
+    otherwise the budget is spent for good and downloading ends. Downloads in flight
+    are only counted once they finish, so the directory may exceed `max_bytes` by up
+    to the downloader's `max_concurrency` videos.
+
+    Args:
+        max_bytes (int): Maximum bytes of videos kept. It should hold a few videos,
+            since a scored video may wait for the next one to fill its SlowFast batch.
+        delete_scored (bool): Whether videos are deleted once they are scored.
+        stopped (threading.Event): Set when the pipeline stops early, which ends the
+            wait for room.
+    """
+
+    def __init__(self, max_bytes, delete_scored, stopped):
+        self.max_bytes = max_bytes
+        self.delete_scored = delete_scored
+        self.stopped = stopped
+        self.sizes = {}
+        self.changed = threading.Condition()
+
+    def used_bytes(self):
+        with self.changed:
+            return sum(self.sizes.values())
+
+    def wait_for_room(self):
+        """
+        Waits until the kept videos are below the budget.
+
+        Returns:
+            bool: Whether there is room, False if the budget is spent or the pipeline stopped.
+        """
+        with self.changed:
+            while self.used_bytes() >= self.max_bytes:
+                if self.stopped.is_set():
+                    return False
+                if not self.delete_scored:
+                    print(
+                        f"Disk budget of {self.max_bytes / 1024**2:.0f} MB reached, "
+                        "no more videos are downloaded"
+                    )
+                    return False
+                self.changed.wait(timeout=0.1)
+            return True
+
+    def downloaded(self, path):
+        with self.changed:
+            self.sizes[os.path.basename(path)] = os.path.getsize(path)
+
+    def scored(self, path):
+        if not self.delete_scored:
+            return
+        with self.changed:
+            if os.path.exists(path):
+                os.remove(path)
+            self.sizes.pop(os.path.basename(path), None)
+            self.changed.notify_all()
+
+
+def run_pipelined(
+    url,
+    link_queue_size=LINK_QUEUE_SIZE,
+    video_queue_size=VIDEO_QUEUE_SIZE,
+    max_bytes=VIDEOS_MAX_BYTES,
+    delete_scored=DELETE_SCORED_VIDEOS,
+    downloader=None,
+    **evaluate_options,
+):
+    """
+    Scrapes, downloads and evaluates TikTok videos as one pipeline, so every video is
+    scored as soon as its file lands instead of after the last download.
+
+    Scraped links and downloaded videos flow through bounded queues: the scraper
+    waits while `link_queue_size` links are queued, and the downloader stops taking
+    new links while `video_queue_size` downloaded videos wait to be scored, which caps
+    how far downloading runs ahead of scoring. Disk usage is capped by a `DiskBudget`
+    of `max_bytes`: with `delete_scored`, every video is deleted once its record is
+    written and downloading waits for room, otherwise downloading ends once the
+    videos of the run fill the budget.
+
+    If the evaluation fails, the other stages are stopped and the downloader is waited
+    for before the video index is closed.
+
+    Args:
+        url (str): The URL of the TikTok page containing the videos.
+        link_queue_size (int): Maximum number of scraped links waiting for a download.
+        video_queue_size (int): Maximum number of downloaded videos waiting to be scored.
+        max_bytes (int): Maximum bytes of videos the run keeps on disk. None for no cap.
+        delete_scored (bool): Whether to delete every video once it is scored.
+        downloader (AsyncDownloader): The downloader to use, saving to the videos directory.
+            Defaults to a new one recording downloads in the video index.
+        **evaluate_options: Keyword arguments for `evaluate_videos_quality`.
+    """
+    links = queue.Queue(maxsize=link_queue_size)
+    videos = queue.Queue(maxsize=video_queue_size)
+    stopped = threading.Event()
+    video_index = VideoIndex()
+    if downloader is None:
+        downloader = AsyncDownloader(video_index=video_index)
+    budget = None
+    if max_bytes is not None:
+        budget = DiskBudget(max_bytes, delete_scored, stopped)
+
+    def scrape():
+        for video_link in scrape_tiktok_video_links(url):
+            if not put_until_stopped(links, video_link, stopped):
+                return
+
+    def on_downloaded(path):
+        if budget is not None:
+            budget.downloaded(path)
+        put_until_stopped(videos, os.path.basename(path), stopped)
+
+    def on_recorded(video):
+        if budget is not None:
+            budget.scored(os.path.join(downloader.download_dir, video))
+
+    def download():
+        asyncio.run(
+            downloader.download_queue(
+                links,
+                on_downloaded,
+                stop=stopped,
+                wait_for_room=budget.wait_for_room if budget is not None else None,
+            )
+        )
+
+    run_stage("Scrape", scrape, links, stopped)
+    download_stage = run_stage("Download", download, videos, stopped)
+    try:
+        evaluate_videos_quality(
+            videos=iter(videos.get, None),
+            video_index=video_index,
+            on_recorded=on_recorded,
+            **evaluate_options,
+        )
+    finally:
+        # also releases the scraper once downloading ended on a spent disk budget
+        stopped.set()
+        # the downloader records every download in the index
+        download_stage.join()
+        video_index.close()
@@ -0,0 +1,328 @@
+from constants.scraper.constants import (
+    DOWNLOADED_VIDS_DIR,
+    USER_AGENT,
+    SSSTIK_URL,
+    DOWNLOAD_CONCURRENCY,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_BACKOFF,
+    DOWNLOAD_TIMEOUT,
+    DOWNLOAD_MIN_INTERVAL,
+    DOWNLOAD_HOST_INTERVALS,
+)
+from urllib.parse import urljoin, urlsplit
+from bs4 import BeautifulSoup
+from src.scraper.video_index import parse_video_id
+import aiohttp
+import asyncio
+import hashlib
+import os
+import queue
+import random
+import re
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    """
+    Raised when a video cannot be downloaded and retrying will not help.
+    """
+
+
+def video_file_name(video_link):
+    """
+    Names the downloaded file after the TikTok video ID, so re-runs find it again.
+
+    Args:
+    video_link (str): The TikTok video URL.
+
+    Returns:
+    str: The file name of the video.
+    """
+    video_id = parse_video_id(video_link)
+    if video_id is not None:
+        return f"{video_id}.mp4"
+    return f"{hashlib.sha1(video_link.encode()).hexdigest()[:16]}.mp4"
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests to the same host, replacing fixed sleeps between videos.
+
+    Every request reserves the next free slot of its host, so concurrent downloads
+    queue up behind each other on a slow host while other hosts are not held up.
+
+    Args:
+    host_intervals (dict): Minimum seconds between requests, per host name.
+    default_interval (float): Interval for hosts not in `host_intervals`.
+    jitter (float): Intervals are stretched by a random factor of up to 1 + jitter.
+    """
+
+    def __init__(
+        self,
+        host_intervals=DOWNLOAD_HOST_INTERVALS,
+        default_interval=DOWNLOAD_MIN_INTERVAL,
+        jitter=0.5,
+    ):
+        self.host_intervals = host_intervals
+        self.default_interval = default_interval
+        self.jitter = jitter
+        self.next_slot = {}
+
+    async def wait(self, url):
+        host = urlsplit(url).hostname or ""
+        interval = self.host_intervals.get(host, self.default_interval)
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self.next_slot.get(host, now))
+        self.next_slot[host] = slot + interval * random.uniform(1, 1 + self.jitter)
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncDownloader:
+    """
+    Downloads TikTok videos concurrently through ssstik.io over plain HTTP.
+
+    For every link, the ssstik form is submitted to resolve the watermark-free media
+    URL, which is then streamed to disk. At most `max_concurrency` videos are in
+    flight, requests are spaced per host by a `HostRateLimiter`, and failed steps are
+    retried with exponential backoff.
+
+    Args:
+    download_dir (str): Directory the videos are saved to.
+    base_url (str): Base URL of the ssstik service, e.g. a local stand-in for tests.
+    max_concurrency (int): Maximum number of videos downloaded at once.
+    retries (int): Number of retries of a failed step.
+    backoff (float): Base of the exponential backoff between retries, in seconds.
+    timeout (float): Total timeout of a single request, in seconds.
+    rate_limiter (HostRateLimiter): Spacing of requests per host.
+    video_index (VideoIndex): Index of downloaded videos. Indexed videos are not downloaded again, and new downloads are added to it.
+    """
+
+    def __init__(
+        self,
+        download_dir=DOWNLOADED_VIDS_DIR,
+        base_url=SSSTIK_URL,
+        max_concurrency=DOWNLOAD_CONCURRENCY,
+        retries=DOWNLOAD_RETRIES,
+        backoff=DOWNLOAD_BACKOFF,
+        timeout=DOWNLOAD_TIMEOUT,
+        rate_limiter=None,
+        video_index=None,
+    ):
+        self.download_dir = download_dir
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max(1, max_concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.rate_limiter = (
+            rate_limiter if rate_limiter is not None else HostRateLimiter()
+        )
+        self.video_index = video_index
+        self.token = None
+
+    def session(self):
+        return aiohttp.ClientSession(
+            headers={"User-Agent": USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+
+    async def download_all(self, video_links):
+        """
+        Downloads every video, skipping the ones already on disk.
+
+        Args:
+        video_links (list): TikTok video URLs.
+
+        Returns:
+        dict: Path of every downloaded video by link, None for failed downloads.
+        """
+        os.makedirs(self.download_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.session() as session:
+
+            async def bounded_download(video_link):
+                async with semaphore:
+                    return await self.download(session, video_link)
+
+            paths = await asyncio.gather(
+                *(bounded_download(video_link) for video_link in video_links)
+            )
+        return dict(zip(video_links, paths))
+
+    async def download_queue(self, links, on_downloaded, stop=None, wait_for_room=None):
+        """
+        Downloads links as they arrive on a queue, until a None sentinel is read or
+        `stop` is set.
+
+        Blocking queue operations run in the default executor, so waiting for links
+        or for `on_downloaded` (e.g. a put on a full queue) never stalls the transfers
+        already in flight; new links are only taken while fewer than
+        `max_concurrency` downloads are running. Once `stop` is set, no new link is
+        taken and the downloads in flight are cancelled. `wait_for_room` is called
+        before every new link is taken, e.g. to wait for disk space.
+
+        Args:
+        links (queue.Queue): TikTok video URLs, terminated by None.
+        on_downloaded (callable): Called with the path of every downloaded video.
+        stop (threading.Event): Optional event telling the downloader to stop early.
+        wait_for_room (callable): Optional blocking check before every new link. Returning False ends the downloads like the sentinel.
+        """
+        os.makedirs(self.download_dir, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = set()
+
+        def next_link():
+            if wait_for_room is not None and not wait_for_room():
+                return None
+            if stop is None:
+                return links.get()
+            while not stop.is_set():
+                try:
+                    return links.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return None
+
+        async with self.session() as session:
+
+            async def download_and_report(video_link):
+                try:
+                    path = await self.download(session, video_link)
+                    if path is not None:
+                        await loop.run_in_executor(None, on_downloaded, path)
+                finally:
+                    semaphore.release()
+
+            while True:
+                await semaphore.acquire()
+                video_link = await loop.run_in_executor(None, next_link)
+                if video_link is None:
+                    semaphore.release()
+                    break
+                task = asyncio.ensure_future(download_and_report(video_link))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if stop is not None and stop.is_set():
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            else:
+                await asyncio.gather(*tasks)
+
+    async def download(self, session, video_link):
+        """
+        Downloads a single video, unless it is indexed or already on disk. Files already on disk are added to the index if they are missing from it.
+
+        Args:
+        session (aiohttp.ClientSession): The HTTP session.
+        video_link (str): The TikTok video URL.
+
+        Returns:
+        str: Path of the downloaded video, or None if it failed.
+        """
+        video_id = parse_video_id(video_link)
+        if self.video_index is not None:
+            indexed_path = self.video_index.downloaded_path(video_id)
+            if indexed_path is not None:
+                return indexed_path
+        path = os.path.join(self.download_dir, video_file_name(video_link))
+        try:
+            if not os.path.exists(path):
+                print(f"Downloading video from {video_link}")
+                media_url = await self.with_retries(self.resolve, session, video_link)
+                await self.with_retries(self.stream_to_file, session, media_url, path)
+                print(f"Video downloaded successfully: {path}")
+            if self.video_index is not None and video_id is not None:
+                # hashing the file would block the event loop
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.video_index.add, video_id, video_link, path
+                )
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return None
+        return path
+
+    async def with_retries(self, step, *args):
+        """
+        Runs `step(*args)`, retrying network errors and retryable HTTP statuses.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return await step(*args)
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRYABLE_STATUSES or attempt == self.retries:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2**attempt * random.uniform(0.5, 1))
+
+    async def resolve(self, session, video_link):
+        """
+        Submits a TikTok link to ssstik and returns the watermark-free media URL.
+
+        The form token of the ssstik page is fetched once and reused until a
+        submission fails.
+        """
+        if self.token is None:
+            page_url = f"{self.base_url}/en"
+            await self.rate_limiter.wait(page_url)
+            async with session.get(page_url) as response:
+                response.raise_for_status()
+                page = await response.text()
+            token = re.search(r"s_tt\s*=\s*['\"]([^'\"]*)['\"]", page)
+            self.token = token.group(1) if token else ""
+
+        form_url = f"{self.base_url}/abc?url=dl"
+        await self.rate_limiter.wait(form_url)
+        try:
+            async with session.post(
+                form_url,
+                data={"id": video_link, "locale": "en", "tt": self.token},
+            ) as response:
+                response.raise_for_status()
+                result = await response.text()
+
+            link = BeautifulSoup(result, "html.parser").select_one(
+                "a.without_watermark"
+            )
+            if link is None or not link.get("href"):
+                raise DownloadError(f"No download link found for {video_link}")
+        except Exception:
+            self.token = None
+            raise
+        return urljoin(f"{self.base_url}/", link["href"])
+
+    async def stream_to_file(self, session, media_url, path, chunk_size=1 << 16):
+        """
+        Streams a media URL to `path`, through a temporary file so that partial
+        downloads are never mistaken for videos.
+        """
+        tmp_path = f"{path}.part"
+        await self.rate_limiter.wait(media_url)
+        try:
+            async with session.get(media_url) as response:
+                response.raise_for_status()
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        f.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def download_videos(video_links, **kwargs):
+    """
+    Downloads TikTok videos concurrently. Takes the same keyword arguments as `AsyncDownloader`.
+
+    Args:
+    video_links (list): TikTok video URLs.
+
+    Returns:
+    dict: Path of every downloaded video by link, None for failed downloads.
+    """
+    return asyncio.run(AsyncDownloader(**kwargs).download_all(video_links))
@@ -0,0 +1,148 @@
+from constants.scraper.constants import BROWSER_POOL_SIZE, BROWSER_MAX_USES
+from contextlib import contextmanager
+import threading
+
+
+class BrowserPool:
+    """
+    Keeps warm WebDriver sessions alive and hands them out one caller at a time, so
+    Chrome start-up is paid once per session instead of once per video.
+
+    Sessions are started lazily, up to `size` of them. Between uses a session is reset
+    (extra windows closed, cookies and storage cleared, blank page loaded); it is
+    replaced by a fresh one after `max_uses` uses, or as soon as it stops responding.
+
+    Args:
+    driver_factory (callable): Starts a new WebDriver session.
+    size (int): Maximum number of sessions alive at once.
+    max_uses (int): Number of uses after which a session is recycled.
+    """
+
+    def __init__(
+        self, driver_factory, size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES
+    ):
+        self.driver_factory = driver_factory
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self.idle = []
+        self.uses = {}
+        self.alive = 0
+        self.available = threading.Condition()
+        self.closed = False
+
+    def acquire(self):
+        """
+        Returns an idle session, starting a new one if the pool is not full yet, or
+        waiting for one to be released otherwise.
+        """
+        with self.available:
+            while True:
+                if self.closed:
+                    raise RuntimeError("Browser pool is closed")
+                if self.idle:
+                    return self.idle.pop()
+                if self.alive < self.size:
+                    # reserve the slot, the slow start-up happens outside the lock
+                    self.alive += 1
+                    break
+                self.available.wait()
+
+        try:
+            browser = self.driver_factory()
+        except BaseException:
+            with self.available:
+                self.alive -= 1
+                self.available.notify()
+            raise
+        with self.available:
+            self.uses[browser] = 0
+        return browser
+
+    def release(self, browser, healthy=True):
+        """
+        Returns a session to the pool, recycling it if it is worn out or broken.
+        """
+        with self.available:
+            self.uses[browser] += 1
+            recycle = self.closed or not healthy or self.uses[browser] >= self.max_uses
+        if not recycle:
+            try:
+                self.reset(browser)
+            except Exception:
+                recycle = True
+        if recycle:
+            self.discard(browser)
+            return
+        with self.available:
+            self.idle.append(browser)
+            self.available.notify()
+
+    def discard(self, browser):
+        with self.available:
+            self.uses.pop(browser, None)
+            self.alive -= 1
+            self.available.notify()
+        try:
+            browser.quit()
+        except Exception:
+            pass
+
+    @staticmethod
+    def reset(browser):
+        """
+        Clears what one use could leak into the next: extra windows, cookies and storage.
+        """
+        handles = browser.window_handles
+        for handle in handles[1:]:
+            browser.switch_to.window(handle)
+            browser.close()
+        browser.switch_to.window(handles[0])
+        browser.execute_script(
+            "try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}"
+        )
+        try:
+            browser.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        except Exception:
+            browser.delete_all_cookies()
+        browser.get("about:blank")
+
+    @staticmethod
+    def is_alive(browser):
+        try:
+            browser.window_handles
+            return True
+        except Exception:
+            return False
+
+    @contextmanager
+    def session(self):
+        """
+        Borrows a session for the duration of a `with` block. A block that raises
+        only recycles the session if the browser itself stopped responding.
+        """
+        browser = self.acquire()
+        healthy = True
+        try:
+            yield browser
+        except BaseException:
+            healthy = self.is_alive(browser)
+            raise
+        finally:
+            self.release(browser, healthy)
+
+    def close(self):
+        """
+        Quits every idle session; sessions still in use are quit when released.
+        """
+        with self.available:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.available.notify_all()
+        for browser in idle:
+            self.discard(browser)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
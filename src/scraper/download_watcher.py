@@ -0,0 +1,100 @@
+from constants.scraper.constants import DOWNLOAD_WAIT_TIMEOUT
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+import os
+import threading
+import time
+
+PARTIAL_SUFFIXES = (".crdownload", ".part", ".tmp")
+
+
+def is_finished_name(path):
+    """
+    Whether a file name is a finished download rather than a browser's partial file.
+    """
+    name = os.path.basename(path)
+    return not name.startswith(".") and not name.endswith(PARTIAL_SUFFIXES)
+
+
+class DownloadWatcher(FileSystemEventHandler):
+    """
+    Waits for a browser download to land in a directory, driven by filesystem events
+    (inotify on Linux) instead of polling the directory.
+
+    Chrome writes to a `.crdownload` file and renames it once done; the renamed file
+    is then checked for a stable size before it is reported. Give every download its
+    own directory, so the file found there is known to belong to that download.
+
+    Args:
+    directory (str): Directory the download is saved to.
+    stable_interval (float): Seconds the file size must stay unchanged.
+    """
+
+    def __init__(self, directory, stable_interval=0.2):
+        self.directory = directory
+        self.stable_interval = stable_interval
+        self.finished = threading.Event()
+        self.path = None
+        self.observer = None
+
+    def on_created(self, event):
+        self.check(event.src_path, event.is_directory)
+
+    def on_moved(self, event):
+        self.check(event.dest_path, event.is_directory)
+
+    def on_closed(self, event):
+        self.check(event.src_path, event.is_directory)
+
+    def check(self, path, is_directory=False):
+        if not is_directory and is_finished_name(path):
+            self.path = path
+            self.finished.set()
+
+    def __enter__(self):
+        self.observer = Observer()
+        self.observer.schedule(self, self.directory, recursive=False)
+        self.observer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.observer.stop()
+        self.observer.join()
+
+    def wait(self, timeout=DOWNLOAD_WAIT_TIMEOUT):
+        """
+        Blocks until a finished file appears and stops growing.
+
+        Args:
+        timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+        str: Path of the downloaded file, or None if none finished in time.
+        """
+        deadline = time.monotonic() + timeout
+        # a download finishing before the observer started sends no event
+        for name in os.listdir(self.directory):
+            self.check(os.path.join(self.directory, name))
+
+        while True:
+            if not self.finished.wait(max(0, deadline - time.monotonic())):
+                return None
+            path = self.path
+            if self.is_stable(path, deadline):
+                return path
+            self.finished.clear()
+            if self.path != path:
+                self.finished.set()
+
+    def is_stable(self, path, deadline):
+        try:
+            size = os.path.getsize(path)
+            while time.monotonic() < deadline:
+                time.sleep(self.stable_interval)
+                new_size = os.path.getsize(path)
+                if new_size == size and size > 0:
+                    return True
+                size = new_size
+        except OSError:
+            pass
+        return False
@@ -3,11 +3,28 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
-from constants.scraper.constants import DOWNLOADED_VIDS_DIR
+from selenium.common.exceptions import TimeoutException
+from constants.scraper.constants import (
+    DOWNLOADED_VIDS_DIR,
+    USER_AGENT,
+    SCROLL_STEP_TIMEOUT,
+    SCROLL_MAX_STALLS,
+    SCRAPE_MAX_LINKS,
+    SCRAPE_TIME_BUDGET,
+)
+from src.scraper.async_downloader import download_videos, video_file_name
+from src.scraper.browser_pool import BrowserPool
+from src.scraper.download_watcher import DownloadWatcher
+from src.scraper.video_index import VideoIndex, parse_video_id
+import itertools
 import time
 import os
 import random
+import shutil
+import tempfile
+
+# video item containers inside the videos section of a tag page
+VIDEO_ITEM_SELECTOR = "div.css-1qb12g8-DivThreeColumnContainer.eegew6e2 div.css-x6y88p-DivItemContainerV2.e19c29qe8"
 
 
 def create_browser_options():
@@ -25,9 +42,7 @@ def create_browser_options():
     options.add_argument("--disable-dev-shm-usage")
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option("useAutomationExtension", False)
-    options.add_argument(
-        "--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-    )
+    options.add_argument(f"--user-agent={USER_AGENT}")
     return options
 
 
@@ -46,117 +61,110 @@ def open_url(url):
     return browser
 
 
-def get_html_soup(browser):
+def count_video_items(browser):
     """
-    Extracts HTML content from the browser page and returns a BeautifulSoup object.
+    Counts the video item containers currently on the page.
+    """
+    return browser.execute_script(
+        "return document.querySelectorAll(arguments[0]).length", VIDEO_ITEM_SELECTOR
+    )
 
-    Args:
-    browser (webdriver.Chrome): The Chrome browser instance.
 
-    Returns:
-    bs4.BeautifulSoup: The BeautifulSoup object representing the HTML content.
+def more_items_than(item_count):
+    """
+    Returns a WebDriverWait condition giving the new item count once it exceeds `item_count`.
     """
-    html_content = browser.page_source
-    soup = BeautifulSoup(html_content, "html.parser")
-    browser.quit()
-    return soup
 
+    def condition(browser):
+        new_count = count_video_items(browser)
+        return new_count if new_count > item_count else False
 
-def scroll_down(browser):
+    return condition
+
+
+def scroll_steps(
+    browser,
+    step_timeout=SCROLL_STEP_TIMEOUT,
+    max_stalls=SCROLL_MAX_STALLS,
+    time_budget=SCRAPE_TIME_BUDGET,
+):
     """
-    Scrolls down the webpage to load additional content dynamically.
+    Scrolls down the webpage to load additional content dynamically, yielding after every scroll step so the caller can collect what was loaded so far.
+
+    Instead of sleeping a fixed time, each step waits until the number of video items grows, polling every 100 ms for at most `step_timeout` seconds. Scrolling stops after `max_stalls` consecutive steps that loaded nothing, or once `time_budget` seconds have passed.
 
     Args:
     browser (webdriver.Chrome): The Chrome browser instance.
+    step_timeout (float): Maximum number of seconds to wait for new items after a scroll.
+    max_stalls (int): Number of consecutive scrolls without new items before stopping.
+    time_budget (float): Maximum number of seconds spent scrolling. None for no limit.
     """
-    scroll_pause_time = 2
-    last_height = browser.execute_script("return document.body.scrollHeight")
-    retries = 5  # Number of retries if no new content is loaded
+    started = time.monotonic()
+    item_count = count_video_items(browser)
+    stalls = 0
 
-    while True:
+    while stalls < max_stalls:
+        if time_budget is not None and time.monotonic() - started > time_budget:
+            return
         browser.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(scroll_pause_time)  # Allow time for the page to load
-        new_height = browser.execute_script("return document.body.scrollHeight")
-
-        if new_height == last_height:
-            if retries > 0:
-                retries -= 1
-                time.sleep(scroll_pause_time)
-                # Try scrolling again
-                continue
-            else:
-                # Break the loop if retries are exhausted and no new content is loaded
-                break
-        else:
-            retries = 3  # Reset retries if new content has been loaded
-            last_height = new_height
+        try:
+            item_count = WebDriverWait(browser, step_timeout, poll_frequency=0.1).until(
+                more_items_than(item_count)
+            )
+            stalls = 0
+        except TimeoutException:
+            stalls += 1
+        yield
 
 
-def extract_video_links(videos_section_divs):
+def scroll_down(browser):
     """
-    Extracts video links from the given section of HTML content.
+    Scrolls down the webpage until no additional content is loaded.
 
     Args:
-    videos_section_divs (bs4.element.Tag): The BeautifulSoup Tag representing the section containing video links.
-
-    Returns:
-    list: A list of video links.
+    browser (webdriver.Chrome): The Chrome browser instance.
     """
-    if not videos_section_divs:
-        return []
-    video_links = []
-    for video_div in videos_section_divs.find_all(
-        "div", class_="css-x6y88p-DivItemContainerV2 e19c29qe8"
-    ):
-        a_tag = video_div.find("a", href=True)
-        if a_tag and "tiktok.com" in a_tag["href"]:
-            video_links.append(a_tag["href"])
-    return video_links
+    for _ in scroll_steps(browser):
+        pass
 
 
-def calculate_downloaded_videos():
-    """
-    Calculates the number of videos already downloaded.
-
-    Returns:
-    int: The number of downloaded videos.
+def extract_new_video_links(browser, seen_items):
     """
-    try:
-        return len([f for f in os.listdir(DOWNLOADED_VIDS_DIR) if f.endswith(".mp4")])
-    except Exception as e:
-        print(f"Error accessing directory: {e}")
-        return 0
+    Extracts the video links of the item containers added to the page since the last call, querying the live DOM instead of parsing the whole page source.
 
+    Args:
+    browser (webdriver.Chrome): The Chrome browser instance.
+    seen_items (int): Number of item containers already extracted.
 
-def wait_for_download(num_vids_before, max_retries=10):
+    Returns:
+    int: Number of item containers on the page.
+    list: The links of the new containers.
     """
-    Waits for new videos to be downloaded, retrying a specified number of times.
-
-    Args:
-    num_vids_before (int): Number of videos before starting the download.
-    max_retries (int): Maximum number of retries to wait for the download to complete. Default is 10.
-    """
-    retries = 0
-    while retries < max_retries:
-        time.sleep(1)  # Wait for 1 second before checking again
-        current_vids = calculate_downloaded_videos()
-        print("current_vids: ", current_vids)
-        if current_vids > num_vids_before:
-            print(f"Video downloaded successfully! Total videos: {current_vids}")
-            return
-        retries += 1
-    print("Reached maximum retries without downloading all videos.")
+    item_count, hrefs = browser.execute_script(
+        """
+        const items = document.querySelectorAll(arguments[0]);
+        const hrefs = [];
+        // a shrunken list means containers were recycled, so rescan all of them
+        const start = items.length < arguments[1] ? 0 : arguments[1];
+        for (let i = start; i < items.length; i++) {
+            const a = items[i].querySelector("a[href]");
+            hrefs.push(a ? a.getAttribute("href") : null);
+        }
+        return [items.length, hrefs];
+        """,
+        VIDEO_ITEM_SELECTOR,
+        seen_items,
+    )
+    return item_count, [href for href in hrefs if href and "tiktok.com" in href]
 
 
-def download_video(url):
+def create_download_browser():
     """
-    Downloads a video from the specified URL.
+    Starts a Chrome browser that saves downloads to the videos directory without prompting.
 
-    Args:
-    url (str): The URL of the video to download.
+    Returns:
+    webdriver.Chrome: The Chrome browser instance.
     """
-    num_vids_before = calculate_downloaded_videos()
-
     options = create_browser_options()
     options.add_experimental_option(
         "prefs",
@@ -167,31 +175,67 @@ def download_video(url):
             "safebrowsing.enabled": True,
         },
     )
+    return webdriver.Chrome(options=options)
+
+
+def download_video(url, browser_pool=None, video_index=None):
+    """
+    Downloads a video from the specified URL.
+
+    The browser saves the video to a directory of its own, where a `DownloadWatcher` picks it up as soon as it is complete, and it is then moved into the videos directory.
+
+    Args:
+    url (str): The URL of the video to download.
+    browser_pool (BrowserPool): Pool of warm download browsers to borrow one from. Without it, a browser is started for this video and quit afterwards.
+    video_index (VideoIndex): Index of downloaded videos. Indexed videos are skipped, and the new download is added to it.
+    """
+    video_id = parse_video_id(url)
+    if video_index is not None and video_index.downloaded_path(video_id) is not None:
+        print(f"Video {video_id} was already downloaded.")
+        return
+    if browser_pool is None:
+        browser_pool = BrowserPool(create_download_browser, size=1, max_uses=1)
+    os.makedirs(DOWNLOADED_VIDS_DIR, exist_ok=True)
+    incoming_dir = tempfile.mkdtemp(prefix=".incoming-", dir=DOWNLOADED_VIDS_DIR)
 
-    driver = webdriver.Chrome(options=options)
     try:
-        driver.get("https://ssstik.io/en")
-        WebDriverWait(driver, 20).until(
-            EC.element_to_be_clickable((By.ID, "main_page_text"))
-        ).send_keys(url)
-        WebDriverWait(driver, 20).until(
-            EC.element_to_be_clickable((By.ID, "submit"))
-        ).click()
-        no_watermark_button = WebDriverWait(driver, 30).until(
-            EC.element_to_be_clickable(
-                (
-                    By.CSS_SELECTOR,
-                    "a.pure-button.pure-button-primary.is-center.u-bl.dl-button.download_link.without_watermark.vignette_active.notranslate",
+        with browser_pool.session() as driver:
+            driver.execute_cdp_cmd(
+                "Page.setDownloadBehavior",
+                {"behavior": "allow", "downloadPath": os.path.abspath(incoming_dir)},
+            )
+            driver.get("https://ssstik.io/en")
+            WebDriverWait(driver, 20).until(
+                EC.element_to_be_clickable((By.ID, "main_page_text"))
+            ).send_keys(url)
+            WebDriverWait(driver, 20).until(
+                EC.element_to_be_clickable((By.ID, "submit"))
+            ).click()
+            no_watermark_button = WebDriverWait(driver, 30).until(
+                EC.element_to_be_clickable(
+                    (
+                        By.CSS_SELECTOR,
+                        "a.pure-button.pure-button-primary.is-center.u-bl.dl-button.download_link.without_watermark.vignette_active.notranslate",
+                    )
                 )
             )
-        )
-        no_watermark_button.click()
-        wait_for_download(num_vids_before)
+            with DownloadWatcher(incoming_dir) as watcher:
+                no_watermark_button.click()
+                downloaded_path = watcher.wait()
+
+        if downloaded_path is None:
+            print(f"Download of {url} did not finish in time.")
+            return
+        video_path = os.path.join(DOWNLOADED_VIDS_DIR, video_file_name(url))
+        os.replace(downloaded_path, video_path)
+        if video_index is not None and video_id is not None:
+            video_index.add(video_id, url, video_path)
+        print(f"Video downloaded successfully: {video_path}")
 
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
-        driver.quit()
+        shutil.rmtree(incoming_dir, ignore_errors=True)
 
 
 def random_delay():
@@ -208,41 +252,58 @@ def random_delay():
     print("Resuming operation.")
 
 
-def scrape_tiktok_video_links(url):
+def scrape_tiktok_video_links(
+    url, max_links=SCRAPE_MAX_LINKS, time_budget=SCRAPE_TIME_BUDGET
+):
     """
     Scrapes TikTok video links from the specified URL.
 
+    Links are extracted after every scroll step and yielded as soon as they appear, so downloads can start while the page is still loading.
+
     Args:
     url (str): The URL of the TikTok page.
+    max_links (int): Stop once this many links were found. None for every link on the page.
+    time_budget (float): Maximum number of seconds spent scrolling, not counting the CAPTCHA wait. None for no limit.
 
-    Returns:
-    list: A list of TikTok video links.
+    Yields:
+    str: Every TikTok video link, once.
     """
     driver = open_url(url)
-    # Wait 30 seconds to solve CAPTCHA manually
-    time.sleep(30)
-    scroll_down(driver)
-    # Get HTML soup after scrolling
-    html_soup = get_html_soup(driver)
-
-    # Continue with scraping
-    videos_section_divs = html_soup.find(
-        "div", {"class": "css-1qb12g8-DivThreeColumnContainer eegew6e2"}
-    )
-    videos_links = extract_video_links(videos_section_divs)
-
-    return videos_links
+    try:
+        # Wait 30 seconds to solve CAPTCHA manually
+        time.sleep(30)
+        seen_links = set()
+        seen_items = 0
+        steps = scroll_steps(driver, time_budget=time_budget)
+        for _ in itertools.chain([None], steps):
+            seen_items, video_links = extract_new_video_links(driver, seen_items)
+            for video_link in video_links:
+                if video_link not in seen_links:
+                    seen_links.add(video_link)
+                    yield video_link
+                    if max_links is not None and len(seen_links) >= max_links:
+                        return
+    finally:
+        driver.quit()
 
 
-def download_tiktok_videos(url):
+def download_tiktok_videos(url, use_browser=False):
     """
-    Downloads TikTok videos from the specified URL.
+    Downloads TikTok videos from the specified URL, skipping videos already in the video index.
 
     Args:
     url (str): The URL of the TikTok page containing videos to download.
+    use_browser (bool): Whether to download by driving the ssstik page in Chrome instead of the concurrent HTTP downloader.
     """
-    videos_links = scrape_tiktok_video_links(url)
-    for video_link in videos_links:
-        print(f"Downloading video from {video_link}")
-        download_video(video_link)
-        random_delay()
+    videos_links = list(scrape_tiktok_video_links(url))
+    with VideoIndex() as video_index:
+        if not use_browser:
+            download_videos(videos_links, video_index=video_index)
+            return
+        with BrowserPool(create_download_browser) as browser_pool:
+            for video_link in videos_links:
+                if video_index.downloaded_path(parse_video_id(video_link)):
+                    continue
+                print(f"Downloading video from {video_link}")
+                download_video(video_link, browser_pool, video_index)
+                random_delay()
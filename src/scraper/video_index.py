@@ -0,0 +1,124 @@
+from constants.scraper.constants import DOWNLOADED_VIDS_DIR, VIDEO_INDEX_PATH
+from src.hashing import file_content_hash
+import os
+import re
+import sqlite3
+import threading
+import time
+
+
+def parse_video_id(video_link):
+    """
+    Extracts the TikTok video ID from a video URL.
+
+    Args:
+    video_link (str): The TikTok video URL, e.g. https://www.tiktok.com/@user/video/123.
+
+    Returns:
+    str: The video ID, or None if the URL has none.
+    """
+    match = re.search(r"/video/(\d+)", video_link)
+    return match.group(1) if match else None
+
+
+def video_id_from_file_name(file_name):
+    """
+    Returns the video ID of a downloaded file named `<video id>.mp4`, or None.
+    """
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    return stem if stem.isdigit() else None
+
+
+class VideoIndex:
+    """
+    Persistent index of downloaded videos backed by SQLite, mapping every TikTok video
+    ID to its source URL, local file, content hash, size and download time.
+
+    Downloaders skip IDs whose file is still on disk, so repeated runs over the same
+    hashtag only fetch new videos, and evaluation looks metadata up by ID. The index
+    may be shared between threads.
+
+    Args:
+    db_path (str): Path to the SQLite database, created if missing.
+    download_dir (str): Directory the indexed files live in.
+    """
+
+    def __init__(self, db_path=VIDEO_INDEX_PATH, download_dir=DOWNLOADED_VIDS_DIR):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.download_dir = download_dir
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                downloaded_at REAL NOT NULL
+            )
+            """)
+
+    def get(self, video_id):
+        """
+        Looks up an indexed video.
+
+        Args:
+        video_id (str): The TikTok video ID.
+
+        Returns:
+        dict: The video's metadata, or None if it is not indexed.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT video_id, url, file_name, content_hash, size, downloaded_at FROM videos WHERE video_id = ?",
+                (video_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ["video_id", "url", "file_name", "content_hash", "size", "downloaded_at"]
+        return dict(zip(keys, row))
+
+    def downloaded_path(self, video_id):
+        """
+        Returns the local file of an indexed video, or None if it is unknown or was deleted.
+        """
+        video = self.get(video_id) if video_id is not None else None
+        if video is None:
+            return None
+        path = os.path.join(self.download_dir, video["file_name"])
+        return path if os.path.exists(path) else None
+
+    def add(self, video_id, url, path):
+        """
+        Indexes a freshly downloaded video, hashing its content.
+
+        Args:
+        video_id (str): The TikTok video ID.
+        url (str): The TikTok video URL.
+        path (str): Path of the downloaded file.
+        """
+        content_hash = file_content_hash(path)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    video_id,
+                    url,
+                    os.path.basename(path),
+                    content_hash,
+                    os.path.getsize(path),
+                    time.time(),
+                ),
+            )
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,11 +1,57 @@
 from constants.scraper.constants import DOWNLOADED_VIDS_DIR
-from constants.video_quality_eval.constants import OUT_PATH
-from src.video_quality_eval.deep_learning.simpleVQA.infer import simple_vqa_infer
+from constants.video_quality_eval.constants import (
+    OUT_PATH,
+    OUT_COLUMNS_PATH,
+    STREAM_RESULTS,
+    METRICS_PATH,
+    METRICS_PORT,
+    METRICS_VERSION,
+    ANALYSIS_SHORT_SIDE,
+    USE_FRAME_CACHE,
+    USE_FEATURE_CACHE,
+    DEDUPLICATE,
+    NUM_WORKERS,
+    THREADS_PER_WORKER,
+)
+from src.video_quality_eval.deep_learning.simpleVQA.feature_cache import FeatureCache
+from src.video_quality_eval.deep_learning.simpleVQA.infer import (
+    SimpleVQAConsumer,
+    get_scorer,
+    inference_precision,
+)
+from src.video_quality_eval.dedup import NearDuplicateIndex
+from src.video_quality_eval.frame_cache import FrameCache
+from src.video_quality_eval.frame_pipeline import FramePipeline
+from src.video_quality_eval.instrumentation import (
+    count,
+    log_event,
+    profile_video,
+    registry,
+    serve_metrics,
+)
 from src.video_quality_eval.traditional.video_quality_eval import (
-    laplacian_video_quality,
-    structural_similarity_video_quality,
-    psnr_video_quality,
+    LaplacianConsumer,
+    StructuralSimilarityConsumer,
+    PSNRConsumer,
+)
+from src.video_quality_eval.result_store import ResultStore
+from src.video_quality_eval.result_writer import (
+    JsonLinesWriter,
+    OrderedWriter,
+    export_structured_array,
+)
+from src.scraper.video_index import VideoIndex, video_id_from_file_name
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    as_completed,
+    wait,
 )
+from functools import partial
+import multiprocessing
+import cv2
+import torch
 import os
 import json
 
@@ -22,48 +68,471 @@ def save_json(data, file_path):
         json.dump(data, json_file, indent=4)
 
 
-def evaluate_videos_quality():
+class PendingSimpleVQA:
     """
-    Evaluates the quality of downloaded videos using various metrics such as Laplacian, Structural Similarity Index, and Peak Signal-to-Noise Ratio (PSNR).
+    Record of a video whose SimpleVQA score is held back while some of its motion clips
+    wait in the shared `ClipBatcher` for clips of the following videos to fill a batch.
 
-    The function iterates through each downloaded video in the specified directory, calculates quality scores using the mentioned metrics, and saves the metadata in a JSON file.
+    Args:
+        video_quality (dict): The record, with every other metric already computed.
+        consumer (SimpleVQAConsumer): The SimpleVQA consumer of the video.
+        profile (Profile): Profile of the video, resumed while the score is computed.
     """
-    videos_qualities_metadata = []
-    videos = os.listdir(DOWNLOADED_VIDS_DIR)
-    for video_id, video in enumerate(videos):
 
-        if not video.endswith(".mp4"):
-            continue
+    def __init__(self, video_quality, consumer, profile):
+        self.video_quality = video_quality
+        self.consumer = consumer
+        self.profile = profile
 
-        print(f"Evaluating video-{video_id+1}...")
+    def ready(self):
+        """
+        Whether the score can be computed without running the clips still queued.
+        """
+        return self.consumer.features_ready()
 
-        video_path = os.path.join(DOWNLOADED_VIDS_DIR, video)
+    def result(self):
+        """
+        Computes the score, flushing the batcher if needed, and returns the record.
+        """
+        with profile_video(self.profile):
+            self.video_quality["simple_VQA"] = {
+                "quality_score": self.consumer.result(),
+            }
+        self.video_quality["profile"] = self.profile.as_dict()
+        return self.video_quality
 
-        lap_score, lap_res = laplacian_video_quality(video_path)
-        ss_score, ss_res = structural_similarity_video_quality(video_path)
-        psnr_score, psnr_res = psnr_video_quality(video_path)
-        vqa_score = simple_vqa_infer(video_path)
 
-        video_quality = {
-            video: {
-                "laplacian": {
-                    "quality_score": lap_score,
-                    "quality": lap_res,
-                },
-                "structural_similarty": {
-                    "quality_score": ss_score,
-                    "quality": ss_res,
-                },
-                "peak_signal_to_noise_ratio": {
-                    "quality_score": psnr_score,
-                    "quality": psnr_res,
-                },
-                "simple_VQA": {
-                    "quality_score": vqa_score,
-                },
+def finished_record(video_quality):
+    """
+    The complete record of a video, computing a held back SimpleVQA score first.
+    """
+    if isinstance(video_quality, PendingSimpleVQA):
+        return video_quality.result()
+    return video_quality
+
+
+def evaluate_video_quality(
+    video_path,
+    sampler=None,
+    simple_vqa=True,
+    analysis_short_side=ANALYSIS_SHORT_SIDE,
+    frame_cache=None,
+    feature_cache=None,
+    content_hash=None,
+    scorer=None,
+    defer_simple_vqa=False,
+):
+    """
+    Computes every quality metric of a single video from one shared decode pass.
+
+    Args:
+        video_path (str): Path to the video file.
+        sampler (FrameSampler): Which frames the traditional metrics score. Defaults to
+            every frame. When set, each metric also reports the frames it used.
+        simple_vqa (bool): Whether to run SimpleVQA, which always needs every frame.
+        analysis_short_side (int): Short side the traditional metrics downscale frames
+            to, with thresholds calibrated for it. None analyses full-resolution frames.
+        frame_cache (FrameCache): Optional on-disk cache the decoded frames are read
+            from or written to.
+        feature_cache (FeatureCache): Optional cache of the SimpleVQA backbone features.
+        content_hash (str): Content hash of the video when already known, which keys
+            the feature cache without hashing the file again.
+        scorer (SimpleVQAScorer): Scorer running SimpleVQA. Defaults to the
+            process-wide scorer.
+        defer_simple_vqa (bool): Whether to leave motion clips that do not fill a
+            SlowFast batch queued for the clips of the next video, and return a
+            `PendingSimpleVQA` instead of the record.
+
+    Returns:
+        dict: Quality scores of the video keyed by metric name, and under "profile" the
+            time and calls of every stage, event counters and memory high-water marks.
+    """
+    with profile_video() as profile:
+        video_quality, simple_vqa_consumer = evaluate_video_metrics(
+            video_path,
+            sampler,
+            simple_vqa,
+            analysis_short_side,
+            frame_cache,
+            feature_cache,
+            content_hash,
+            scorer,
+        )
+    pending = PendingSimpleVQA(video_quality, simple_vqa_consumer, profile)
+    if simple_vqa_consumer is not None and defer_simple_vqa:
+        return pending
+    if simple_vqa_consumer is not None:
+        return pending.result()
+    video_quality["profile"] = profile.as_dict()
+    return video_quality
+
+
+def evaluate_video_metrics(
+    video_path,
+    sampler,
+    simple_vqa,
+    analysis_short_side,
+    frame_cache,
+    feature_cache,
+    content_hash,
+    scorer=None,
+):
+    """
+    Runs the decode pass of a video and computes its traditional metrics.
+
+    Returns:
+        dict: Quality scores of the traditional metrics keyed by metric name.
+        SimpleVQAConsumer: The SimpleVQA consumer fed by the pass, None without it.
+    """
+    pipeline = FramePipeline(video_path, frame_cache)
+    metrics = {
+        "laplacian": pipeline.register(
+            LaplacianConsumer(analysis_short_side=analysis_short_side), sampler
+        ),
+        "structural_similarty": pipeline.register(
+            StructuralSimilarityConsumer(analysis_short_side=analysis_short_side),
+            sampler,
+        ),
+        "peak_signal_to_noise_ratio": pipeline.register(
+            PSNRConsumer(analysis_short_side=analysis_short_side), sampler
+        ),
+    }
+    simple_vqa_consumer = None
+    if simple_vqa:
+        simple_vqa_consumer = pipeline.register(
+            SimpleVQAConsumer(scorer, feature_cache, content_hash)
+        )
+    pipeline.run()
+
+    video_quality = {}
+    for metric, consumer in metrics.items():
+        score, quality = consumer.result()
+        video_quality[metric] = {
+            "quality_score": score,
+            "quality": quality,
+        }
+        if sampler is not None:
+            video_quality[metric]["frames"] = consumer.frames_used
+
+    return video_quality, simple_vqa_consumer
+
+
+def init_worker(threads_per_worker, load_models=True):
+    """
+    Prepares an evaluation worker process: pins the torch and OpenCV thread pools so
+    concurrent workers do not oversubscribe the cores, and loads the models once.
+
+    Args:
+        threads_per_worker (int): Number of threads each worker may use.
+        load_models (bool): Whether to load the SimpleVQA models up front.
+    """
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    cv2.setNumThreads(threads_per_worker)
+
+    if not load_models:
+        return
+    try:
+        get_scorer()
+    except Exception as e:
+        print(f"Error loading model state dict: {e}")
+
+
+def evaluate_indexed_video(video_id, video_path, content_hash=None, **options):
+    print(f"Evaluating video-{video_id+1}...")
+    return evaluate_video_quality(video_path, content_hash=content_hash, **options)
+
+
+def is_complete(video_quality):
+    """
+    Whether every metric of a record was computed, i.e. the record is worth caching.
+    """
+    vqa_score = video_quality.get("simple_VQA", {}).get("quality_score")
+    return not isinstance(vqa_score, str)
+
+
+def evaluate_pending(
+    pending,
+    num_workers,
+    threads_per_worker,
+    evaluate=evaluate_indexed_video,
+    load_models=True,
+):
+    """
+    Evaluates videos, yielding each result as soon as it is available.
+
+    `pending` is consumed lazily: in pool mode at most two videos per worker are
+    submitted ahead, so it may be a generator fed while the evaluation runs.
+
+    In the current process, `evaluate` may return a `PendingSimpleVQA` whose motion
+    clips wait for the clips of the next videos to fill a SlowFast batch. Such records
+    are yielded in order as soon as their clips went through a batch, and the last
+    ones once `pending` is exhausted.
+
+    Args:
+        pending (iterable): (video_id, video, video_path, content_hash) tuples.
+        num_workers (int): Number of worker processes. 1 evaluates in the current process.
+        threads_per_worker (int): Threads per worker. Defaults to an even share of the CPU cores.
+        evaluate (callable): Evaluates one video from its id, path and content hash
+            (None when unknown); must be picklable.
+        load_models (bool): Whether workers load the SimpleVQA models up front.
+
+    Yields:
+        tuple: The pending entry and its quality record.
+    """
+    if num_workers <= 1:
+        waiting = deque()
+        for entry in pending:
+            video_id, _, video_path, content_hash = entry
+            waiting.append((entry, evaluate(video_id, video_path, content_hash)))
+            while waiting and (
+                not isinstance(waiting[0][1], PendingSimpleVQA) or waiting[0][1].ready()
+            ):
+                entry, video_quality = waiting.popleft()
+                yield entry, finished_record(video_quality)
+        for entry, video_quality in waiting:
+            yield entry, finished_record(video_quality)
+        return
+
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+
+    # spawn: forking a parent that already started torch/OpenMP threads can deadlock
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(threads_per_worker, load_models),
+    ) as executor:
+        futures = {}
+        for entry in pending:
+            futures[executor.submit(evaluate, entry[0], entry[2], entry[3])] = entry
+            # yield every finished video before asking for the next entry, which may
+            # block on a download, and wait only while every worker has two queued
+            while futures:
+                full = len(futures) >= 2 * num_workers
+                done, _ = wait(
+                    futures,
+                    timeout=None if full else 0,
+                    return_when=FIRST_COMPLETED,
+                )
+                if not done:
+                    break
+                for future in done:
+                    yield futures.pop(future), future.result()
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def evaluate_videos_quality(
+    num_workers=NUM_WORKERS,
+    threads_per_worker=THREADS_PER_WORKER,
+    use_cache=True,
+    sampler=None,
+    simple_vqa=True,
+    analysis_short_side=ANALYSIS_SHORT_SIDE,
+    use_frame_cache=USE_FRAME_CACHE,
+    use_feature_cache=USE_FEATURE_CACHE,
+    videos=None,
+    video_index=None,
+    deduplicate=DEDUPLICATE,
+    stream_results=STREAM_RESULTS,
+    columns_path=OUT_COLUMNS_PATH,
+    metrics_path=METRICS_PATH,
+    metrics_port=METRICS_PORT,
+    on_recorded=None,
+):
+    """
+    Evaluates the quality of downloaded videos using various metrics such as Laplacian, Structural Similarity Index, and Peak Signal-to-Noise Ratio (PSNR).
+
+    The function iterates through each downloaded video in the specified directory, calculates quality scores using the mentioned metrics, and saves the metadata.
+    By default every record is appended to a JSON Lines file as soon as the video and every video before it are scored, in the order of `videos`, and only the metrics near-duplicates may copy are kept in memory; otherwise all records are saved to a JSON list at the end, in the order of `videos`.
+    With more than one worker the videos are spread over a process pool.
+    Every scored video is checkpointed to the result store as soon as it is done, and videos whose content was already scored with the same metrics and model are skipped, so an interrupted run continues where it stopped.
+
+    Args:
+        num_workers (int): Number of worker processes. 1 evaluates in the current process.
+        threads_per_worker (int): Threads per worker. Defaults to an even share of the CPU cores.
+        use_cache (bool): Whether to reuse and record results in the result store.
+        sampler (FrameSampler): Which frames the traditional metrics score. Defaults to every frame.
+        simple_vqa (bool): Whether to run SimpleVQA. Without it, a sampled evaluation only decodes the sampled frames.
+        analysis_short_side (int): Short side the traditional metrics downscale frames to. None analyses full-resolution frames.
+        use_frame_cache (bool): Whether to keep decoded frames in the on-disk frame cache, so re-runs with other thresholds or models skip decoding.
+        use_feature_cache (bool): Whether to keep the SimpleVQA backbone features per video, so a checkpoint with a retrained regression head only re-runs the head.
+        videos (iterable): File names of the videos in the download directory, evaluated in this order as they are produced, e.g. while they are still being downloaded. Defaults to every .mp4 in the directory, sorted.
+        video_index (VideoIndex): Index of downloaded videos, looked up by the video ID in the file name for the source URL and download metadata saved with each result, and for the content hash. Defaults to the persistent video index.
+        deduplicate (bool): Whether to fingerprint every video first and score only one representative per group of copies of the same video (e.g. re-uploads) with the same content, or the same resolution, bitrate and sharpness, copying its result to the others with a "duplicate_of" entry.
+        stream_results (bool): Whether to stream the records to the JSON Lines file instead of saving a JSON list at the end.
+        columns_path (str): Optional `.npy` file the streamed records are exported to as a NumPy structured array once the run ends.
+        metrics_path (str): OpenMetrics file with the stage timers, counters and peak memory of the run, rewritten after every video. None disables it.
+        metrics_port (int): Port serving the same metrics on localhost while the run lasts. None disables it.
+        on_recorded (callable): Called with the file name of every video once its record is written, e.g. to delete the scored video.
+    """
+    if videos is None:
+        videos = sorted(
+            video for video in os.listdir(DOWNLOADED_VIDS_DIR) if video.endswith(".mp4")
+        )
+    metrics_version = METRICS_VERSION
+    if sampler is not None:
+        metrics_version += f"/{sampler!r}"
+    if not simple_vqa:
+        metrics_version += "/no-vqa"
+    elif inference_precision():
+        metrics_version += f"/{inference_precision()}"
+    if analysis_short_side is not None:
+        metrics_version += f"/{analysis_short_side}px"
+    if deduplicate:
+        metrics_version += "/dedup"
+    frame_cache = FrameCache() if use_frame_cache else None
+    frames_variant = ""
+    if frame_cache is not None and frame_cache.short_side is not None:
+        frames_variant = f"{frame_cache.short_side}px"
+        metrics_version += f"/cache-{frames_variant}"
+    feature_cache = FeatureCache(variant=frames_variant) if use_feature_cache else None
+    store = ResultStore(metrics_version=metrics_version) if use_cache else None
+    own_video_index = video_index is None
+    if own_video_index:
+        video_index = VideoIndex()
+    near_duplicates = NearDuplicateIndex() if deduplicate else None
+    evaluate = partial(
+        evaluate_indexed_video,
+        sampler=sampler,
+        simple_vqa=simple_vqa,
+        analysis_short_side=analysis_short_side,
+        frame_cache=frame_cache,
+        feature_cache=feature_cache,
+        # in a single process, videos share SlowFast batches
+        defer_simple_vqa=num_workers <= 1,
+    )
+
+    writer = JsonLinesWriter() if stream_results else None
+    ordered_writer = OrderedWriter(writer) if writer is not None else None
+    # records kept in memory: all of them for the JSON list, otherwise only the
+    # metrics near-duplicates may still copy
+    video_qualities = {}
+    video_sources = {}
+    # video -> position in `videos`, until its record is written
+    positions = {}
+    # representative -> near-duplicates waiting for its result
+    duplicates = {}
+    evaluated_videos = []
+
+    def record(video, video_quality):
+        if writer is None:
+            video_qualities[video] = video_quality
+        elif near_duplicates is not None:
+            video_qualities[video] = {
+                metric: value
+                for metric, value in video_quality.items()
+                if metric != "profile"
             }
+        if writer is not None:
+            source = video_sources.pop(video, None)
+            if source is not None:
+                video_quality = {**video_quality, "source": source}
+            ordered_writer.write(positions.pop(video), video, video_quality)
+        if on_recorded is not None:
+            on_recorded(video)
+        for duplicate, content_hash in duplicates.pop(video, []):
+            record_duplicate(duplicate, video, content_hash)
+
+    def record_duplicate(video, representative, content_hash):
+        video_quality = {
+            **video_qualities[representative],
+            "duplicate_of": representative,
         }
+        video_quality.pop("profile", None)
+        count("videos_deduplicated")
+        if store is not None and is_complete(video_quality):
+            store.put(content_hash, video, video_quality)
+        record(video, video_quality)
+
+    def pending_entries():
+        for video_id, video in enumerate(videos):
+            if writer is None:
+                evaluated_videos.append(video)
+            else:
+                positions[video] = video_id
+            video_path = os.path.join(DOWNLOADED_VIDS_DIR, video)
+            source = video_index.get(video_id_from_file_name(video))
+            if source is not None:
+                video_sources[video] = source
+            content_hash = None
+            if source is not None and source["size"] == os.path.getsize(video_path):
+                content_hash = source["content_hash"]
+            elif store is not None:
+                content_hash = store.content_hash(video_path)
+            # stored videos are fingerprinted too, so their re-uploads reuse them
+            representative = None
+            if near_duplicates is not None:
+                representative = near_duplicates.match(video, video_path, content_hash)
+            if store is not None:
+                cached_quality = store.get(content_hash)
+                if cached_quality is not None:
+                    print(f"Reusing stored result of {video}.")
+                    count("videos_reused")
+                    # records stored by earlier versions still hold their profile
+                    cached_quality.pop("profile", None)
+                    record(video, cached_quality)
+                    continue
+            if representative is not None:
+                print(f"{video} is a near-duplicate of {representative}.")
+                if representative in video_qualities:
+                    record_duplicate(video, representative, content_hash)
+                else:
+                    duplicates.setdefault(representative, []).append(
+                        (video, content_hash)
+                    )
+                continue
+            yield (video_id, video, video_path, content_hash)
 
-        videos_qualities_metadata.append(video_quality)
+    metrics_server = serve_metrics(metrics_port) if metrics_port is not None else None
+    try:
+        for entry, video_quality in evaluate_pending(
+            pending_entries(), num_workers, threads_per_worker, evaluate, simple_vqa
+        ):
+            _, video, _, content_hash = entry
+            registry.observe(video_quality["profile"])
+            log_event("video_evaluated", video=video, **video_quality["profile"])
+            if store is not None and is_complete(video_quality):
+                # the profile only describes this run, not a reused result
+                store.put(
+                    content_hash,
+                    video,
+                    {
+                        metric: value
+                        for metric, value in video_quality.items()
+                        if metric != "profile"
+                    },
+                )
+            record(video, video_quality)
+            if metrics_path is not None:
+                registry.write(metrics_path)
+    finally:
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        if metrics_path is not None:
+            registry.write(metrics_path)
+        log_event("evaluation_finished", **registry.as_dict())
+        if store is not None:
+            store.close()
+        if own_video_index:
+            video_index.close()
+        if ordered_writer is not None:
+            ordered_writer.close()
 
+    if writer is not None:
+        if columns_path is not None:
+            export_structured_array(writer.path, columns_path)
+        return
+
+    videos_qualities_metadata = []
+    for video in evaluated_videos:
+        video_quality = video_qualities[video]
+        if video in video_sources:
+            video_quality = {**video_quality, "source": video_sources[video]}
+        videos_qualities_metadata.append({video: video_quality})
     save_json(videos_qualities_metadata, OUT_PATH)
@@ -0,0 +1,208 @@
+from constants.video_quality_eval.constants import (
+    DEDUP_FRAMES,
+    DEDUP_MAX_DISTANCE,
+    DEDUP_DURATION_TOLERANCE,
+    DEDUP_BITRATE_TOLERANCE,
+    DEDUP_SHARPNESS_TOLERANCE,
+)
+from src.video_quality_eval.frame_pipeline import (
+    FrameConsumer,
+    UniformFrames,
+    run_consumers,
+)
+from src.video_quality_eval.instrumentation import profiled
+from collections import namedtuple
+import bisect
+import cv2
+import numpy as np
+import os
+
+Fingerprint = namedtuple(
+    "Fingerprint", ["duration", "resolution", "bitrate", "sharpness", "hashes"]
+)
+
+
+def dhash(gray_frame, hash_size=8):
+    """
+    Computes the difference hash of a grayscale frame: the frame is shrunk to
+    (hash_size + 1) x hash_size pixels and every bit tells whether a pixel is brighter
+    than its right neighbour. Rescaling, re-encoding and small crops barely change it.
+
+    Args:
+        gray_frame (np.ndarray): Grayscale frame.
+        hash_size (int): Number of bits per row and of rows.
+
+    Returns:
+        np.ndarray: The hash, hash_size * hash_size bits packed into uint8.
+    """
+    small = cv2.resize(
+        gray_frame, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA
+    )
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+class DHashConsumer(FrameConsumer):
+    """
+    Collects the difference hash, the variance of the Laplacian and the resolution of
+    every frame it is fed.
+    """
+
+    stage = "dhash"
+
+    def __init__(self):
+        self.hashes = []
+        self.laplacian_values = []
+        self.resolution = None
+
+    def consume(self, frame_idx, frame):
+        gray = frame.gray
+        self.hashes.append(dhash(gray))
+        self.laplacian_values.append(cv2.Laplacian(gray, cv2.CV_64F).var())
+        self.resolution = gray.shape
+
+    def result(self):
+        return np.stack(self.hashes) if self.hashes else None
+
+
+def video_fingerprint(video_path, num_frames=DEDUP_FRAMES):
+    """
+    Fingerprints a video by its duration, resolution and bitrate, and by the difference
+    hashes and mean variance of the Laplacian of `num_frames` frames spread uniformly
+    over it. Only those frames are decoded.
+
+    Args:
+        video_path (str): Path to the video file.
+        num_frames (int): Number of hashed frames.
+
+    Returns:
+        Fingerprint: The fingerprint; its hashes hold one packed hash per sampled
+            frame, and are None if no frame was decoded.
+    """
+    consumer = DHashConsumer()
+    with profiled("fingerprint"):
+        video_info = run_consumers(
+            video_path, consumer, sampler=UniformFrames(num_frames)
+        )
+    duration = video_info.frame_count / max(video_info.fps, 1)
+    bitrate = os.path.getsize(video_path) * 8 / max(duration, 1e-6)
+    sharpness = (
+        float(np.mean(consumer.laplacian_values)) if consumer.laplacian_values else 0.0
+    )
+    return Fingerprint(
+        duration, consumer.resolution, bitrate, sharpness, consumer.result()
+    )
+
+
+def fingerprint_distance(hashes, other_hashes):
+    """
+    Mean number of differing bits between the frame hashes of two fingerprints.
+    """
+    count = min(len(hashes), len(other_hashes))
+    differing = np.unpackbits(hashes[:count] ^ other_hashes[:count], axis=1)
+    return differing.sum(axis=1).mean()
+
+
+def relative_difference(value, other_value):
+    """
+    Difference of two non-negative values relative to the larger one.
+    """
+    return abs(value - other_value) / max(value, other_value, 1e-12)
+
+
+class NearDuplicateIndex:
+    """
+    Groups copies of the same video, such as re-uploads of the same clip, by fingerprint.
+
+    Videos are added one at a time; each is either matched to the representative of
+    an earlier group or becomes the representative of a new one. The representative's
+    quality scores are copied to the group, so a video only matches when it has the
+    same content hash, or when the two share a resolution, their durations differ by at
+    most `duration_tolerance` seconds, their bitrates and mean variances of the
+    Laplacian by at most `bitrate_tolerance` and `sharpness_tolerance` of the larger
+    one, and their sampled frame hashes by at most `max_distance` bits on average. The
+    frame hashes alone also match blurred or downscaled copies, which score differently.
+
+    Args:
+        num_frames (int): Number of hashed frames per video.
+        max_distance (float): Maximum mean Hamming distance between frame hashes.
+        duration_tolerance (float): Maximum difference in duration, in seconds.
+        bitrate_tolerance (float): Maximum relative difference in bitrate.
+        sharpness_tolerance (float): Maximum relative difference in the mean variance
+            of the Laplacian.
+    """
+
+    def __init__(
+        self,
+        num_frames=DEDUP_FRAMES,
+        max_distance=DEDUP_MAX_DISTANCE,
+        duration_tolerance=DEDUP_DURATION_TOLERANCE,
+        bitrate_tolerance=DEDUP_BITRATE_TOLERANCE,
+        sharpness_tolerance=DEDUP_SHARPNESS_TOLERANCE,
+    ):
+        self.num_frames = num_frames
+        self.max_distance = max_distance
+        self.duration_tolerance = duration_tolerance
+        self.bitrate_tolerance = bitrate_tolerance
+        self.sharpness_tolerance = sharpness_tolerance
+        # content hash -> representative
+        self.content_hashes = {}
+        # representatives sorted by duration: (duration, video, fingerprint)
+        self.durations = []
+        self.representatives = []
+
+    def matches(self, fingerprint, other_fingerprint):
+        """
+        Whether two fingerprints belong to copies of the same video of the same quality.
+        """
+        return (
+            fingerprint.resolution == other_fingerprint.resolution
+            and relative_difference(fingerprint.bitrate, other_fingerprint.bitrate)
+            <= self.bitrate_tolerance
+            and relative_difference(fingerprint.sharpness, other_fingerprint.sharpness)
+            <= self.sharpness_tolerance
+        )
+
+    def match(self, video, video_path, content_hash=None):
+        """
+        Finds the representative of the group a video belongs to.
+
+        Args:
+            video (str): Name of the video.
+            video_path (str): Path to the video file.
+            content_hash (str): Content hash of the video when known.
+
+        Returns:
+            str: Name of the representative, or None if the video starts a new group.
+        """
+        if content_hash is not None and content_hash in self.content_hashes:
+            return self.content_hashes[content_hash]
+        try:
+            fingerprint = video_fingerprint(video_path, self.num_frames)
+        except Exception:
+            # unreadable videos are left for the evaluation to report
+            return None
+        if fingerprint.hashes is None:
+            return None
+
+        duration = fingerprint.duration
+        start = bisect.bisect_left(self.durations, duration - self.duration_tolerance)
+        end = bisect.bisect_right(self.durations, duration + self.duration_tolerance)
+        candidates = [
+            (
+                fingerprint_distance(fingerprint.hashes, other_fingerprint.hashes),
+                other_video,
+            )
+            for _, other_video, other_fingerprint in self.representatives[start:end]
+            if self.matches(fingerprint, other_fingerprint)
+        ]
+        if candidates:
+            distance, representative = min(candidates)
+            if distance <= self.max_distance:
+                return representative
+
+        if content_hash is not None:
+            self.content_hashes[content_hash] = video
+        position = bisect.bisect(self.durations, duration)
+        self.durations.insert(position, duration)
+        self.representatives.insert(position, (duration, video, fingerprint))
+        return None
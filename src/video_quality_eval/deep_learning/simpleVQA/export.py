@@ -0,0 +1,285 @@
+from constants.video_quality_eval.constants import MODEL_PATH, EXPORT_DIR
+from src.video_quality_eval.deep_learning.simpleVQA.infer import (
+    MotionFramesConsumer,
+    SimpleVQAScorer,
+    SpatialFramesConsumer,
+    pack_pathway_output,
+)
+from src.video_quality_eval.deep_learning.simpleVQA.runtime import (
+    BACKENDS,
+    EXPORTED_FILES,
+    METADATA_FILE,
+    load_runtime,
+)
+from src.hashing import file_content_hash
+import inspect
+import json
+import os
+import torch
+import torch.nn as nn
+
+
+class SpatialBackbone(nn.Module):
+    """
+    The ResNet backbone of SimpleVQA up to the pooled features, `frames` x 7168.
+    """
+
+    def __init__(self, model):
+        super(SpatialBackbone, self).__init__()
+        self.model = model
+
+    def forward(self, frames):
+        return self.model.spatial_features(frames.unsqueeze(dim=0))[0]
+
+
+class MotionBackbone(nn.Module):
+    """
+    The SlowFast feature extractor, returning the concatenated slow and fast
+    features of every clip, `clips` x (2048 + 256).
+    """
+
+    def __init__(self, model_motion):
+        super(MotionBackbone, self).__init__()
+        self.model_motion = model_motion
+
+    def forward(self, slow_pathway, fast_pathway):
+        slow_feature, fast_feature = self.model_motion([slow_pathway, fast_pathway])
+        return torch.cat(
+            [slow_feature.flatten(start_dim=1), fast_feature.flatten(start_dim=1)],
+            dim=1,
+        )
+
+
+class RegressionHead(nn.Module):
+    """
+    The regression head of SimpleVQA, scoring one video from its backbone features.
+    """
+
+    def __init__(self, model):
+        super(RegressionHead, self).__init__()
+        self.model = model
+
+    def forward(self, feature_spatial, feature_motion):
+        return self.model.regress(
+            feature_spatial.unsqueeze(dim=0), feature_motion.unsqueeze(dim=0)
+        )
+
+
+def example_inputs(num_frames=2):
+    """
+    Dummy inputs of every exported graph for `num_frames` key frames and clips.
+    """
+    frames = torch.rand(
+        num_frames,
+        3,
+        SpatialFramesConsumer.video_height_crop,
+        SpatialFramesConsumer.video_width_crop,
+    )
+    clips = torch.rand(num_frames, 3, MotionFramesConsumer.video_length_clip, 224, 224)
+    slow_pathway, fast_pathway = pack_pathway_output(clips, torch.device("cpu"))
+    return {
+        "spatial": (frames,),
+        "motion": (slow_pathway, fast_pathway),
+        "head": (
+            torch.rand(num_frames, 2 * (2048 + 1024 + 512)),
+            torch.rand(num_frames, 2048 + 256),
+        ),
+    }
+
+
+# graph input and output names, with the frames or clips axis left dynamic
+GRAPH_INPUTS = {
+    "spatial": ["frames"],
+    "motion": ["slow_pathway", "fast_pathway"],
+    "head": ["feature_spatial", "feature_motion"],
+}
+GRAPH_OUTPUTS = {
+    "spatial": "feature_spatial",
+    "motion": "feature_motion",
+    "head": "score",
+}
+
+
+def eager_modules(scorer):
+    """
+    The eager networks of a scorer, wrapped as the three graphs that are exported.
+    """
+    return {
+        "spatial": SpatialBackbone(scorer.model).eval(),
+        "motion": MotionBackbone(scorer.model_motion).eval(),
+        "head": RegressionHead(scorer.model).eval(),
+    }
+
+
+def onnx_export_options():
+    """
+    Keyword arguments keeping `torch.onnx.export` on the TorchScript-based exporter,
+    which newer torch versions replace by default with the dynamo exporter.
+    """
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        return {"dynamo": False}
+    return {}
+
+
+def export_graphs(
+    modules,
+    export_dir,
+    model_version,
+    formats=("torchscript", "onnx"),
+    opset_version=14,
+):
+    """
+    Exports the three SimpleVQA graphs and writes the `export.json` runtimes check.
+
+    Args:
+        modules (dict): The eager modules by graph name, as from `eager_modules`.
+        export_dir (str): Directory the graphs are written to.
+        model_version (str): Content hash of the checkpoint the modules come from.
+        formats (tuple): "torchscript" and/or "onnx".
+        opset_version (int): ONNX opset to export to. 14 is the newest the pinned
+            torch supports.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    inputs = example_inputs()
+
+    for export_format in formats:
+        for name, module in modules.items():
+            path = os.path.join(export_dir, EXPORTED_FILES[export_format][name])
+            print(f"Exporting {path}...")
+            with torch.no_grad():
+                if export_format == "torchscript":
+                    traced = torch.jit.trace(module, inputs[name], check_trace=False)
+                    torch.jit.save(torch.jit.freeze(traced), path)
+                elif export_format == "onnx":
+                    torch.onnx.export(
+                        module,
+                        inputs[name],
+                        path,
+                        input_names=GRAPH_INPUTS[name],
+                        output_names=[GRAPH_OUTPUTS[name]],
+                        dynamic_axes={
+                            input_name: {0: "frames"}
+                            for input_name in GRAPH_INPUTS[name]
+                        },
+                        opset_version=opset_version,
+                        **onnx_export_options(),
+                    )
+                else:
+                    raise ValueError(f"Unknown export format: {export_format}")
+
+    metadata = {
+        "model_version": model_version,
+        "formats": list(formats),
+    }
+    with open(os.path.join(export_dir, METADATA_FILE), "w") as json_file:
+        json.dump(metadata, json_file, indent=4)
+
+
+def export_models(
+    export_dir=EXPORT_DIR,
+    model_path=MODEL_PATH,
+    formats=("torchscript", "onnx"),
+    opset_version=14,
+):
+    """
+    Exports the SimpleVQA networks of a checkpoint as three graphs: the spatial
+    backbone, the SlowFast feature extractor and the regression head, kept apart so
+    cached backbone features can still be scored by the head alone.
+
+    TorchScript graphs are traced and frozen; ONNX graphs keep the frames and clips
+    axis dynamic. An `export.json` records the checkpoint hash, so runtimes refuse
+    graphs exported from another checkpoint.
+
+    Args:
+        export_dir (str): Directory the graphs are written to.
+        model_path (str): Path to the SimpleVQA checkpoint.
+        formats (tuple): "torchscript" and/or "onnx".
+        opset_version (int): ONNX opset to export to.
+    """
+    scorer = SimpleVQAScorer(
+        model_path,
+        device=torch.device("cpu"),
+        backbone_precision="fp32",
+        quantize_head=False,
+        channels_last=False,
+        backend="eager",
+    )
+    export_graphs(
+        eager_modules(scorer),
+        export_dir,
+        file_content_hash(model_path),
+        formats,
+        opset_version,
+    )
+
+
+def compare_graphs(eager, runtime, num_frames=3, atol=1e-3):
+    """
+    Runs the eager modules and the exported graphs of a runtime on the same random
+    inputs, with another number of frames than the export was traced with.
+
+    Args:
+        eager (dict): The eager modules by graph name, as from `eager_modules`.
+        runtime (TorchScriptRuntime or OnnxRuntime): The loaded exported graphs.
+        num_frames (int): Number of key frames and clips in the test inputs.
+        atol (float): Largest accepted absolute difference, relative to the largest
+            absolute eager output.
+
+    Returns:
+        dict: Maximum absolute difference per graph, and whether all are within `atol`.
+    """
+    exported = {
+        "spatial": runtime.spatial,
+        "motion": runtime.motion,
+        "head": runtime.head,
+    }
+
+    differences = {}
+    matches = True
+    with torch.no_grad():
+        for name, inputs in example_inputs(num_frames).items():
+            expected = eager[name](*inputs)
+            actual = exported[name](*inputs)
+            difference = (actual.float() - expected).abs().max().item()
+            differences[name] = difference
+            matches &= difference <= atol * max(1.0, expected.abs().max().item())
+    return {"max_abs_difference": differences, "matches": matches}
+
+
+def verify_export(
+    backend, export_dir=EXPORT_DIR, model_path=MODEL_PATH, num_frames=3, atol=1e-3
+):
+    """
+    Checks that the exported graphs of a backend match the eager networks on random
+    inputs, with another number of frames than the export was traced with.
+
+    Args:
+        backend (str): "torchscript" or "onnxruntime".
+        export_dir (str): Directory holding the exported graphs.
+        model_path (str): Path to the SimpleVQA checkpoint.
+        num_frames (int): Number of key frames and clips in the test inputs.
+        atol (float): Largest accepted absolute difference, relative to the largest
+            absolute eager output.
+
+    Returns:
+        dict: Maximum absolute difference per graph, and whether all are within `atol`.
+    """
+    device = torch.device("cpu")
+    scorer = SimpleVQAScorer(
+        model_path,
+        device=device,
+        backbone_precision="fp32",
+        quantize_head=False,
+        channels_last=False,
+        backend="eager",
+    )
+    runtime = load_runtime(backend, file_content_hash(model_path), device, export_dir)
+    result = compare_graphs(eager_modules(scorer), runtime, num_frames, atol)
+    return {"backend": backend, **result}
+
+
+def backends_for(formats):
+    """
+    The runtime backends able to run graphs exported in `formats`.
+    """
+    return [backend for backend, fmt in BACKENDS.items() if fmt in formats]
@@ -0,0 +1,105 @@
+from constants.video_quality_eval.constants import FEATURE_CACHE_DIR
+from src.hashing import file_content_hash
+from src.video_quality_eval.instrumentation import count, profiled
+import hashlib
+import os
+import numpy as np
+import torch
+
+# bump when the preprocessing or the feature extractors change
+FEATURES_VERSION = "2"
+
+
+def backbone_version(state_dict, precision="fp32"):
+    """
+    Hashes every weight of a SimpleVQA checkpoint except the `quality` regression head,
+    so checkpoints that only differ in their head share cached features.
+
+    Args:
+        state_dict (dict): State dict of the SimpleVQA ResNet, without "module." prefixes.
+        precision (str): Precision the backbones run in, which changes their features.
+
+    Returns:
+        str: Hex digest identifying the backbone.
+    """
+    digest = hashlib.sha256(f"slowfast_r50:{FEATURES_VERSION}".encode())
+    if precision != "fp32":
+        digest.update(precision.encode())
+    for name in sorted(state_dict):
+        if name.startswith("quality."):
+            continue
+        digest.update(name.encode())
+        digest.update(state_dict[name].detach().cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    Per-video cache of the SimpleVQA backbone outputs: the pooled ResNet features of
+    every key frame and the SlowFast features of every motion clip.
+
+    With both cached, scoring a video again, e.g. with a retrained regression head,
+    only runs the small `quality` MLP. Entries are compressed `.npz` files keyed by the
+    video's content hash and the backbone hash of the checkpoint.
+
+    Args:
+        cache_dir (str): Directory holding the cached features.
+        variant (str): Extra key part for anything else that changes the inputs, such
+            as frames read downscaled from a frame cache.
+    """
+
+    def __init__(self, cache_dir=FEATURE_CACHE_DIR, variant=""):
+        self.cache_dir = cache_dir
+        self.variant = variant
+
+    def video_hash(self, video_path):
+        with profiled("hash"):
+            return file_content_hash(video_path)
+
+    def entry_path(self, video_hash, backbone_hash):
+        key = f"{video_hash}:{backbone_hash}:{self.variant}"
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{digest}.npz")
+
+    def load(self, video_hash, backbone_hash):
+        """
+        Looks up the cached features of a video.
+
+        Args:
+            video_hash (str): Content hash of the video.
+            backbone_hash (str): Backbone hash of the checkpoint.
+
+        Returns:
+            tuple: Spatial features (frames x 7168) and motion features
+                (clips x 2304) as tensors, or None on a cache miss.
+        """
+        path = self.entry_path(video_hash, backbone_hash)
+        try:
+            with profiled("feature_cache_read"), np.load(path) as features:
+                spatial, motion = features["spatial"], features["motion"]
+        except (OSError, KeyError, ValueError):
+            count("feature_cache_misses")
+            return None
+        count("feature_cache_hits")
+        return torch.from_numpy(spatial), torch.from_numpy(motion)
+
+    def save(self, video_hash, backbone_hash, spatial, motion):
+        """
+        Stores the features of a video.
+
+        Args:
+            video_hash (str): Content hash of the video.
+            backbone_hash (str): Backbone hash of the checkpoint.
+            spatial (torch.Tensor): Pooled ResNet features, frames x 7168.
+            motion (torch.Tensor): SlowFast features, clips x 2304.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.entry_path(video_hash, backbone_hash)
+        tmp_path = f"{path[: -len('.npz')]}.{os.getpid()}.tmp.npz"
+        with profiled("feature_cache_write"):
+            np.savez_compressed(
+                tmp_path,
+                spatial=spatial.detach().cpu().numpy(),
+                motion=motion.detach().cpu().numpy(),
+            )
+            os.replace(tmp_path, path)
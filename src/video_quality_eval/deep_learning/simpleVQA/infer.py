@@ -1,73 +1,110 @@
-from constants.video_quality_eval.constants import MODEL_PATH
+from constants.video_quality_eval.constants import (
+    MODEL_PATH,
+    MOTION_BATCH_SIZE,
+    BACKBONE_PRECISION,
+    QUANTIZE_REGRESSION_HEAD,
+    CHANNELS_LAST,
+    VQA_BACKEND,
+)
+from collections import deque
+from concurrent.futures import Future
 from pytorchvideo.models.hub import slowfast_r50
-from torchvision import transforms
-from PIL import Image
+from src.video_quality_eval.deep_learning.simpleVQA.feature_cache import (
+    backbone_version,
+)
+from src.video_quality_eval.deep_learning.simpleVQA.preprocessing import (
+    IMAGENET_MEAN,
+    IMAGENET_STD,
+    KINETICS_MEAN,
+    KINETICS_STD,
+    normalize_frames,
+    resize_frame,
+)
+from src.video_quality_eval.deep_learning.simpleVQA.runtime import load_runtime
+from src.video_quality_eval.frame_pipeline import FrameConsumer, run_consumers
+from src.hashing import file_content_hash
+from src.video_quality_eval.instrumentation import count, log_event, profiled
 import src.video_quality_eval.deep_learning.simpleVQA.ugc_bvqa_model as UGC_BVQA_model
+import numpy as np
 import torch
 import torch.nn as nn
-import cv2
+import torch.nn.functional as F
 
 
-def video_processing_spatial(dist):
-
-    video_name = dist
-    video_name_dis = video_name
+class SpatialFramesConsumer(FrameConsumer):
+    """
+    Collects one transformed RGB key frame per second for the spatial branch.
 
-    video_capture = cv2.VideoCapture()
-    video_capture.open(video_name)
-    cap = cv2.VideoCapture(video_name)
+    Key frames are resized and center cropped as uint8 pixels, and the whole batch is
+    normalized at once when the video ends.
+    """
 
     video_channel = 3
-
+    video_height_resize = 520
     video_height_crop = 448
     video_width_crop = 448
 
-    video_length = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    video_frame_rate = int(round(cap.get(cv2.CAP_PROP_FPS)))
-
-    video_length_read = int(video_length / video_frame_rate)
-
-    transformations = transforms.Compose(
-        [
-            transforms.Resize(520),
-            transforms.CenterCrop(448),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ]
-    )
-
-    transformed_video = torch.zeros(
-        [video_length_read, video_channel, video_height_crop, video_width_crop]
-    )
-
-    video_read_index = 0
-    frame_idx = 0
-
-    for i in range(video_length):
-        has_frames, frame = video_capture.read()
-        if has_frames:
-
-            # key frame
-            if (video_read_index < video_length_read) and (
-                frame_idx % video_frame_rate == 0
-            ):
-
-                read_frame = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                read_frame = transformations(read_frame)
-                transformed_video[video_read_index] = read_frame
-                video_read_index += 1
+    def start(self, video_info):
+        super().start(video_info)
+        self.video_length_read = int(video_info.frame_count / video_info.fps)
+        self.key_frames = np.empty(
+            [
+                self.video_length_read,
+                self.video_height_crop,
+                self.video_width_crop,
+                self.video_channel,
+            ],
+            dtype=np.uint8,
+        )
+        self.transformed_video = torch.zeros(
+            [
+                self.video_length_read,
+                self.video_channel,
+                self.video_height_crop,
+                self.video_width_crop,
+            ]
+        )
+        self.video_read_index = 0
 
-            frame_idx += 1
+    def consume(self, frame_idx, frame):
+        if frame_idx >= self.video_info.frame_count:
+            return
 
-    if video_read_index < video_length_read:
-        for i in range(video_read_index, video_length_read):
-            transformed_video[i] = transformed_video[video_read_index - 1]
+        # key frame
+        if (self.video_read_index < self.video_length_read) and (
+            frame_idx % self.video_info.fps == 0
+        ):
+            with profiled("preprocess_spatial"):
+                resize_frame(
+                    frame.bgr,
+                    self.video_height_resize,
+                    crop=self.video_height_crop,
+                    out=self.key_frames[self.video_read_index],
+                )
+            self.video_read_index += 1
+
+    def finish(self):
+        with profiled("preprocess_spatial"):
+            normalize_frames(
+                self.key_frames[: self.video_read_index],
+                IMAGENET_MEAN,
+                IMAGENET_STD,
+                out=self.transformed_video[: self.video_read_index],
+            )
+        if self.video_read_index < self.video_length_read:
+            for i in range(self.video_read_index, self.video_length_read):
+                self.transformed_video[i] = self.transformed_video[
+                    self.video_read_index - 1
+                ]
 
-    video_capture.release()
+    def result(self):
+        return self.transformed_video
 
-    video = transformed_video
 
-    return video, video_name_dis
+def video_processing_spatial(dist):
+    consumer = SpatialFramesConsumer()
+    run_consumers(dist, consumer)
+    return consumer.result(), dist
 
 
 def pack_pathway_output(frames, device):
@@ -94,11 +131,43 @@ def pack_pathway_output(frames, device):
     return frame_list
 
 
+class ClipBatchNorm3d(nn.Module):
+    """
+    Normalizes every clip with its own statistics, which is what the SlowFast feature
+    extractor has always done since it was never switched to eval mode. Unlike a
+    BatchNorm3d left in training mode, it never updates running statistics and its
+    output does not depend on which other clips share the batch.
+
+    Args:
+        batch_norm (nn.BatchNorm3d): The layer whose affine parameters are reused.
+    """
+
+    def __init__(self, batch_norm):
+        super(ClipBatchNorm3d, self).__init__()
+        self.eps = batch_norm.eps
+        self.weight = batch_norm.weight
+        self.bias = batch_norm.bias
+
+    def forward(self, x):
+        return F.instance_norm(x, weight=self.weight, bias=self.bias, eps=self.eps)
+
+
+def replace_batch_norm(module):
+    """
+    Recursively swaps every BatchNorm3d in `module` for a `ClipBatchNorm3d`.
+    """
+    for name, child in module.named_children():
+        if isinstance(child, nn.BatchNorm3d):
+            setattr(module, name, ClipBatchNorm3d(child))
+        else:
+            replace_batch_norm(child)
+
+
 class slowfast(torch.nn.Module):
-    def __init__(self):
+    def __init__(self, pretrained=True):
         super(slowfast, self).__init__()
         slowfast_pretrained_features = nn.Sequential(
-            *list(slowfast_r50(pretrained=True).children())[0]
+            *list(slowfast_r50(pretrained=pretrained).children())[0]
         )
 
         self.feature_extraction = torch.nn.Sequential()
@@ -119,6 +188,8 @@ class slowfast(torch.nn.Module):
             "adp_avg_pool", slowfast_pretrained_features[6].output_pool
         )
 
+        replace_batch_norm(self.feature_extraction)
+
     def forward(self, x):
         with torch.no_grad():
             x = self.feature_extraction(x)
@@ -132,125 +203,651 @@ class slowfast(torch.nn.Module):
         return slow_feature, fast_feature
 
 
-def video_processing_motion(dist):
-    video_name = dist
-    video_name_dis = video_name
+class MotionFramesConsumer(FrameConsumer):
+    """
+    Builds the 32-frame clips of the motion branch while the video is being decoded.
 
-    video_capture = cv2.VideoCapture()
-    video_capture.open(video_name)
-    cap = cv2.VideoCapture(video_name)
+    Clip `i` covers frames `i * fps` to `i * fps + 31`. Only the last 32 resized uint8
+    frames are kept in a ring buffer, and each clip is normalized and handed to
+    `clip_sink` as soon as its last frame arrives, so memory stays bounded by one clip
+    whatever the video length.
+
+    Args:
+        clip_sink (callable): Called with every completed clip (32 x 3 x 224 x 224).
+            Its return values are collected by `result`. Defaults to keeping the clip.
+    """
 
     video_channel = 3
+    video_clip_min = 8
+    video_length_clip = 32
+    video_size_resize = [224, 224]
 
-    video_length = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    video_frame_rate = int(round(cap.get(cv2.CAP_PROP_FPS)))
+    def __init__(self, clip_sink=None):
+        self.clip_sink = clip_sink if clip_sink is not None else (lambda clip: clip)
 
-    video_clip = int(video_length / video_frame_rate)
+    def start(self, video_info):
+        super().start(video_info)
+        self.video_clip = int(video_info.frame_count / video_info.fps)
+        self.frame_buffer = deque(maxlen=self.video_length_clip)
+        self.last_frame = None
+        self.next_clip = 0
+        self.clip_outputs = []
 
-    video_clip_min = 8
+    def clip_start(self, clip_idx):
+        return clip_idx * self.video_info.fps
 
-    video_length_clip = 32
+    def consume(self, frame_idx, frame):
+        if frame_idx >= self.video_info.frame_count:
+            return
+        self.last_frame = (frame_idx, frame)
 
-    transformed_frame_all = torch.zeros([video_length, video_channel, 224, 224])
-    transform = transforms.Compose(
-        [
-            transforms.Resize([224, 224]),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.45, 0.45, 0.45], std=[0.225, 0.225, 0.225]),
-        ]
-    )
+        # frames before the next pending clip (gaps when fps > 32) are never used
+        if self.next_clip >= self.video_clip or frame_idx < self.clip_start(
+            self.next_clip
+        ):
+            return
 
-    transformed_video_all = []
+        with profiled("preprocess_motion"):
+            read_frame = resize_frame(frame.bgr, self.video_size_resize)
+        self.frame_buffer.append((frame_idx, read_frame))
+        if frame_idx == self.clip_start(self.next_clip) + self.video_length_clip - 1:
+            self.emit_clip()
+
+    def emit_clip(self):
+        start = self.clip_start(self.next_clip)
+        frames = [read_frame for idx, read_frame in self.frame_buffer if idx >= start]
+
+        # clips running past the last decoded frame repeat it
+        if len(frames) < self.video_length_clip:
+            last_idx, last_frame = self.last_frame
+            if not self.frame_buffer or self.frame_buffer[-1][0] != last_idx:
+                self.frame_buffer.append(
+                    (last_idx, resize_frame(last_frame.bgr, self.video_size_resize))
+                )
+            last_read = self.frame_buffer[-1][1]
+            frames.extend([last_read] * (self.video_length_clip - len(frames)))
+
+        with profiled("preprocess_motion"):
+            clip = normalize_frames(np.stack(frames), KINETICS_MEAN, KINETICS_STD)
+        self.clip_outputs.append(self.clip_sink(clip))
+        self.next_clip += 1
+
+    def finish(self):
+        if self.last_frame is None:
+            return
+        while self.next_clip < self.video_clip:
+            self.emit_clip()
+        self.frame_buffer.clear()
 
-    video_read_index = 0
-    for i in range(video_length):
-        has_frames, frame = video_capture.read()
-        if has_frames:
-            read_frame = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            read_frame = transform(read_frame)
-            transformed_frame_all[video_read_index] = read_frame
-            video_read_index += 1
+    def result(self):
+        clip_outputs = list(self.clip_outputs)
+        if len(clip_outputs) < self.video_clip_min:
+            for i in range(len(clip_outputs), self.video_clip_min):
+                clip_outputs.append(clip_outputs[-1])
 
-    if video_read_index < video_length:
-        for i in range(video_read_index, video_length):
-            transformed_frame_all[i] = transformed_frame_all[video_read_index - 1]
+        return clip_outputs
 
-    video_capture.release()
 
-    for i in range(video_clip):
-        transformed_video = torch.zeros([video_length_clip, video_channel, 224, 224])
-        if (i * video_frame_rate + video_length_clip) <= video_length:
-            transformed_video = transformed_frame_all[
-                i * video_frame_rate : (i * video_frame_rate + video_length_clip)
-            ]
-        else:
-            transformed_video[: (video_length - i * video_frame_rate)] = (
-                transformed_frame_all[i * video_frame_rate :]
-            )
-            for j in range((video_length - i * video_frame_rate), video_length_clip):
-                transformed_video[j] = transformed_video[
-                    video_length - i * video_frame_rate - 1
-                ]
-        transformed_video_all.append(transformed_video)
+def video_processing_motion(dist):
+    consumer = MotionFramesConsumer()
+    run_consumers(dist, consumer)
+    return consumer.result(), dist
 
-    if video_clip < video_clip_min:
-        for i in range(video_clip, video_clip_min):
-            transformed_video_all.append(transformed_video_all[video_clip - 1])
 
-    return transformed_video_all, video_name_dis
+class SimpleVQAConsumer(FrameConsumer):
+    """
+    Feeds both SimpleVQA branches from a shared decode pass and scores the video on `result`.
 
+    Motion clips are queued on the scorer's `ClipBatcher` as soon as they are complete,
+    so only their features are kept. A failure in either branch is reported by `result` and never
+    interrupts the other consumers of the pipeline. With a feature cache holding the
+    video's backbone features, the frames are ignored and only the regression head runs.
 
-def simple_vqa_infer(video_path):
-    try:
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Processing on {device}")
+    Args:
+        scorer (SimpleVQAScorer): Scorer holding the loaded networks. Defaults to the
+            process-wide scorer returned by `get_scorer`.
+        feature_cache (FeatureCache): Optional cache the backbone features are read
+            from or written to.
+        video_hash (str): Content hash of the video when already known, so the
+            feature cache lookup does not hash the file again.
+    """
 
-        model_motion = slowfast()
-        model_motion = model_motion.to(device)
+    stage = "simple_vqa"
 
-        model = UGC_BVQA_model.resnet50(pretrained=False)
-        model = torch.nn.DataParallel(model)
-        model = model.to(device=device)
+    def __init__(self, scorer=None, feature_cache=None, video_hash=None):
+        self.scorer = scorer
+        self.feature_cache = feature_cache
+        self.video_hash = video_hash
+        self.looked_up = False
+        self.cached_features = None
+        self.spatial = SpatialFramesConsumer()
+        self.motion = None
+        self.error = None
 
+    def start(self, video_info):
+        super().start(video_info)
         try:
-            model.load_state_dict(
-                torch.load(MODEL_PATH, map_location=torch.device(device))
+            if self.scorer is None:
+                self.scorer = get_scorer()
+            if self.load_cached_features(video_info.path):
+                return
+            self.motion = MotionFramesConsumer(self.scorer.batcher.submit)
+            self.spatial.start(video_info)
+            self.motion.start(video_info)
+        except Exception as e:
+            self.error = e
+
+    def load_cached_features(self, video_path):
+        """
+        Looks the video up in the feature cache, once, and returns whether it was found.
+        """
+        if self.feature_cache is None:
+            return False
+        if not self.looked_up:
+            if self.scorer is None:
+                self.scorer = get_scorer()
+            if self.video_hash is None:
+                self.video_hash = self.feature_cache.video_hash(video_path)
+            self.cached_features = self.feature_cache.load(
+                self.video_hash, self.scorer.backbone_version
             )
+            self.looked_up = True
+        return self.cached_features is not None
+
+    def consume(self, frame_idx, frame):
+        if self.error is not None or self.cached_features is not None:
+            return
+        try:
+            self.spatial.consume(frame_idx, frame)
+            self.motion.consume(frame_idx, frame)
         except Exception as e:
-            print(f"Error loading model state dict: {e}")
+            self.error = e
+
+    def finish(self):
+        if self.error is not None or self.cached_features is not None:
             return
+        try:
+            self.spatial.finish()
+            self.motion.finish()
+        except Exception as e:
+            self.error = e
+
+    def features_ready(self):
+        """
+        Whether every motion clip of the video has been through SlowFast already.
+        """
+        if self.error is not None or self.cached_features is not None:
+            return True
+        return all(feature.done() for feature in self.motion.clip_outputs)
+
+    def result(self):
+        if self.error is not None:
+            return f"Failed to process: {self.error}"
+        try:
+            if self.cached_features is not None:
+                return self.scorer.regress(*self.cached_features)
+            if not self.features_ready():
+                self.scorer.batcher.flush()
+            feature_motion = torch.stack(
+                [feature.result() for feature in self.motion.result()]
+            )
+            feature_spatial = self.scorer.spatial_features(self.spatial.result())
+            if self.feature_cache is not None:
+                self.feature_cache.save(
+                    self.video_hash,
+                    self.scorer.backbone_version,
+                    feature_spatial,
+                    feature_motion,
+                )
+            return self.scorer.regress(feature_spatial, feature_motion)
+        except Exception as e:
+            return f"Failed to process: {e}"
 
-        video_dist_spatial, video_name = video_processing_spatial(video_path)
-        video_dist_motion, video_name = video_processing_motion(video_path)
 
-        with torch.no_grad():
-            model.eval()
+def inference_precision(
+    backbone_precision=BACKBONE_PRECISION,
+    quantize_head=QUANTIZE_REGRESSION_HEAD,
+    channels_last=CHANNELS_LAST,
+):
+    """
+    Describes a SimpleVQA precision setting, e.g. "bf16+int8-head", for versioning
+    stored scores. The default float32 setting is the empty string.
+    """
+    parts = [backbone_precision] if backbone_precision != "fp32" else []
+    if quantize_head:
+        parts.append("int8-head")
+    if channels_last:
+        parts.append("channels-last")
+    return "+".join(parts)
 
-            video_dist_spatial = video_dist_spatial.to(device)
-            video_dist_spatial = video_dist_spatial.unsqueeze(dim=0)
 
-            n_clip = len(video_dist_motion)
-            feature_motion = torch.zeros([n_clip, 2048 + 256])
+def is_out_of_memory(error):
+    """
+    Whether a RuntimeError raised by torch comes from a failed allocation.
+    """
+    message = str(error)
+    return "out of memory" in message or "can't allocate memory" in message
+
+
+class ClipBatcher:
+    """
+    Collects motion clips, possibly from different videos, and runs them through
+    SlowFast `batch_size` at a time.
+
+    When a batch does not fit in memory the batch size is halved and the batch is
+    retried, down to a single clip.
 
-            for idx, ele in enumerate(video_dist_motion):
-                ele = ele.unsqueeze(dim=0)
-                ele = ele.permute(0, 2, 1, 3, 4)
-                ele = pack_pathway_output(ele, device)
-                ele_slow_feature, ele_fast_feature = model_motion(ele)
+    Args:
+        scorer (SimpleVQAScorer): Scorer whose SlowFast extractor runs the batches.
+        batch_size (int): Number of clips stacked into one forward pass.
+    """
 
-                ele_slow_feature = ele_slow_feature.squeeze()
-                ele_fast_feature = ele_fast_feature.squeeze()
+    def __init__(self, scorer, batch_size=MOTION_BATCH_SIZE):
+        self.scorer = scorer
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+
+    def submit(self, clip):
+        """
+        Queues a clip and runs a batch once enough clips are waiting.
+
+        Args:
+            clip (torch.Tensor): 32 frames, 32 x 3 x 224 x 224.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the (2048 + 256) clip features.
+        """
+        feature = Future()
+        self.pending.append((clip, feature))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return feature
+
+    def flush(self):
+        """
+        Runs every queued clip, resolving their futures with features or with the error.
+        """
+        while self.pending:
+            batch = self.pending[: self.batch_size]
+            try:
+                features = self.scorer.motion_features([clip for clip, _ in batch])
+            except RuntimeError as e:
+                if is_out_of_memory(e) and self.batch_size > 1:
+                    self.batch_size //= 2
+                    count("motion_batch_oom")
+                    log_event(
+                        "motion_batch_size_reduced",
+                        batch_size=self.batch_size,
+                        error=str(e),
+                    )
+                    if torch.cuda.is_available():
+                        torch.cuda.empty_cache()
+                    continue
+                self.fail(e)
+                return
+            except Exception as e:
+                self.fail(e)
+                return
+
+            del self.pending[: len(batch)]
+            for (_, feature), clip_feature in zip(batch, features):
+                feature.set_result(clip_feature)
+
+    def fail(self, error):
+        for _, feature in self.pending:
+            feature.set_exception(error)
+        self.pending = []
+
+
+class SimpleVQAScorer:
+    """
+    Loads the SimpleVQA regression model and the SlowFast feature extractor once and
+    keeps them in eval mode, so any number of videos can be scored without rebuilding
+    the networks or deserializing the checkpoint again. `backbone_version` identifies
+    everything but the regression head, for keying cached features.
 
-                ele_feature_motion = torch.cat([ele_slow_feature, ele_fast_feature])
-                ele_feature_motion = ele_feature_motion.unsqueeze(dim=0)
+    Reduced precision trades a small score drift for speed: the backbones can run
+    under bfloat16 autocast, the regression head can be dynamically quantized to int8
+    and the convolutions can use the channels-last memory format. Features and
+    scores are always returned as float32.
 
-                feature_motion[idx] = ele_feature_motion
+    With another backend than "eager", the networks run as the float32 graphs
+    exported from the same checkpoint by `export_models.py`, and the precision
+    options are ignored. Without a matching export the eager networks are used.
 
-            feature_motion = feature_motion.unsqueeze(dim=0)
-            outputs = model(video_dist_spatial, feature_motion)
+    Args:
+        model_path (str): Path to the SimpleVQA checkpoint, or None for randomly
+            initialised networks, e.g. in tests. These always run eagerly.
+        device (torch.device): Device to run on. Defaults to CUDA when available.
+        motion_batch_size (int): Number of clips stacked into one SlowFast forward.
+        backbone_precision (str): "fp32", or "bf16" to run both backbones in bfloat16.
+        quantize_head (bool): Whether to quantize the regression head's linear layers
+            to int8. Only supported on CPU.
+        channels_last (bool): Whether to run the convolutions in channels-last format.
+        backend (str): "eager", "torchscript" or "onnxruntime".
+    """
+
+    def __init__(
+        self,
+        model_path=MODEL_PATH,
+        device=None,
+        motion_batch_size=MOTION_BATCH_SIZE,
+        backbone_precision=BACKBONE_PRECISION,
+        quantize_head=QUANTIZE_REGRESSION_HEAD,
+        channels_last=CHANNELS_LAST,
+        backend=VQA_BACKEND,
+    ):
+        if device is None:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if backbone_precision not in ("fp32", "bf16"):
+            raise ValueError(f"Unsupported backbone precision: {backbone_precision}")
+        self.device = device
+        self.backbone_precision = backbone_precision
+        self.channels_last = channels_last
+        self.precision = inference_precision(
+            backbone_precision, quantize_head, channels_last
+        )
+        self.batcher = ClipBatcher(self, motion_batch_size)
+        print(f"Processing on {device}")
+
+        if model_path is not None:
+            # The checkpoint was saved from a DataParallel wrapper, which only adds a
+            # "module." prefix to every key and dispatch overhead on a single device.
+            state_dict = torch.load(model_path, map_location=device)
+            state_dict = {
+                (k[len("module.") :] if k.startswith("module.") else k): v
+                for k, v in state_dict.items()
+            }
+        else:
+            state_dict = UGC_BVQA_model.resnet50(pretrained=False).state_dict()
+
+        self.runtime = None
+        if backend != "eager" and model_path is not None:
+            try:
+                self.runtime = load_runtime(
+                    backend, file_content_hash(model_path), device
+                )
+            except (ImportError, OSError, RuntimeError, ValueError) as e:
+                print(f"Running SimpleVQA in eager mode: {e}")
+        if self.runtime is not None:
+            # the exported graphs are float32
+            self.precision = ""
+            self.backbone_version = backbone_version(state_dict)
+            self.warm_up()
+            return
+
+        self.model_motion = slowfast(pretrained=model_path is not None).to(device)
+        if channels_last:
+            self.model_motion = self.model_motion.to(
+                memory_format=torch.channels_last_3d
+            )
+        self.model_motion.eval()
+
+        self.backbone_version = backbone_version(state_dict, backbone_precision)
+        self.model = UGC_BVQA_model.resnet50(pretrained=False)
+        self.model.load_state_dict(state_dict)
+        self.model = self.model.to(device)
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        self.model.eval()
+        if quantize_head and device.type != "cpu":
+            print("Int8 quantization only runs on CPU, keeping the float32 head")
+        elif quantize_head:
+            self.model.quality = torch.ao.quantization.quantize_dynamic(
+                self.model.quality, {nn.Linear}, dtype=torch.qint8
+            )
+
+        self.warm_up()
+
+    def warm_up(self):
+        """
+        Runs both networks once on dummy input so lazy allocations and kernel selection
+        happen before the first real video.
+        """
+        clip = torch.zeros([1, 3, MotionFramesConsumer.video_length_clip, 224, 224])
+        frames = torch.zeros(
+            [
+                1,
+                1,
+                3,
+                SpatialFramesConsumer.video_height_crop,
+                SpatialFramesConsumer.video_width_crop,
+            ]
+        )
+        with torch.no_grad(), self.backbone_autocast():
+            if self.runtime is not None:
+                self.runtime.motion(*self.pathways(clip))
+                self.runtime.head(
+                    self.runtime.spatial(frames[0].to(self.device)),
+                    torch.zeros([1, 2048 + 256], device=self.device),
+                )
+                return
+            self.model_motion(self.pathways(clip))
+            self.model(
+                frames.to(self.device),
+                torch.zeros([1, 1, 2048 + 256], device=self.device),
+            )
+
+    def backbone_autocast(self):
+        """
+        Context running the backbones in the configured precision.
+        """
+        return torch.autocast(
+            device_type=self.device.type,
+            dtype=torch.bfloat16,
+            enabled=self.backbone_precision == "bf16",
+        )
+
+    def pathways(self, clips):
+        """
+        Splits a batch of clips into the SlowFast pathways on the scorer's device.
+        """
+        pathways = pack_pathway_output(clips, self.device)
+        if self.channels_last:
+            pathways = [
+                pathway.contiguous(memory_format=torch.channels_last_3d)
+                for pathway in pathways
+            ]
+        return pathways
+
+    def consumer(self, feature_cache=None, video_hash=None):
+        """
+        Returns a frame consumer bound to this scorer, for use in a shared `FramePipeline`.
+        """
+        return SimpleVQAConsumer(self, feature_cache, video_hash)
+
+    def motion_features(self, clips):
+        """
+        Extracts the SlowFast features of a batch of clips in a single forward pass.
+
+        Args:
+            clips (list): Clips of 32 frames, each 32 x 3 x 224 x 224.
+
+        Returns:
+            torch.Tensor: Concatenated slow and fast features, `clips` x (2048 + 256).
+        """
+        count("motion_clips", len(clips))
+        with profiled("motion_forward"), torch.no_grad():
+            ele = torch.stack(clips)
+            ele = ele.permute(0, 2, 1, 3, 4)
+            ele = self.pathways(ele)
+            if self.runtime is not None:
+                return self.runtime.motion(*ele).float().cpu()
+            with self.backbone_autocast():
+                ele_slow_feature, ele_fast_feature = self.model_motion(ele)
+
+            ele_slow_feature = ele_slow_feature.flatten(start_dim=1)
+            ele_fast_feature = ele_fast_feature.flatten(start_dim=1)
+
+            features = torch.cat([ele_slow_feature, ele_fast_feature], dim=1)
+            return features.float().cpu()
+
+    def spatial_features(self, video_dist_spatial):
+        """
+        Runs the ResNet backbone over preprocessed spatial key frames.
+
+        Args:
+            video_dist_spatial (torch.Tensor): Key frames, `frames` x 3 x 448 x 448.
+
+        Returns:
+            torch.Tensor: Pooled features of every key frame, `frames` x 7168, on CPU.
+        """
+        count("spatial_frames", len(video_dist_spatial))
+        with profiled("spatial_forward"), torch.no_grad():
+            video_dist_spatial = video_dist_spatial.to(self.device)
+            if self.runtime is not None:
+                return self.runtime.spatial(video_dist_spatial).float().cpu()
+            if self.channels_last:
+                video_dist_spatial = video_dist_spatial.contiguous(
+                    memory_format=torch.channels_last
+                )
+            video_dist_spatial = video_dist_spatial.unsqueeze(dim=0)
+            with self.backbone_autocast():
+                features = self.model.spatial_features(video_dist_spatial)[0]
+            return features.float().cpu()
+
+    def regress(self, feature_spatial, feature_motion):
+        """
+        Runs the regression head on the backbone features of a video.
+
+        Args:
+            feature_spatial (torch.Tensor): Pooled ResNet features, `frames` x 7168.
+            feature_motion (torch.Tensor): SlowFast features, `clips` x (2048 + 256).
+
+        Returns:
+            float: The predicted quality score.
+        """
+        device = self.device
+        with profiled("regress"), torch.no_grad():
+            if self.runtime is not None:
+                outputs = self.runtime.head(
+                    feature_spatial.to(device), feature_motion.to(device)
+                )
+                return outputs.item()
+            feature_spatial = feature_spatial.unsqueeze(dim=0).to(device)
+            feature_motion = feature_motion.unsqueeze(dim=0).to(device)
+            outputs = self.model.regress(feature_spatial, feature_motion)
             y_val = outputs.item()
 
             return y_val
 
+    def score_features(self, video_dist_spatial, feature_motion):
+        """
+        Scores preprocessed spatial key frames together with per-clip motion features.
+
+        Args:
+            video_dist_spatial (torch.Tensor): Key frames, `frames` x 3 x 448 x 448.
+            feature_motion (list): SlowFast features of every clip, each (2048 + 256).
+
+        Returns:
+            float: The predicted quality score.
+        """
+        return self.regress(
+            self.spatial_features(video_dist_spatial), torch.stack(feature_motion)
+        )
+
+    def score_frames(self, video_dist_spatial, video_dist_motion):
+        """
+        Scores already preprocessed spatial key frames and motion clips.
+
+        Args:
+            video_dist_spatial (torch.Tensor): Key frames, `frames` x 3 x 448 x 448.
+            video_dist_motion (list): 32-frame clips, each 32 x 3 x 224 x 224.
+
+        Returns:
+            float: The predicted quality score.
+        """
+        feature_motion = [self.batcher.submit(clip) for clip in video_dist_motion]
+        self.batcher.flush()
+        feature_motion = [feature.result() for feature in feature_motion]
+        return self.score_features(video_dist_spatial, feature_motion)
+
+    def score(self, video_path, feature_cache=None, video_hash=None):
+        """
+        Decodes and scores a single video.
+
+        Args:
+            video_path (str): Path to the video file.
+            feature_cache (FeatureCache): Optional cache of backbone features. On a hit
+                the video is not decoded at all.
+            video_hash (str): Content hash of the video when already known.
+
+        Returns:
+            float: The predicted quality score, or a failure message.
+        """
+        consumer = self.consumer(feature_cache, video_hash)
+        try:
+            if not consumer.load_cached_features(video_path):
+                run_consumers(video_path, consumer)
+        except Exception as e:
+            return f"Failed to process: {e}"
+        return consumer.result()
+
+    def score_many(self, video_paths, feature_cache=None):
+        """
+        Scores several videos with the same loaded networks.
+
+        With a motion batch size above one, motion clips of consecutive videos share
+        SlowFast batches: a video is only regressed once all of its clips went through
+        a batch, which usually happens while the following videos are being decoded.
+
+        Args:
+            video_paths (list): Paths to the video files.
+            feature_cache (FeatureCache): Optional cache of backbone features. Videos
+                found in it are not decoded.
+
+        Returns:
+            list: Quality scores (or failure messages) in the order of `video_paths`.
+        """
+        scores = [None] * len(video_paths)
+        pending = []
+        for idx, video_path in enumerate(video_paths):
+            consumer = self.consumer(feature_cache)
+            try:
+                if not consumer.load_cached_features(video_path):
+                    run_consumers(video_path, consumer)
+            except Exception as e:
+                scores[idx] = f"Failed to process: {e}"
+                continue
+            pending.append((idx, consumer))
+
+            waiting = []
+            for pending_idx, pending_consumer in pending:
+                if pending_consumer.features_ready():
+                    scores[pending_idx] = pending_consumer.result()
+                else:
+                    waiting.append((pending_idx, pending_consumer))
+            pending = waiting
+
+        self.batcher.flush()
+        for pending_idx, pending_consumer in pending:
+            scores[pending_idx] = pending_consumer.result()
+
+        return scores
+
+
+_scorers = {}
+
+
+def get_scorer(model_path=MODEL_PATH):
+    """
+    Returns the process-wide scorer for a checkpoint, loading it on first use.
+
+    Args:
+        model_path (str): Path to the SimpleVQA checkpoint.
+
+    Returns:
+        SimpleVQAScorer: The cached scorer.
+    """
+    if model_path not in _scorers:
+        _scorers[model_path] = SimpleVQAScorer(model_path)
+    return _scorers[model_path]
+
+
+def simple_vqa_infer(video_path):
+    try:
+        scorer = get_scorer()
     except Exception as e:
-        return f"Failed to process: {e}"
+        print(f"Error loading model state dict: {e}")
+        return
+    return scorer.score(video_path)
@@ -0,0 +1,96 @@
+from constants.video_quality_eval.constants import (
+    MODEL_PATH,
+    BACKBONE_PRECISION,
+    QUANTIZE_REGRESSION_HEAD,
+    CHANNELS_LAST,
+)
+from src.video_quality_eval.deep_learning.simpleVQA.infer import SimpleVQAScorer
+import time
+import numpy as np
+
+
+def rank_correlation(scores, other_scores):
+    """
+    Spearman rank correlation of two score lists, ignoring ties.
+    """
+    ranks = np.argsort(np.argsort(scores))
+    other_ranks = np.argsort(np.argsort(other_scores))
+    return float(np.corrcoef(ranks, other_ranks)[0, 1])
+
+
+def compare_precision(
+    video_paths,
+    model_path=MODEL_PATH,
+    backbone_precision=BACKBONE_PRECISION,
+    quantize_head=QUANTIZE_REGRESSION_HEAD,
+    channels_last=CHANNELS_LAST,
+):
+    """
+    Scores a reference set of videos with the float32 networks and with a reduced
+    precision setting, to check the score drift and the speedup before switching.
+
+    Args:
+        video_paths (list): Paths to the reference videos.
+        model_path (str): Path to the SimpleVQA checkpoint.
+        backbone_precision (str): Backbone precision to check, "fp32" or "bf16".
+        quantize_head (bool): Whether to check the int8 regression head.
+        channels_last (bool): Whether to check the channels-last memory format.
+
+    Returns:
+        dict: Both scores and their absolute difference per video, the maximum and
+            mean drift, the rank correlation of the two score lists and the speedup
+            of the reduced setting, over the videos both settings could score.
+    """
+    scorers = {
+        "fp32": SimpleVQAScorer(
+            model_path,
+            backbone_precision="fp32",
+            quantize_head=False,
+            channels_last=False,
+        ),
+        "reduced": SimpleVQAScorer(
+            model_path,
+            backbone_precision=backbone_precision,
+            quantize_head=quantize_head,
+            channels_last=channels_last,
+        ),
+    }
+    scores = {name: [] for name in scorers}
+    seconds = {name: 0.0 for name in scorers}
+    for video_path in video_paths:
+        for name, scorer in scorers.items():
+            started = time.perf_counter()
+            scores[name].append(scorer.score(video_path))
+            seconds[name] += time.perf_counter() - started
+
+    videos = {}
+    for video_path, score, reduced_score in zip(
+        video_paths, scores["fp32"], scores["reduced"]
+    ):
+        # failures hold their error message instead of a score
+        if isinstance(score, str) or isinstance(reduced_score, str):
+            error = score if isinstance(score, str) else reduced_score
+            print(f"Skipping {video_path}: {error}")
+            continue
+        videos[video_path] = {
+            "fp32": score,
+            "reduced": reduced_score,
+            "drift": abs(reduced_score - score),
+        }
+
+    drifts = [video["drift"] for video in videos.values()]
+    return {
+        "precision": scorers["reduced"].precision or "fp32",
+        "videos": videos,
+        "max_drift": max(drifts) if drifts else None,
+        "mean_drift": float(np.mean(drifts)) if drifts else None,
+        "rank_correlation": (
+            rank_correlation(
+                [video["fp32"] for video in videos.values()],
+                [video["reduced"] for video in videos.values()],
+            )
+            if len(videos) > 1
+            else None
+        ),
+        "speedup": seconds["fp32"] / seconds["reduced"] if seconds["reduced"] else None,
+    }
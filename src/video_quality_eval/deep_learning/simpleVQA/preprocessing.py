@@ -0,0 +1,78 @@
+from torchvision.transforms import InterpolationMode
+import cv2
+import torch
+import torchvision.transforms.functional as TF
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+KINETICS_MEAN = (0.45, 0.45, 0.45)
+KINETICS_STD = (0.225, 0.225, 0.225)
+
+
+def resized_size(height, width, size):
+    """
+    The output height and width of `transforms.Resize(size)` for a frame, where an
+    int `size` is the new shorter side.
+    """
+    if not isinstance(size, int):
+        return tuple(size)
+    if height <= width:
+        return size, int(size * width / height)
+    return int(size * height / width), size
+
+
+def resize_frame(bgr, size, crop=None, out=None):
+    """
+    Resizes a decoded BGR frame to RGB with the antialiased bilinear filter of
+    torchvision's `Resize`, running on a uint8 tensor instead of a PIL image. Recent
+    torchvision versions resize the uint8 pixels directly; older ones go through float.
+
+    Args:
+        bgr (numpy.ndarray): Frame as height x width x 3 uint8, BGR.
+        size (int or list): Size as given to `transforms.Resize`, the shorter side or
+            [height, width].
+        crop (int): Side of the optional center crop taken after resizing.
+        out (numpy.ndarray): Optional height x width x 3 uint8 array to write to.
+
+    Returns:
+        numpy.ndarray: The resized RGB frame, height x width x 3 uint8.
+    """
+    # a channels-last uint8 view of the frame, resized without a copy to channels-first
+    frame = torch.from_numpy(bgr).permute(2, 0, 1)
+    resized = TF.resize(
+        frame,
+        list(resized_size(*bgr.shape[:2], size)),
+        interpolation=InterpolationMode.BILINEAR,
+        antialias=True,
+    )
+    resized = resized.permute(1, 2, 0).numpy()
+    if crop is not None:
+        height, width = resized.shape[:2]
+        top = int(round((height - crop) / 2.0))
+        left = int(round((width - crop) / 2.0))
+        resized = resized[top : top + crop, left : left + crop]
+    return cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=out)
+
+
+def normalize_frames(frames, mean, std, out=None):
+    """
+    Turns a batch of uint8 RGB frames into the normalized float tensor of
+    `ToTensor` followed by `Normalize`, in one fused multiply-add over the batch.
+
+    Args:
+        frames (numpy.ndarray): Frames as `frames` x height x width x 3 uint8.
+        mean (tuple): Per-channel mean of `Normalize`.
+        std (tuple): Per-channel standard deviation of `Normalize`.
+        out (torch.Tensor): Optional `frames` x 3 x height x width float tensor to
+            write to.
+
+    Returns:
+        torch.Tensor: The normalized frames, `frames` x 3 x height x width.
+    """
+    batch = torch.from_numpy(frames).permute(0, 3, 1, 2)
+    std = torch.tensor(std).view(3, 1, 1)
+    scale = 1.0 / (255.0 * std)
+    bias = -torch.tensor(mean).view(3, 1, 1) / std
+    if out is None:
+        out = torch.empty(batch.shape)
+    return torch.addcmul(bias, batch, scale, out=out)
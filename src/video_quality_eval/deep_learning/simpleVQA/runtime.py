@@ -0,0 +1,127 @@
+from constants.video_quality_eval.constants import EXPORT_DIR
+import json
+import os
+import torch
+
+# file names of the exported graphs per format
+EXPORTED_FILES = {
+    "torchscript": {
+        "spatial": "spatial_backbone.pt",
+        "motion": "slowfast_features.pt",
+        "head": "regression_head.pt",
+    },
+    "onnx": {
+        "spatial": "spatial_backbone.onnx",
+        "motion": "slowfast_features.onnx",
+        "head": "regression_head.onnx",
+    },
+}
+METADATA_FILE = "export.json"
+BACKENDS = {"torchscript": "torchscript", "onnxruntime": "onnx"}
+
+
+def read_metadata(export_dir=EXPORT_DIR):
+    """
+    Reads the metadata written next to the exported graphs, or returns {} if none.
+    """
+    try:
+        with open(os.path.join(export_dir, METADATA_FILE)) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return {}
+
+
+class TorchScriptRuntime:
+    """
+    Runs the frozen TorchScript graphs of the SimpleVQA networks.
+
+    Args:
+        export_dir (str): Directory holding the exported graphs.
+        device (torch.device): Device to run on.
+    """
+
+    def __init__(self, export_dir, device):
+        files = EXPORTED_FILES["torchscript"]
+        self.modules = {
+            name: torch.jit.load(os.path.join(export_dir, file_name), device)
+            for name, file_name in files.items()
+        }
+
+    def spatial(self, frames):
+        return self.modules["spatial"](frames)
+
+    def motion(self, slow_pathway, fast_pathway):
+        return self.modules["motion"](slow_pathway, fast_pathway)
+
+    def head(self, feature_spatial, feature_motion):
+        return self.modules["head"](feature_spatial, feature_motion)
+
+
+class OnnxRuntime:
+    """
+    Runs the ONNX graphs of the SimpleVQA networks with ONNX Runtime on the CPU.
+    Inputs are copied to the CPU and outputs are returned as CPU tensors.
+
+    Args:
+        export_dir (str): Directory holding the exported graphs.
+    """
+
+    def __init__(self, export_dir):
+        import onnxruntime
+
+        files = EXPORTED_FILES["onnx"]
+        self.sessions = {
+            name: onnxruntime.InferenceSession(
+                os.path.join(export_dir, file_name),
+                providers=["CPUExecutionProvider"],
+            )
+            for name, file_name in files.items()
+        }
+
+    def run(self, name, *tensors):
+        session = self.sessions[name]
+        inputs = {
+            graph_input.name: tensor.detach().cpu().float().numpy()
+            for graph_input, tensor in zip(session.get_inputs(), tensors)
+        }
+        return torch.from_numpy(session.run(None, inputs)[0])
+
+    def spatial(self, frames):
+        return self.run("spatial", frames)
+
+    def motion(self, slow_pathway, fast_pathway):
+        return self.run("motion", slow_pathway, fast_pathway)
+
+    def head(self, feature_spatial, feature_motion):
+        return self.run("head", feature_spatial, feature_motion)
+
+
+def load_runtime(backend, model_version, device, export_dir=EXPORT_DIR):
+    """
+    Loads the exported graphs of a checkpoint for a runtime backend.
+
+    Args:
+        backend (str): "torchscript" or "onnxruntime".
+        model_version (str): Content hash of the checkpoint the graphs must come from.
+        device (torch.device): Device the TorchScript graphs run on.
+        export_dir (str): Directory holding the exported graphs.
+
+    Returns:
+        TorchScriptRuntime or OnnxRuntime: The loaded graphs.
+
+    Raises:
+        ValueError: If the backend is unknown or the graphs are missing or were
+            exported from another checkpoint.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown SimpleVQA backend: {backend}")
+    metadata = read_metadata(export_dir)
+    export_format = BACKENDS[backend]
+    if export_format not in metadata.get("formats", []):
+        raise ValueError(f"No {export_format} export in {export_dir}")
+    if metadata.get("model_version") != model_version:
+        raise ValueError(f"The graphs in {export_dir} come from another checkpoint")
+
+    if backend == "torchscript":
+        return TorchScriptRuntime(export_dir, device)
+    return OnnxRuntime(export_dir)
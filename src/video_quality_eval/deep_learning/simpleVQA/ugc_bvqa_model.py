@@ -280,16 +280,15 @@ class ResNet(nn.Module):
 
         return regression_block
 
-    def _forward_impl(self, x, x_3D_features):
-        # See note [TorchScript super()]
+    def spatial_features(self, x):
+        """
+        Runs the backbone and returns the avg/std-pooled features of layer2 to layer4,
+        everything the model computes from the frames before the regression head.
+        """
         # input dimension: batch x frames x 3 x height x width
         x_size = x.shape
-        # x_3D: batch x frames x (2048 + 256)
-        x_3D_features_size = x_3D_features.shape
         # x: batch * frames x 3 x height x width
         x = x.view(-1, x_size[2], x_size[3], x_size[4])
-        # x_3D: batch * frames x (2048 + 256)
-        x_3D_features = x_3D_features.view(-1, x_3D_features_size[2])
 
         x = self.conv1(x)
         x = self.bn1(x)
@@ -311,6 +310,22 @@ class ResNet(nn.Module):
         x = torch.cat((x_avg2, x_std2, x_avg3, x_std3, x_avg4, x_std4), dim=1)
         # x: batch * frames x (2048*2 + 1024*2 + 512*2)
         x = torch.flatten(x, 1)
+        # x: batch x frames x (2048*2 + 1024*2 + 512*2)
+        return x.view(x_size[0], x_size[1], -1)
+
+    def regress(self, x, x_3D_features):
+        """
+        Runs the regression head on pooled spatial features and 3D features.
+        """
+        # x: batch x frames x (2048*2 + 1024*2 + 512*2)
+        x_size = x.shape
+        # x_3D: batch x frames x (2048 + 256)
+        x_3D_features_size = x_3D_features.shape
+        # x: batch * frames x (2048*2 + 1024*2 + 512*2)
+        x = x.view(-1, x_size[2])
+        # x_3D: batch * frames x (2048 + 256)
+        x_3D_features = x_3D_features.view(-1, x_3D_features_size[2])
+
         # x: batch * frames x (2048*2 + 1024*2 + 512*2 + 2048 + 512)
         x = torch.cat((x, x_3D_features), dim=1)
         # x: batch * frames x 1
@@ -322,6 +337,10 @@ class ResNet(nn.Module):
 
         return x
 
+    def _forward_impl(self, x, x_3D_features):
+        # See note [TorchScript super()]
+        return self.regress(self.spatial_features(x), x_3D_features)
+
     def forward(self, x, x_3D_features):
         return self._forward_impl(x, x_3D_features)
 
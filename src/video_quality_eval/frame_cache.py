@@ -0,0 +1,270 @@
+from constants.video_quality_eval.constants import (
+    FRAME_CACHE_DIR,
+    FRAME_CACHE_MAX_BYTES,
+    FRAME_CACHE_SHORT_SIDE,
+)
+from src.video_quality_eval.frame_pipeline import VideoInfo
+from src.video_quality_eval.instrumentation import profiled
+import hashlib
+import json
+import os
+import cv2
+import numpy as np
+
+HEADER_SIZE = 4096
+MAGIC = b"VQFC1\n"
+
+
+class CachedFrames:
+    """
+    Decoded frames of one video, memory-mapped from a frame cache entry.
+
+    Args:
+        path (str): Path to the cache entry.
+        meta (dict): Header of the entry.
+    """
+
+    def __init__(self, path, meta):
+        self.meta = meta
+        self.frames = np.memmap(
+            path,
+            dtype=np.uint8,
+            mode="r",
+            offset=HEADER_SIZE,
+            shape=tuple(meta["shape"]),
+        )
+        self.indices = np.fromfile(
+            path, dtype=np.int64, count=meta["shape"][0], offset=meta["indices_offset"]
+        )
+
+    def video_info(self, video_path):
+        return VideoInfo(
+            path=video_path, frame_count=self.meta["frame_count"], fps=self.meta["fps"]
+        )
+
+    def covers(self, needed):
+        """
+        Whether the entry holds every frame in `needed` (None meaning the whole video).
+        """
+        if self.meta["complete"]:
+            return True
+        if needed is None:
+            return False
+        return set(needed).issubset(self.indices.tolist())
+
+    def read(self, needed=None):
+        """
+        Yields (frame index, frame) pairs for the cached frames in `needed`, in order.
+        """
+        for position, frame_idx in enumerate(self.indices.tolist()):
+            if needed is None or frame_idx in needed:
+                yield frame_idx, self.frames[position]
+
+
+class FrameCacheWriter:
+    """
+    Writes frames to a new cache entry while they are being decoded.
+
+    The header is reserved up front and filled in on `close`, once the number of
+    frames is known; the entry only becomes visible after it is complete. An entry
+    that would not fit in the cache's `max_bytes` is aborted as soon as that is
+    known, and the frames keep flowing through uncached.
+
+    Args:
+        cache (FrameCache): The cache the entry belongs to.
+        path (str): Final path of the entry.
+        video_info (VideoInfo): Properties of the video.
+    """
+
+    def __init__(self, cache, path, video_info):
+        self.cache = cache
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.video_info = video_info
+        self.indices = []
+        self.shape = None
+        self.failed = False
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(b"\0" * HEADER_SIZE)
+        self.bytes_written = HEADER_SIZE
+
+    def tee(self, frames, sequential):
+        """
+        Stores every frame of `frames` and yields it on, downscaled to the cache size.
+
+        Args:
+            frames (iterable): (frame index, BGR frame) pairs.
+            sequential (bool): Whether `frames` runs over the whole video in order.
+        """
+        self.sequential = sequential
+        self.exhausted = False
+        for frame_idx, frame in frames:
+            frame = self.cache.downscale(frame)
+            if self.shape is None:
+                self.shape = frame.shape
+                # a whole-video entry of this frame size could never fit
+                if sequential and (
+                    frame.nbytes * self.video_info.frame_count > self.cache.max_bytes
+                ):
+                    self.abort()
+            if frame.shape != self.shape:
+                self.abort()
+            # each frame also takes 8 bytes of index
+            if self.bytes_written + frame.nbytes + 8 * (len(self.indices) + 1) > (
+                self.cache.max_bytes
+            ):
+                self.abort()
+            if not self.failed:
+                self.file.write(np.ascontiguousarray(frame).tobytes())
+                self.bytes_written += frame.nbytes
+                self.indices.append(frame_idx)
+            yield frame_idx, frame
+        self.exhausted = True
+
+    def close(self):
+        """
+        Finalizes the entry, or discards it if nothing usable was written.
+        """
+        if self.failed:
+            return
+        indices_offset = self.file.tell()
+        self.file.write(np.asarray(self.indices, dtype=np.int64).tobytes())
+        meta = {
+            "shape": [len(self.indices), *(self.shape or ())],
+            "fps": self.video_info.fps,
+            "frame_count": self.video_info.frame_count,
+            "complete": bool(self.sequential and self.exhausted),
+            "indices_offset": indices_offset,
+        }
+        header = MAGIC + json.dumps(meta).encode()
+        self.file.seek(0)
+        self.file.write(header.ljust(HEADER_SIZE, b" "))
+        self.file.close()
+
+        if not self.indices or len(header) > HEADER_SIZE:
+            os.remove(self.tmp_path)
+            return
+        os.replace(self.tmp_path, self.path)
+        self.cache.evict(keep=self.path)
+
+    def abort(self):
+        """
+        Discards the entry, keeping nothing of what was written so far.
+        """
+        if self.failed:
+            return
+        self.failed = True
+        self.file.close()
+        os.remove(self.tmp_path)
+
+
+class FrameCache:
+    """
+    On-disk cache of decoded frames, so a video is decoded once and every later pass
+    (other metrics, re-runs with new thresholds or models) reads cheap memory-mapped
+    uint8 arrays instead of going through the H.264 decoder again.
+
+    Each entry holds the frames that were decoded (every frame, or the sampled ones)
+    behind a small header with their shape, fps and indices. Entries are keyed by the
+    video's path, size and modification time, and the least recently used ones are
+    evicted once the cache grows past `max_bytes`.
+
+    Args:
+        cache_dir (str): Directory holding the cache entries.
+        max_bytes (int): Size cap of the cache directory.
+        short_side (int): Short side frames are downscaled to before caching. None
+            keeps full-resolution frames, so results match a fresh decode exactly.
+    """
+
+    def __init__(
+        self,
+        cache_dir=FRAME_CACHE_DIR,
+        max_bytes=FRAME_CACHE_MAX_BYTES,
+        short_side=FRAME_CACHE_SHORT_SIDE,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.short_side = short_side
+
+    def entry_path(self, video_path):
+        stat = os.stat(video_path)
+        key = f"{os.path.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}:{self.short_side}"
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        return os.path.join(self.cache_dir, f"{digest}.frames")
+
+    def downscale(self, frame):
+        if self.short_side is None or min(frame.shape[:2]) <= self.short_side:
+            return frame
+        height, width = frame.shape[:2]
+        scale = self.short_side / min(height, width)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def load(self, video_path):
+        """
+        Opens the cache entry of a video.
+
+        Args:
+            video_path (str): Path to the video file.
+
+        Returns:
+            CachedFrames: The memory-mapped frames, or None on a cache miss.
+        """
+        path = self.entry_path(video_path)
+        try:
+            with profiled("frame_cache_read"), open(path, "rb") as f:
+                header = f.read(HEADER_SIZE)
+            if not header.startswith(MAGIC):
+                return None
+            meta = json.loads(header[len(MAGIC) :].decode())
+            cached_frames = CachedFrames(path, meta)
+            # the modification time doubles as the last-use time for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return cached_frames
+
+    def writer(self, video_path, video_info):
+        """
+        Starts a new cache entry for a video.
+
+        Args:
+            video_path (str): Path to the video file.
+            video_info (VideoInfo): Properties of the video.
+
+        Returns:
+            FrameCacheWriter: The writer filling the entry.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.evict()
+        return FrameCacheWriter(self, self.entry_path(video_path), video_info)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache fits in `max_bytes`.
+
+        Args:
+            keep (str): Path of an entry never to evict, e.g. the one just written.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".frames"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
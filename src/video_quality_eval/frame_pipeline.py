@@ -0,0 +1,366 @@
+from collections import namedtuple
+from src.video_quality_eval.instrumentation import add_time, count, timed_iter
+import cv2
+import time
+
+VideoInfo = namedtuple("VideoInfo", ["path", "frame_count", "fps"])
+
+
+class DecodedFrame:
+    """
+    A single decoded video frame with lazily computed colour views.
+
+    Each view is converted at most once per frame, so every consumer asking for
+    the grayscale or RGB version of the same frame shares one conversion.
+    """
+
+    def __init__(self, bgr):
+        self.bgr = bgr
+        self._gray = None
+        self._rgb = None
+        self._gray_scaled = {}
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def gray_at(self, short_side=None):
+        """
+        Returns the grayscale view downscaled with area interpolation so that its
+        shorter side is `short_side` pixels. Frames already that small, or a
+        `short_side` of None, give the full-resolution view.
+        """
+        gray = self.gray
+        if short_side is None or min(gray.shape) <= short_side:
+            return gray
+        if short_side not in self._gray_scaled:
+            height, width = gray.shape
+            scale = short_side / min(height, width)
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            self._gray_scaled[short_side] = cv2.resize(
+                gray, size, interpolation=cv2.INTER_AREA
+            )
+        return self._gray_scaled[short_side]
+
+    @property
+    def rgb(self):
+        if self._rgb is None:
+            self._rgb = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+        return self._rgb
+
+
+class FrameSampler:
+    """
+    Chooses which frames of a video a consumer gets to see. The base sampler keeps
+    every frame.
+    """
+
+    time_budget = None
+
+    def indices(self, video_info):
+        """
+        Returns the sorted frame indices to feed, or None for every frame in order.
+        """
+        return None
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+
+class EveryNthFrame(FrameSampler):
+    """
+    Keeps every `n`-th frame, starting with the first one.
+    """
+
+    def __init__(self, n):
+        self.n = max(1, n)
+
+    def indices(self, video_info):
+        return list(range(0, video_info.frame_count, self.n))
+
+    def __repr__(self):
+        return f"EveryNthFrame({self.n})"
+
+
+class UniformFrames(FrameSampler):
+    """
+    Keeps `k` frames spread uniformly over the whole video.
+    """
+
+    def __init__(self, k):
+        self.k = max(1, k)
+
+    def indices(self, video_info):
+        if video_info.frame_count <= 0:
+            return []
+        step = max(video_info.frame_count - 1, 0) / max(self.k - 1, 1)
+        return sorted(
+            {
+                min(int(round(i * step)), video_info.frame_count - 1)
+                for i in range(self.k)
+            }
+        )
+
+    def __repr__(self):
+        return f"UniformFrames({self.k})"
+
+
+class KeyFrames(FrameSampler):
+    """
+    Keeps one key frame per second, the same frames the SimpleVQA spatial branch uses.
+    They are reached by seeking, so the frames in between are not converted.
+    """
+
+    def indices(self, video_info):
+        return list(range(0, video_info.frame_count, max(video_info.fps, 1)))
+
+
+class TimeBudget(FrameSampler):
+    """
+    Feeds frames in order until `seconds` of wall-clock time have been spent decoding.
+    """
+
+    def __init__(self, seconds):
+        self.time_budget = seconds
+
+    def __repr__(self):
+        return f"TimeBudget({self.time_budget})"
+
+
+class FrameConsumer:
+    """
+    Base class for anything that wants to look at the frames of a video.
+
+    A consumer is registered on a `FramePipeline`, receives `start` once with the
+    video properties, `consume` for every decoded frame and `finish` once the
+    decoder is exhausted. The computed value is then available from `result`, and the
+    indices of the frames it was fed from `frames_used`.
+
+    Consumers comparing consecutive frames set `needs_pairs`, so that a sampler also
+    feeds them the frame following every sampled one.
+    """
+
+    needs_pairs = False
+
+    @property
+    def stage(self):
+        """
+        Name the time spent in this consumer is profiled under.
+        """
+        return getattr(self, "metric", None) or type(self).__name__
+
+    def start(self, video_info):
+        self.video_info = video_info
+
+    def consume(self, frame_idx, frame):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+    def result(self):
+        raise NotImplementedError
+
+
+class FramePipeline:
+    """
+    Decodes a video exactly once and fans every frame out to the registered consumers.
+
+    Consumers may be registered with a `FrameSampler`. When none of them needs every
+    frame, only the union of the sampled frames is decoded: short gaps are skipped
+    with `grab`, longer ones by seeking with `CAP_PROP_POS_FRAMES`.
+
+    With a `FrameCache`, frames are read from the video's cache entry when it holds
+    every frame the consumers need, and otherwise decoded and written to a new entry
+    on the way through.
+
+    Args:
+        video_path (str): Path to the video file.
+        frame_cache (FrameCache): Optional on-disk cache of decoded frames.
+    """
+
+    def __init__(self, video_path, frame_cache=None):
+        self.video_path = video_path
+        self.frame_cache = frame_cache
+        self.consumers = []
+        self.samplers = []
+
+    def register(self, consumer, sampler=None):
+        """
+        Registers a consumer and returns it, so calls can be chained on creation.
+
+        Args:
+            consumer (FrameConsumer): The consumer to feed.
+            sampler (FrameSampler): Which frames to feed it. Defaults to every frame.
+
+        Returns:
+            FrameConsumer: The registered consumer.
+        """
+        self.consumers.append(consumer)
+        self.samplers.append(sampler if sampler is not None else FrameSampler())
+        return consumer
+
+    def sampled_indices(self, video_info):
+        """
+        Resolves the samplers into one index set per consumer (None for every frame).
+        """
+        consumer_indices = []
+        for consumer, sampler in zip(self.consumers, self.samplers):
+            indices = sampler.indices(video_info)
+            if indices is not None and consumer.needs_pairs:
+                indices = set(indices)
+                indices.update(
+                    idx + 1 for idx in list(indices) if idx + 1 < video_info.frame_count
+                )
+            consumer_indices.append(set(indices) if indices is not None else None)
+        return consumer_indices
+
+    def run(self):
+        """
+        Runs the decode pass over the video.
+
+        Returns:
+            VideoInfo: Properties of the decoded video.
+        """
+        cached = None
+        if self.frame_cache is not None:
+            cached = self.frame_cache.load(self.video_path)
+
+        cap = None
+        cache_writer = None
+        try:
+            if cached is not None:
+                video_info = cached.video_info(self.video_path)
+            else:
+                cap = self.open_capture()
+                video_info = self.capture_info(cap)
+            for consumer in self.consumers:
+                consumer.frames_used = []
+                consumer.start(video_info)
+
+            consumer_indices = self.sampled_indices(video_info)
+            sequential = any(indices is None for indices in consumer_indices)
+            needed = None if sequential else set().union(*consumer_indices)
+
+            if cached is not None and cached.covers(needed):
+                frames = timed_iter("frame_cache_read", cached.read(needed))
+            else:
+                if cap is None:
+                    cap = self.open_capture()
+                if sequential:
+                    frames = self.read_sequential(cap)
+                else:
+                    frames = self.read_sparse(cap, needed, video_info)
+                frames = timed_iter("decode", frames)
+                if self.frame_cache is not None:
+                    cache_writer = self.frame_cache.writer(self.video_path, video_info)
+                    frames = cache_writer.tee(frames, sequential)
+
+            consumer_seconds = [0.0] * len(self.consumers)
+            frames_read = 0
+            started = time.perf_counter()
+            for frame_idx, frame in frames:
+                frames_read += 1
+                elapsed = time.perf_counter() - started
+                decoded_frame = DecodedFrame(frame)
+                active = 0
+                for consumer_idx, (consumer, sampler, indices) in enumerate(
+                    zip(self.consumers, self.samplers, consumer_indices)
+                ):
+                    if (
+                        sampler.time_budget is not None
+                        and elapsed > sampler.time_budget
+                    ):
+                        continue
+                    active += 1
+                    if indices is None or frame_idx in indices:
+                        consumer.frames_used.append(frame_idx)
+                        consume_started = time.perf_counter()
+                        consumer.consume(frame_idx, decoded_frame)
+                        consumer_seconds[consumer_idx] += (
+                            time.perf_counter() - consume_started
+                        )
+                if not active:
+                    break
+
+        except BaseException:
+            if cache_writer is not None:
+                cache_writer.abort()
+            raise
+        else:
+            if cache_writer is not None:
+                cache_writer.close()
+        finally:
+            if cap is not None:
+                cap.release()
+
+        count("frames_read", frames_read)
+        for consumer, seconds in zip(self.consumers, consumer_seconds):
+            finish_started = time.perf_counter()
+            consumer.finish()
+            seconds += time.perf_counter() - finish_started
+            add_time(consumer.stage, seconds, len(consumer.frames_used))
+
+        return video_info
+
+    def open_capture(self):
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise ValueError("Error opening video file")
+        return cap
+
+    def capture_info(self, cap):
+        return VideoInfo(
+            path=self.video_path,
+            frame_count=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            fps=int(round(cap.get(cv2.CAP_PROP_FPS))),
+        )
+
+    @staticmethod
+    def read_sequential(cap):
+        frame_idx = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame_idx, frame
+            frame_idx += 1
+
+    @staticmethod
+    def read_sparse(cap, indices, video_info):
+        # decoding forward is cheaper than seeking for gaps shorter than about a second
+        max_grab = max(video_info.fps, 1)
+        position = 0
+        for frame_idx in sorted(indices):
+            gap = frame_idx - position
+            if 0 <= gap <= max_grab:
+                for _ in range(gap):
+                    cap.grab()
+            else:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame_idx, frame
+            position = frame_idx + 1
+
+
+def run_consumers(video_path, *consumers, sampler=None, frame_cache=None):
+    """
+    Decodes the video once, feeding all the given consumers.
+
+    Args:
+        video_path (str): Path to the video file.
+        *consumers (FrameConsumer): Consumers to feed.
+        sampler (FrameSampler): Which frames to feed them. Defaults to every frame.
+        frame_cache (FrameCache): Optional on-disk cache of decoded frames.
+
+    Returns:
+        VideoInfo: Properties of the decoded video.
+    """
+    pipeline = FramePipeline(video_path, frame_cache)
+    for consumer in consumers:
+        pipeline.register(consumer, sampler)
+    return pipeline.run()
@@ -0,0 +1,258 @@
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import torch
+
+logger = logging.getLogger("video_quality_eval")
+
+_active = threading.local()
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the process so far, in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+class Profile:
+    """
+    Timers and counters of the stages run while it is active.
+
+    Timers are inclusive: a stage running inside another one, such as a SlowFast
+    forward triggered while the SimpleVQA consumer handles a frame, counts towards
+    both.
+    """
+
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self.peak_rss_mb = None
+        self.cuda_peak_mb = None
+
+    def add_time(self, stage, seconds, calls=1):
+        timer = self.timers.setdefault(stage, [0.0, 0])
+        timer[0] += seconds
+        timer[1] += calls
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        return {
+            "timers": {
+                stage: {"seconds": seconds, "calls": calls}
+                for stage, (seconds, calls) in self.timers.items()
+            },
+            "counters": dict(self.counters),
+            "peak_rss_mb": self.peak_rss_mb,
+            "cuda_peak_mb": self.cuda_peak_mb,
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide totals of every profile and of stages run outside of one, rendered
+    in the OpenMetrics text format. Safe to update from several threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profile = Profile()
+        self.videos = 0
+        self.peak_rss_mb = 0.0
+
+    def add_time(self, stage, seconds, calls=1):
+        with self.lock:
+            self.profile.add_time(stage, seconds, calls)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.profile.count(name, value)
+
+    def observe(self, profile):
+        """
+        Adds the profile of one evaluated video, as stored in its record.
+        """
+        with self.lock:
+            self.videos += 1
+            for stage, timer in profile["timers"].items():
+                self.profile.add_time(stage, timer["seconds"], timer["calls"])
+            for name, value in profile["counters"].items():
+                self.profile.count(name, value)
+            self.peak_rss_mb = max(self.peak_rss_mb, profile["peak_rss_mb"] or 0)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "videos": self.videos,
+                **self.profile.as_dict(),
+                "peak_rss_mb": max(self.peak_rss_mb, peak_rss_mb()),
+            }
+
+    def render(self):
+        with self.lock:
+            lines = [
+                "# TYPE vqe_videos counter",
+                f"vqe_videos_total {self.videos}",
+                "# TYPE vqe_stage_seconds counter",
+                "# UNIT vqe_stage_seconds seconds",
+            ]
+            for stage, (seconds, _) in sorted(self.profile.timers.items()):
+                lines.append(f'vqe_stage_seconds_total{{stage="{stage}"}} {seconds}')
+            lines.append("# TYPE vqe_stage_calls counter")
+            for stage, (_, calls) in sorted(self.profile.timers.items()):
+                lines.append(f'vqe_stage_calls_total{{stage="{stage}"}} {calls}')
+            lines.append("# TYPE vqe_events counter")
+            for name, value in sorted(self.profile.counters.items()):
+                lines.append(f'vqe_events_total{{name="{name}"}} {value}')
+            peak_rss_bytes = max(self.peak_rss_mb, peak_rss_mb()) * 1024**2
+            lines += [
+                "# TYPE vqe_peak_rss_bytes gauge",
+                "# UNIT vqe_peak_rss_bytes bytes",
+                f"vqe_peak_rss_bytes {peak_rss_bytes:.0f}",
+                "# EOF",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Atomically replaces `path` with the current metrics, for a textfile collector.
+        """
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+
+def active_profile():
+    """
+    The profile of the video evaluated in this thread, or None.
+    """
+    return getattr(_active, "profile", None)
+
+
+def add_time(stage, seconds, calls=1):
+    """
+    Records time spent in a stage, in the active profile or else in the registry.
+    """
+    profile = active_profile()
+    (profile if profile is not None else registry).add_time(stage, seconds, calls)
+
+
+def count(name, value=1):
+    """
+    Increments a counter, in the active profile or else in the registry.
+    """
+    profile = active_profile()
+    (profile if profile is not None else registry).count(name, value)
+
+
+@contextmanager
+def profiled(stage):
+    """
+    Times the enclosed block as one call of `stage`.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, time.perf_counter() - started)
+
+
+def timed_iter(stage, iterable):
+    """
+    Yields the items of `iterable`, timing the production of each one as `stage`.
+    """
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            add_time(stage, time.perf_counter() - started)
+        yield item
+
+
+@contextmanager
+def profile_video(profile=None):
+    """
+    Makes a fresh profile active in this thread while a video is evaluated, and
+    records the memory high-water marks once it is done.
+
+    Args:
+        profile (Profile): Profile to resume instead, for work on a video that was
+            put aside, such as its deferred SimpleVQA score.
+
+    Yields:
+        Profile: The profile being filled.
+    """
+    if profile is None:
+        profile = Profile()
+    previous = active_profile()
+    _active.profile = profile
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    try:
+        yield profile
+    finally:
+        _active.profile = previous
+        profile.peak_rss_mb = peak_rss_mb()
+        if torch.cuda.is_available():
+            profile.cuda_peak_mb = torch.cuda.max_memory_allocated() / 1024**2
+
+
+def log_event(event, **fields):
+    """
+    Emits a structured log line: one JSON object with an `event` name.
+    """
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"event": event, **fields}, separators=(",", ":")))
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """
+    Serves the registry in the OpenMetrics text format on `http://host:port/metrics`
+    from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: The server; call `shutdown` to stop it.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header(
+                "Content-Type",
+                "application/openmetrics-text; version=1.0.0; charset=utf-8",
+            )
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,126 @@
+from constants.video_quality_eval.constants import (
+    MODEL_PATH,
+    METRICS_VERSION,
+    RESULTS_DB_PATH,
+)
+from src.hashing import file_content_hash
+from src.video_quality_eval.instrumentation import profiled
+import json
+import os
+import sqlite3
+
+
+class ResultStore:
+    """
+    Persistent per-video result cache backed by SQLite.
+
+    Results are keyed by the video's content hash together with the metrics version
+    and the SimpleVQA checkpoint hash, so renamed or re-downloaded copies of a video
+    are found again, while changing the metrics or the model invalidates old entries.
+    Content hashes are themselves cached by path, size and modification time, so an
+    unchanged file is never read twice.
+
+    Args:
+        db_path (str): Path to the SQLite database, created if missing.
+        model_path (str): Path to the SimpleVQA checkpoint used for scoring.
+        metrics_version (str): Version of the metrics and their settings.
+    """
+
+    def __init__(
+        self, db_path=RESULTS_DB_PATH, model_path=MODEL_PATH, metrics_version=None
+    ):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                content_hash TEXT NOT NULL,
+                metrics_version TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                video TEXT NOT NULL,
+                record TEXT NOT NULL,
+                PRIMARY KEY (content_hash, metrics_version, model_version)
+            );
+            """)
+        self.metrics_version = (
+            metrics_version if metrics_version is not None else METRICS_VERSION
+        )
+        self.model_version = (
+            self.content_hash(model_path) if os.path.exists(model_path) else "missing"
+        )
+
+    def content_hash(self, file_path):
+        """
+        Returns the content hash of a file, reusing the stored one if the file is unchanged.
+
+        Args:
+            file_path (str): Path to the file.
+
+        Returns:
+            str: Hex digest of the content.
+        """
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        row = self.connection.execute(
+            "SELECT content_hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+
+        with profiled("hash"):
+            content_hash = file_content_hash(path)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, content_hash),
+            )
+        return content_hash
+
+    def get(self, content_hash):
+        """
+        Looks up the stored result of a video.
+
+        Args:
+            content_hash (str): Content hash of the video.
+
+        Returns:
+            dict: The stored quality record, or None if the video was not scored yet.
+        """
+        with profiled("result_store_read"):
+            row = self.connection.execute(
+                "SELECT record FROM results WHERE content_hash = ? AND metrics_version = ? AND model_version = ?",
+                (content_hash, self.metrics_version, self.model_version),
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, content_hash, video, record):
+        """
+        Stores the result of a video and commits right away, so progress survives a crash.
+
+        Args:
+            content_hash (str): Content hash of the video.
+            video (str): File name of the video.
+            record (dict): Quality record of the video.
+        """
+        with profiled("result_store_write"), self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (
+                    content_hash,
+                    self.metrics_version,
+                    self.model_version,
+                    video,
+                    json.dumps(record),
+                ),
+            )
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,199 @@
+from constants.video_quality_eval.constants import (
+    OUT_JSONL_PATH,
+    JSONL_FSYNC_EVERY,
+    JSONL_FSYNC_INTERVAL,
+)
+from src.video_quality_eval.instrumentation import profiled
+import json
+import os
+import time
+import numpy as np
+
+
+class JsonLinesWriter:
+    """
+    Streams quality records to a JSON Lines file, one compact `{video: quality}`
+    object per line, written as soon as each video is scored.
+
+    Every record is flushed to the OS right away, so a reader tailing the file sees
+    it immediately. The costlier fsync that makes it durable is batched: it runs every
+    `fsync_every` records or `fsync_interval` seconds, whichever comes first, and on
+    close.
+
+    Args:
+        path (str): Path to the JSON Lines file. Its directory is created if missing.
+        fsync_every (int): Number of records between two fsyncs.
+        fsync_interval (float): Maximum number of seconds between two fsyncs.
+        append (bool): Whether to append to an existing file instead of replacing it.
+    """
+
+    def __init__(
+        self,
+        path=OUT_JSONL_PATH,
+        fsync_every=JSONL_FSYNC_EVERY,
+        fsync_interval=JSONL_FSYNC_INTERVAL,
+        append=False,
+    ):
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.file = open(path, "a" if append else "w")
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def write(self, video, video_quality):
+        """
+        Appends the record of one video.
+
+        Args:
+            video (str): Name of the video.
+            video_quality (dict): Its quality record.
+        """
+        with profiled("results_write"):
+            line = json.dumps({video: video_quality}, separators=(",", ":"))
+            self.file.write(line + "\n")
+            self.file.flush()
+            self.unsynced += 1
+            if (
+                self.unsynced >= self.fsync_every
+                or time.monotonic() - self.last_sync >= self.fsync_interval
+            ):
+                self.sync()
+
+    def sync(self):
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class OrderedWriter:
+    """
+    Passes records on to a `JsonLinesWriter` in input order. A record ready before
+    those of earlier videos is held back until they are written, so the output does
+    not depend on which worker finishes first.
+
+    Args:
+        writer (JsonLinesWriter): The writer the records go to.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.waiting = {}
+        self.next_position = 0
+
+    def write(self, position, video, video_quality):
+        """
+        Queues the record of the video at `position` in the input, and writes every
+        record whose turn has come.
+        """
+        self.waiting[position] = (video, video_quality)
+        while self.next_position in self.waiting:
+            self.writer.write(*self.waiting.pop(self.next_position))
+            self.next_position += 1
+
+    def close(self):
+        """
+        Writes the records still held back, e.g. after an interrupted run, and closes
+        the writer.
+        """
+        for position in sorted(self.waiting):
+            self.writer.write(*self.waiting.pop(position))
+        self.writer.close()
+
+
+def read_json_lines(path):
+    """
+    Iterates over the (video, quality record) pairs of a JSON Lines results file.
+    A truncated last line, left by an interrupted run, is skipped.
+    """
+    with open(path) as json_lines:
+        for line in json_lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            for video, video_quality in record.items():
+                yield video, video_quality
+
+
+def flatten_record(video_quality):
+    """
+    Flattens a quality record into column values: `<metric>_score` and
+    `<metric>_quality` per metric, plus `duplicate_of`.
+    """
+    columns = {}
+    for metric, value in video_quality.items():
+        if isinstance(value, dict) and "quality_score" in value:
+            score = value["quality_score"]
+            # failed metrics hold their error message instead of a score
+            columns[f"{metric}_score"] = (
+                float(score) if isinstance(score, (int, float)) else np.nan
+            )
+            if "quality" in value:
+                columns[f"{metric}_quality"] = value["quality"]
+    if "duplicate_of" in video_quality:
+        columns["duplicate_of"] = video_quality["duplicate_of"]
+    return columns
+
+
+def export_structured_array(jsonl_path=OUT_JSONL_PATH, out_path=None):
+    """
+    Converts a JSON Lines results file into a NumPy structured array with one row per
+    video: a `video` column and the score (float64, NaN when missing or failed) and
+    Clear/Blur label of every metric, plus `duplicate_of`.
+
+    The file is read twice, once for the columns and their widths and once to fill a
+    preallocated array, so no intermediate list of records is held in memory.
+
+    Args:
+        jsonl_path (str): Path to the JSON Lines results file.
+        out_path (str): Optional `.npy` file the array is saved to.
+
+    Returns:
+        np.ndarray: The structured array.
+    """
+    count = 0
+    widths = {"video": 1}
+    for video, video_quality in read_json_lines(jsonl_path):
+        count += 1
+        widths["video"] = max(widths["video"], len(video))
+        for column, value in flatten_record(video_quality).items():
+            if isinstance(value, str):
+                widths[column] = max(widths.get(column, 1), len(value))
+            else:
+                widths.setdefault(column, None)
+
+    dtype = [
+        (column, "f8" if width is None else f"U{width}")
+        for column, width in widths.items()
+    ]
+    table = np.zeros(count, dtype=dtype)
+    for column, width in widths.items():
+        if width is None:
+            table[column] = np.nan
+
+    for row, (video, video_quality) in enumerate(read_json_lines(jsonl_path)):
+        if row >= count:
+            break
+        table[row]["video"] = video
+        for column, value in flatten_record(video_quality).items():
+            table[row][column] = value
+
+    if out_path is not None:
+        np.save(out_path, table)
+    return table
@@ -1,114 +1,344 @@
-from skimage.metrics import structural_similarity as ssim
+from constants.video_quality_eval.constants import (
+    ANALYSIS_SHORT_SIDE,
+    FRAME_BATCH_SIZE,
+    QUALITY_THRESHOLDS,
+)
+from src.video_quality_eval.frame_pipeline import (
+    FrameConsumer,
+    FramePipeline,
+    run_consumers,
+)
 import cv2
 import numpy as np
 
 
-def laplacian_video_quality(video_path):
+def quality_threshold(metric, analysis_short_side=None):
     """
-    Assess the video quality based on the Laplacian variance of video frames.
+    Returns the Clear/Blur threshold of a metric calibrated for an analysis resolution.
 
-    This function calculates the Laplacian variance for each frame in a video file to determine
-    the overall sharpness or blurriness of the video. A higher average Laplacian variance
-    suggests a clearer video, while a lower value indicates a blurrier video.
+    Args:
+        metric (str): One of "laplacian", "structural_similarity" or "psnr".
+        analysis_short_side (int): Short side the frames are analysed at, None for full resolution.
+
+    Returns:
+        float: The threshold, falling back to the full-resolution one for uncalibrated sizes.
+    """
+    thresholds = QUALITY_THRESHOLDS.get(analysis_short_side, QUALITY_THRESHOLDS[None])
+    return thresholds[metric]
+
+
+def analysed_short_side(frame, analysis_short_side):
+    """
+    The short side a frame is actually analysed at by `gray_at(analysis_short_side)`,
+    or None when it is not downscaled because it is already that small.
+    """
+    if analysis_short_side is None or min(frame.gray.shape) <= analysis_short_side:
+        return None
+    return analysis_short_side
+
+
+class LaplacianConsumer(FrameConsumer):
+    """
+    Accumulates the Laplacian variance of every grayscale frame.
 
     Args:
-        video_path (str): Path to the video file.
+        threshold (float): Average variance above which the video is considered clear.
+            Defaults to the threshold calibrated for the resolution the frames are
+            analysed at, full resolution for videos not larger than
+            `analysis_short_side`.
+        analysis_short_side (int): Short side frames are downscaled to before scoring.
+            None scores full-resolution frames.
+    """
+
+    metric = "laplacian"
+
+    def __init__(self, threshold=None, analysis_short_side=ANALYSIS_SHORT_SIDE):
+        self.threshold = threshold
+        self.analysis_short_side = analysis_short_side
+        self.analysed_side = None
+        self.laplacian_values = []
+
+    def consume(self, frame_idx, frame):
+        self.analysed_side = analysed_short_side(frame, self.analysis_short_side)
+        gray_frame = frame.gray_at(self.analysis_short_side)
+        laplacian_var = cv2.Laplacian(gray_frame, cv2.CV_64F).var()
+        self.laplacian_values.append(laplacian_var)
+
+    def result(self):
+        if not self.laplacian_values:
+            raise ValueError("No frames to analyze")
+
+        avg_laplacian = np.mean(self.laplacian_values)
+        quality = "Clear" if avg_laplacian > self.video_threshold() else "Blur"
+        return avg_laplacian, quality
+
+    def video_threshold(self):
+        if self.threshold is not None:
+            return self.threshold
+        return quality_threshold(self.metric, self.analysed_side)
+
+
+def batch_psnr(frames):
+    """
+    Computes the PSNR between every pair of consecutive frames of a batch.
+
+    Args:
+        frames (np.ndarray): K grayscale frames stacked on the last axis, H x W x K.
 
     Returns:
-        float: The average Laplacian variance of the frames in the video.
-        str: A quality assessment of 'Clear' if the average Laplacian variance is above 100, otherwise 'Blur'.
+        np.ndarray: The K-1 PSNR values, infinite for identical frames.
     """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise ValueError("Error opening video file")
+    frames = frames.astype(np.float32, copy=False)
+    diff = frames[..., 1:] - frames[..., :-1]
+    mse = np.mean(diff * diff, axis=(0, 1), dtype=np.float64)
+    # PSNR is infinity if there is no noise (identical frames)
+    with np.errstate(divide="ignore"):
+        return 20 * np.log10(255.0 / np.sqrt(mse))
 
-    laplacian_values = []
 
-    try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+def batch_ssim(frames, win_size=7, k1=0.01, k2=0.03, data_range=255.0):
+    """
+    Computes the SSIM between every pair of consecutive frames of a batch.
 
-            gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            laplacian_var = cv2.Laplacian(gray_frame, cv2.CV_64F).var()
-            laplacian_values.append(laplacian_var)
+    Matches `skimage.metrics.structural_similarity` with its default arguments (uniform
+    7x7 window, sample covariance, border of half a window excluded from the mean), but
+    the local means and squared means of each frame are filtered once and shared by
+    both pairs the frame belongs to, and all frames go through one box filter call.
 
-    finally:
-        cap.release()
+    Args:
+        frames (np.ndarray): K grayscale frames stacked on the last axis, H x W x K.
+        win_size (int): Side of the square averaging window.
+        k1 (float): Luminance stabilization constant.
+        k2 (float): Contrast stabilization constant.
+        data_range (float): Dynamic range of the pixel values.
 
-    if not laplacian_values:
-        raise ValueError("No frames to analyze")
+    Returns:
+        np.ndarray: The K-1 SSIM values.
+    """
+    frames = frames.astype(np.float32, copy=False)
+    window = (win_size, win_size)
+    cov_norm = win_size * win_size / (win_size * win_size - 1.0)
+    c1 = (k1 * data_range) ** 2
+    c2 = (k2 * data_range) ** 2
 
-    avg_laplacian = np.mean(laplacian_values)
-    quality = "Clear" if avg_laplacian > 100 else "Blur"
+    mu = cv2.blur(frames, window, borderType=cv2.BORDER_REFLECT)
+    mu_sq = cv2.blur(frames * frames, window, borderType=cv2.BORDER_REFLECT)
+    mu_cross = cv2.blur(
+        frames[..., :-1] * frames[..., 1:], window, borderType=cv2.BORDER_REFLECT
+    )
+    if mu_cross.ndim == 2:
+        mu_cross = mu_cross[..., np.newaxis]
 
-    return avg_laplacian, quality
+    ux, uy = mu[..., :-1], mu[..., 1:]
+    ux_uy = ux * uy
+    ux_sq, uy_sq = ux * ux, uy * uy
+    vx = cov_norm * (mu_sq[..., :-1] - ux_sq)
+    vy = cov_norm * (mu_sq[..., 1:] - uy_sq)
+    vxy = cov_norm * (mu_cross - ux_uy)
 
+    s = ((2 * ux_uy + c1) * (2 * vxy + c2)) / ((ux_sq + uy_sq + c1) * (vx + vy + c2))
 
-def structural_similarity_video_quality(video_path, threshold=0.75):
-    """Evaluate video quality using SSIM. Videos with higher SSIM are considered clearer.
+    pad = (win_size - 1) // 2
+    return np.mean(s[pad:-pad, pad:-pad], axis=(0, 1), dtype=np.float64)
+
+
+class ConsecutiveFramesConsumer(FrameConsumer):
+    """
+    Scores every pair of consecutive grayscale frames, `batch_size` frames at a time.
+
+    The last frame of a batch is kept as the first frame of the next one, so no pair is
+    skipped. When frames are sampled, only frames that directly follow each other are
+    paired. Subclasses set `batch_metric` to a function mapping H x W x K frames to
+    the K-1 pair scores.
 
     Args:
-        video_path (str): Path to the video file.
         threshold (float): Threshold for determining if the video is clear or blurred.
+            Defaults to the threshold calibrated for the resolution the frames are
+            analysed at, full resolution for videos not larger than
+            `analysis_short_side`.
+        batch_size (int): Number of frames scored together.
+        analysis_short_side (int): Short side frames are downscaled to before scoring.
+            None scores full-resolution frames.
+    """
+
+    metric = None
+    batch_metric = None
+    needs_pairs = True
+
+    def __init__(
+        self,
+        threshold=None,
+        batch_size=FRAME_BATCH_SIZE,
+        analysis_short_side=ANALYSIS_SHORT_SIDE,
+    ):
+        self.threshold = threshold
+        self.batch_size = max(2, batch_size)
+        self.analysis_short_side = analysis_short_side
+        self.analysed_side = None
+        self.values = []
+        self.frames = []
+        self.last_frame_idx = None
+
+    def consume(self, frame_idx, frame):
+        if self.frames and frame_idx != self.last_frame_idx + 1:
+            self.score_batch()
+            self.frames = []
+        self.last_frame_idx = frame_idx
+        self.analysed_side = analysed_short_side(frame, self.analysis_short_side)
+        self.frames.append(frame.gray_at(self.analysis_short_side))
+        if len(self.frames) >= self.batch_size:
+            self.score_batch()
+
+    def score_batch(self):
+        if len(self.frames) > 1:
+            batch = np.stack(self.frames, axis=-1)
+            self.values.extend(self.batch_metric(batch))
+        self.frames = self.frames[-1:]
+
+    def finish(self):
+        self.score_batch()
+
+    def result(self):
+        avg_value = np.mean(self.values)
+        quality = "Clear" if avg_value > self.video_threshold() else "Blur"
+        return avg_value, quality
+
+    def video_threshold(self):
+        if self.threshold is not None:
+            return self.threshold
+        return quality_threshold(self.metric, self.analysed_side)
+
+
+class StructuralSimilarityConsumer(ConsecutiveFramesConsumer):
+    """
+    Accumulates the SSIM between every pair of consecutive grayscale frames.
+    Takes the same arguments as `ConsecutiveFramesConsumer`.
+    """
+
+    metric = "structural_similarity"
+    batch_metric = staticmethod(batch_ssim)
+
+
+class PSNRConsumer(ConsecutiveFramesConsumer):
+    """
+    Accumulates the PSNR between every pair of consecutive grayscale frames.
+    Takes the same arguments as `ConsecutiveFramesConsumer`.
+    """
+
+    metric = "psnr"
+    batch_metric = staticmethod(batch_psnr)
+
+
+def laplacian_video_quality(video_path, sampler=None):
+    """
+    Assess the video quality based on the Laplacian variance of video frames.
+
+    This function calculates the Laplacian variance for each frame in a video file to determine
+    the overall sharpness or blurriness of the video. A higher average Laplacian variance
+    suggests a clearer video, while a lower value indicates a blurrier video.
+
+    Args:
+        video_path (str): Path to the video file.
+        sampler (FrameSampler): Which frames to score. Defaults to every frame.
 
     Returns:
-        Tuple of average SSIM and video quality classification.
+        float: The average Laplacian variance of the frames in the video.
+        str: A quality assessment of 'Clear' if the average Laplacian variance is above 100, otherwise 'Blur'.
     """
-    ssim_values = []
-    cap = cv2.VideoCapture(video_path)
-    ret, prev_frame = cap.read()
-    prev_frame = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY) if ret else None
+    consumer = LaplacianConsumer()
+    run_consumers(video_path, consumer, sampler=sampler)
+    return consumer.result()
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        ssim_score = ssim(prev_frame, gray_frame)
-        ssim_values.append(ssim_score)
-        prev_frame = gray_frame
 
-    cap.release()
+def structural_similarity_video_quality(video_path, threshold=None, sampler=None):
+    """Evaluate video quality using SSIM. Videos with higher SSIM are considered clearer.
+
+    Args:
+        video_path (str): Path to the video file.
+        threshold (float): Threshold for determining if the video is clear or blurred.
+            Defaults to the one calibrated for the analysed resolution.
+        sampler (FrameSampler): Which frames to score. Consecutive pairs are formed from
+            each sampled frame and the one after it. Defaults to every frame.
 
-    avg_ssim = np.mean(ssim_values)
-    quality = "Clear" if avg_ssim > threshold else "Blur"
-    return avg_ssim, quality
+    Returns:
+        Tuple of average SSIM and video quality classification.
+    """
+    consumer = StructuralSimilarityConsumer(threshold)
+    run_consumers(video_path, consumer, sampler=sampler)
+    return consumer.result()
 
 
-def psnr_video_quality(video_path, threshold=30):
+def psnr_video_quality(video_path, threshold=None, sampler=None):
     """Evaluate video quality using PSNR. Higher PSNR values indicate better quality.
 
     Args:
         video_path (str): Path to the video file.
         threshold (float): Threshold for determining if the video is clear or blurred.
+            Defaults to the one calibrated for the analysed resolution.
+        sampler (FrameSampler): Which frames to score. Consecutive pairs are formed from
+            each sampled frame and the one after it. Defaults to every frame.
 
     Returns:
         Tuple of average PSNR and video quality classification.
     """
-    psnr_values = []
-    cap = cv2.VideoCapture(video_path)
-    ret, prev_frame = cap.read()
-    prev_frame = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY) if ret else None
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        mse = np.mean((prev_frame - gray_frame) ** 2)
-        if mse == 0:
-            psnr = float(
-                "inf"
-            )  # PSNR is infinity if there is no noise (identical frames)
-        else:
-            psnr = 20 * np.log10(255.0 / np.sqrt(mse))
-        psnr_values.append(psnr)
-        prev_frame = gray_frame
-
-    cap.release()
-
-    avg_psnr = np.mean(psnr_values)
-    quality = "Clear" if avg_psnr > threshold else "Blur"
-    return avg_psnr, quality
+    consumer = PSNRConsumer(threshold)
+    run_consumers(video_path, consumer, sampler=sampler)
+    return consumer.result()
+
+
+def calibrate_thresholds(video_paths, analysis_short_side, sampler=None):
+    """
+    Fits Clear/Blur thresholds for an analysis resolution on a reference set of videos.
+
+    Every video is scored at full resolution and at `analysis_short_side` in the same
+    decode pass. For each metric, the downscaled threshold is chosen so that the
+    downscaled verdicts agree with the full-resolution verdicts on as many videos as
+    possible. Videos not larger than `analysis_short_side` are never downscaled and
+    are left out. The result can be added to `QUALITY_THRESHOLDS`.
+
+    Args:
+        video_paths (list): Paths to the reference videos.
+        analysis_short_side (int): Short side to calibrate for.
+        sampler (FrameSampler): Which frames to score. Defaults to every frame.
+
+    Returns:
+        dict: Threshold of each metric at `analysis_short_side`.
+    """
+    consumer_classes = [LaplacianConsumer, StructuralSimilarityConsumer, PSNRConsumer]
+    full_scores = {cls.metric: [] for cls in consumer_classes}
+    scaled_scores = {cls.metric: [] for cls in consumer_classes}
+
+    for video_path in video_paths:
+        pipeline = FramePipeline(video_path)
+        consumers = [
+            (
+                pipeline.register(cls(analysis_short_side=None), sampler),
+                pipeline.register(
+                    cls(analysis_short_side=analysis_short_side), sampler
+                ),
+            )
+            for cls in consumer_classes
+        ]
+        pipeline.run()
+        for full, scaled in consumers:
+            if scaled.analysed_side is None:
+                continue
+            full_scores[full.metric].append(full.result()[0])
+            scaled_scores[scaled.metric].append(scaled.result()[0])
+
+    thresholds = {}
+    for metric in full_scores:
+        full_clear = np.array(full_scores[metric]) > quality_threshold(metric)
+        scaled = np.array(scaled_scores[metric])
+        values = np.unique(scaled[np.isfinite(scaled)])
+        if values.size == 0:
+            thresholds[metric] = quality_threshold(metric, analysis_short_side)
+            continue
+        # thresholds between every two observed scores, plus one below all of them
+        candidates = np.concatenate(
+            [[values[0] - 1], (values[:-1] + values[1:]) / 2, [values[-1]]]
+        )
+        agreement = [np.mean((scaled > t) == full_clear) for t in candidates]
+        thresholds[metric] = float(candidates[int(np.argmax(agreement))])
+
+    return thresholds
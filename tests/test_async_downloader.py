@@ -0,0 +1,219 @@
+from aiohttp import test_utils, web
+from src.pipeline.runner import DiskBudget
+from src.scraper.async_downloader import AsyncDownloader, HostRateLimiter
+from src.scraper.download_watcher import DownloadWatcher
+from src.scraper.video_index import VideoIndex, parse_video_id
+import asyncio
+import os
+import queue
+import threading
+
+VIDEO_BYTES = b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 64
+
+
+def video_link(video_id):
+    return f"https://www.tiktok.com/@user/video/{video_id}"
+
+
+class StandInServer:
+    """
+    Local stand-in for ssstik: serves the form token, resolves every link to a media
+    URL and streams a small file, recording how many media requests run at once.
+    Video IDs ending in 1 fail with 503 once, IDs ending in 4 are always missing.
+    """
+
+    def __init__(self, media_delay=0.1):
+        self.media_delay = media_delay
+        self.active = 0
+        self.max_active = 0
+        self.media_requests = {}
+        self.app = web.Application()
+        self.app.router.add_get("/en", self.page)
+        self.app.router.add_post("/abc", self.form)
+        self.app.router.add_get("/media/{video_id}.mp4", self.media)
+
+    async def page(self, request):
+        return web.Response(text="<script>s_tt = 'token';</script>")
+
+    async def form(self, request):
+        data = await request.post()
+        assert data["tt"] == "token"
+        video_id = parse_video_id(data["id"])
+        return web.Response(
+            text=f'<a class="without_watermark" href="/media/{video_id}.mp4">mp4</a>'
+        )
+
+    async def media(self, request):
+        video_id = request.match_info["video_id"]
+        attempt = self.media_requests.get(video_id, 0) + 1
+        self.media_requests[video_id] = attempt
+        if video_id.endswith("4"):
+            raise web.HTTPNotFound()
+        if video_id.endswith("1") and attempt == 1:
+            raise web.HTTPServiceUnavailable()
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.media_delay)
+        finally:
+            self.active -= 1
+        return web.Response(body=VIDEO_BYTES, content_type="video/mp4")
+
+
+def serve(stand_in, download_dir, video_index, run_downloader):
+    async def run():
+        server = test_utils.TestServer(stand_in.app)
+        await server.start_server()
+        try:
+            downloader = AsyncDownloader(
+                download_dir=download_dir,
+                base_url=str(server.make_url("")),
+                max_concurrency=2,
+                retries=2,
+                backoff=0.01,
+                timeout=10,
+                rate_limiter=HostRateLimiter(default_interval=0, jitter=0),
+                video_index=video_index,
+            )
+            return await run_downloader(downloader)
+        finally:
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def download(stand_in, video_links, download_dir, video_index):
+    return serve(
+        stand_in,
+        download_dir,
+        video_index,
+        lambda downloader: downloader.download_all(video_links),
+    )
+
+
+def test_downloads_with_bounded_concurrency_and_retries(tmp_path):
+    download_dir = str(tmp_path / "videos")
+    stand_in = StandInServer()
+    video_ids = ["1000", "1001", "1002", "1003", "1004", "1005"]
+    with VideoIndex(str(tmp_path / "index.sqlite3"), download_dir) as video_index:
+        video_links = [video_link(video_id) for video_id in video_ids]
+        paths = download(stand_in, video_links, download_dir, video_index)
+
+        assert stand_in.max_active == 2
+        # a 503 is retried, a 404 fails the video without affecting the others
+        assert stand_in.media_requests["1001"] == 2
+        assert stand_in.media_requests["1004"] == 1
+        assert paths[video_link("1004")] is None
+        assert video_index.get("1004") is None
+        assert not os.path.exists(os.path.join(download_dir, "1004.mp4"))
+
+        for video_id in ["1000", "1001", "1002", "1003", "1005"]:
+            path = os.path.join(download_dir, f"{video_id}.mp4")
+            assert paths[video_link(video_id)] == path
+            with open(path, "rb") as f:
+                assert f.read() == VIDEO_BYTES
+            indexed = video_index.get(video_id)
+            assert indexed["url"] == video_link(video_id)
+            assert indexed["size"] == len(VIDEO_BYTES)
+            assert video_index.downloaded_path(video_id) == path
+        assert not [name for name in os.listdir(download_dir) if name.endswith(".part")]
+
+
+def test_indexed_videos_are_not_downloaded_again(tmp_path):
+    download_dir = str(tmp_path / "videos")
+    with VideoIndex(str(tmp_path / "index.sqlite3"), download_dir) as video_index:
+        download(StandInServer(), [video_link("2000")], download_dir, video_index)
+        stand_in = StandInServer()
+        paths = download(stand_in, [video_link("2000")], download_dir, video_index)
+    assert paths[video_link("2000")] == os.path.join(download_dir, "2000.mp4")
+    assert stand_in.media_requests == {}
+
+
+def test_download_watcher_reports_the_finished_file(tmp_path):
+    download_dir = str(tmp_path / "videos")
+    os.makedirs(download_dir)
+    with VideoIndex(str(tmp_path / "index.sqlite3"), download_dir) as video_index:
+        with DownloadWatcher(download_dir, stable_interval=0.05) as watcher:
+            download(StandInServer(), [video_link("3000")], download_dir, video_index)
+            assert watcher.wait(timeout=5) == os.path.join(download_dir, "3000.mp4")
+
+
+def test_download_queue_reports_downloads_until_the_sentinel(tmp_path):
+    download_dir = str(tmp_path / "videos")
+    links = queue.Queue()
+    for video_id in ["4000", "4001", "4004"]:
+        links.put(video_link(video_id))
+    links.put(None)
+    downloaded = []
+    with VideoIndex(str(tmp_path / "index.sqlite3"), download_dir) as video_index:
+        serve(
+            StandInServer(),
+            download_dir,
+            video_index,
+            lambda downloader: downloader.download_queue(links, downloaded.append),
+        )
+    assert sorted(downloaded) == [
+        os.path.join(download_dir, "4000.mp4"),
+        os.path.join(download_dir, "4001.mp4"),
+    ]
+
+
+def test_download_queue_stops_without_a_sentinel(tmp_path):
+    download_dir = str(tmp_path / "videos")
+    stop = threading.Event()
+    stop.set()
+    with VideoIndex(str(tmp_path / "index.sqlite3"), download_dir) as video_index:
+        serve(
+            StandInServer(),
+            download_dir,
+            video_index,
+            lambda downloader: downloader.download_queue(
+                queue.Queue(), lambda path: None, stop=stop
+            ),
+        )
+
+
+def download_within_budget(tmp_path, video_ids, budget, on_downloaded):
+    download_dir = str(tmp_path / "videos")
+    links = queue.Queue()
+    for video_id in video_ids:
+        links.put(video_link(video_id))
+    links.put(None)
+    with VideoIndex(str(tmp_path / "index.sqlite3"), download_dir) as video_index:
+        serve(
+            StandInServer(),
+            download_dir,
+            video_index,
+            lambda downloader: downloader.download_queue(
+                links, on_downloaded, wait_for_room=budget.wait_for_room
+            ),
+        )
+    return sorted(os.listdir(download_dir))
+
+
+def test_download_queue_ends_once_the_disk_budget_is_spent(tmp_path):
+    budget = DiskBudget(2 * len(VIDEO_BYTES), False, threading.Event())
+    videos = download_within_budget(
+        tmp_path, ["5000", "5002", "5003", "5005", "5006"], budget, budget.downloaded
+    )
+    # the link taken while the first download was in flight may overshoot the budget
+    assert len(videos) in (2, 3)
+    assert budget.used_bytes() == len(videos) * len(VIDEO_BYTES)
+
+
+def test_download_queue_waits_for_scored_videos_to_be_deleted(tmp_path):
+    budget = DiskBudget(2 * len(VIDEO_BYTES), True, threading.Event())
+    kept = []
+
+    def score_previous(path):
+        # keeps one video waiting to be scored, deleting it once the next one lands
+        budget.downloaded(path)
+        if kept:
+            budget.scored(kept.pop())
+        kept.append(path)
+
+    videos = download_within_budget(
+        tmp_path, ["6000", "6002", "6003", "6005", "6006"], budget, score_previous
+    )
+    assert videos == ["6006.mp4"]
+    assert budget.used_bytes() == len(VIDEO_BYTES)
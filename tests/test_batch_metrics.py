@@ -0,0 +1,49 @@
+from skimage.metrics import structural_similarity
+from src.video_quality_eval.traditional.video_quality_eval import batch_psnr, batch_ssim
+import numpy as np
+import pytest
+
+
+def pair_psnr(frame, next_frame):
+    mse = np.mean((frame.astype(np.float64) - next_frame.astype(np.float64)) ** 2)
+    if mse == 0:
+        return np.inf
+    return 20 * np.log10(255.0 / np.sqrt(mse))
+
+
+def random_frames(num_frames, height=48, width=64, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = rng.integers(0, 256, (height, width, num_frames), dtype=np.uint8)
+    # a repeated frame gives an identical pair
+    if num_frames > 2:
+        frames[..., 2] = frames[..., 1]
+    return frames
+
+
+@pytest.mark.parametrize("num_frames", [2, 5])
+def test_batch_psnr_matches_per_pair(num_frames):
+    frames = random_frames(num_frames)
+    expected = [
+        pair_psnr(frames[..., i], frames[..., i + 1]) for i in range(num_frames - 1)
+    ]
+    np.testing.assert_allclose(batch_psnr(frames), expected, rtol=1e-7)
+
+
+def test_batch_psnr_identical_frames_are_infinite():
+    frames = np.repeat(random_frames(1), 2, axis=2)
+    assert np.isinf(batch_psnr(frames)).all()
+
+
+@pytest.mark.parametrize("num_frames", [2, 5])
+def test_batch_ssim_matches_skimage(num_frames):
+    frames = random_frames(num_frames)
+    expected = [
+        structural_similarity(frames[..., i], frames[..., i + 1], data_range=255)
+        for i in range(num_frames - 1)
+    ]
+    np.testing.assert_allclose(batch_ssim(frames), expected, atol=1e-5)
+
+
+def test_batch_ssim_identical_frames():
+    frames = np.repeat(random_frames(1), 2, axis=2)
+    np.testing.assert_allclose(batch_ssim(frames), [1.0], atol=1e-5)
@@ -0,0 +1,141 @@
+from src.benchmark.benchmark import make_synthetic_video
+from src.video_quality_eval.deep_learning.simpleVQA.infer import (
+    ClipBatcher,
+    SimpleVQAScorer,
+)
+from src.video_quality_eval import evaluate_indexed_video, evaluate_pending
+from functools import partial
+import json
+import logging
+import os
+import pytest
+import torch
+
+
+class RecordingScorer:
+    """
+    Stands in for the SlowFast forward, recording the clips of every batch.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def motion_features(self, clips):
+        self.batches.append([int(clip[0, 0, 0, 0]) for clip in clips])
+        return torch.stack([clip[0, 0, 0, :1] for clip in clips])
+
+
+def clip(value):
+    return torch.full([32, 3, 4, 4], float(value))
+
+
+def test_clip_batcher_fills_batches_across_videos():
+    scorer = RecordingScorer()
+    batcher = ClipBatcher(scorer, batch_size=4)
+    # three clips of one video, then two of the next
+    features = [batcher.submit(clip(value)) for value in range(5)]
+    assert scorer.batches == [[0, 1, 2, 3]]
+    assert not features[4].done()
+
+    batcher.flush()
+    assert scorer.batches == [[0, 1, 2, 3], [4]]
+    assert [feature.result().item() for feature in features] == [0, 1, 2, 3, 4]
+
+
+def test_clip_batcher_fails_pending_clips_on_error():
+    class FailingScorer:
+        def motion_features(self, clips):
+            raise ValueError("broken clip")
+
+    batcher = ClipBatcher(FailingScorer(), batch_size=2)
+    features = [batcher.submit(clip(value)) for value in range(3)]
+    batcher.flush()
+    for feature in features:
+        with pytest.raises(ValueError):
+            feature.result()
+
+
+@pytest.fixture(scope="module")
+def video_paths(tmp_path_factory):
+    video_dir = tmp_path_factory.mktemp("videos")
+    video_paths = []
+    for blur in (0, 1, 2):
+        video_path = str(video_dir / f"blur{blur}.mp4")
+        make_synthetic_video(video_path, 320, 240, 8, 2, blur=blur)
+        video_paths.append(video_path)
+    return video_paths
+
+
+@pytest.fixture(scope="module")
+def scorer():
+    torch.manual_seed(0)
+    return SimpleVQAScorer(None, device=torch.device("cpu"), motion_batch_size=1)
+
+
+@pytest.fixture(scope="module")
+def expected_scores(scorer, video_paths):
+    return [scorer.score(video_path) for video_path in video_paths]
+
+
+@pytest.fixture
+def batch_sizes(scorer, monkeypatch):
+    batch_sizes = []
+    motion_features = scorer.motion_features
+
+    def recorded_motion_features(clips):
+        batch_sizes.append(len(clips))
+        return motion_features(clips)
+
+    monkeypatch.setattr(scorer, "motion_features", recorded_motion_features)
+    monkeypatch.setattr(scorer.batcher, "batch_size", 4)
+    return batch_sizes
+
+
+def test_score_many_batches_clips_across_videos(
+    scorer, video_paths, expected_scores, batch_sizes
+):
+    scores = scorer.score_many(video_paths)
+
+    # two clips per video, so every full batch of four mixes clips of two videos
+    assert batch_sizes == [4, 2]
+    assert scores == pytest.approx(expected_scores, rel=1e-4)
+
+
+def test_serial_evaluation_batches_clips_across_videos(
+    scorer, video_paths, expected_scores, batch_sizes
+):
+    evaluate = partial(evaluate_indexed_video, scorer=scorer, defer_simple_vqa=True)
+    entries = [
+        (video_id, os.path.basename(video_path), video_path, None)
+        for video_id, video_path in enumerate(video_paths)
+    ]
+    results = list(evaluate_pending(iter(entries), 1, None, evaluate))
+
+    assert batch_sizes == [4, 2]
+    assert [entry for entry, _ in results] == entries
+    scores = [
+        video_quality["simple_VQA"]["quality_score"] for _, video_quality in results
+    ]
+    assert scores == pytest.approx(expected_scores, rel=1e-4)
+    for _, video_quality in results:
+        assert "laplacian" in video_quality and "profile" in video_quality
+
+
+def test_clip_batcher_halves_the_batch_on_out_of_memory(caplog):
+    class SmallMemoryScorer(RecordingScorer):
+        def motion_features(self, clips):
+            if len(clips) > 1:
+                raise RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")
+            return super().motion_features(clips)
+
+    scorer = SmallMemoryScorer()
+    batcher = ClipBatcher(scorer, batch_size=2)
+    with caplog.at_level(logging.INFO, logger="video_quality_eval"):
+        features = [batcher.submit(clip(value)) for value in range(2)]
+
+    assert batcher.batch_size == 1
+    assert scorer.batches == [[0], [1]]
+    assert [feature.result().item() for feature in features] == [0, 1]
+    events = [json.loads(record.getMessage()) for record in caplog.records]
+    assert events[0]["event"] == "motion_batch_size_reduced"
+    assert events[0]["batch_size"] == 1
@@ -0,0 +1,49 @@
+from src.video_quality_eval.deep_learning.simpleVQA.export import (
+    compare_graphs,
+    eager_modules,
+    export_graphs,
+)
+from src.video_quality_eval.deep_learning.simpleVQA.infer import SimpleVQAScorer
+from src.video_quality_eval.deep_learning.simpleVQA.runtime import (
+    BACKENDS,
+    load_runtime,
+)
+import pytest
+import torch
+
+MODEL_VERSION = "random-weights"
+
+
+@pytest.fixture(scope="module")
+def modules():
+    torch.manual_seed(0)
+    scorer = SimpleVQAScorer(
+        None,
+        device=torch.device("cpu"),
+        backbone_precision="fp32",
+        quantize_head=False,
+        channels_last=False,
+        backend="eager",
+    )
+    return eager_modules(scorer)
+
+
+@pytest.mark.parametrize("backend", ["torchscript", "onnxruntime"])
+def test_exported_graphs_match_eager(modules, tmp_path, backend):
+    if backend == "onnxruntime":
+        pytest.importorskip("onnxruntime")
+    export_dir = str(tmp_path)
+    export_graphs(modules, export_dir, MODEL_VERSION, formats=(BACKENDS[backend],))
+
+    runtime = load_runtime(backend, MODEL_VERSION, torch.device("cpu"), export_dir)
+    result = compare_graphs(modules, runtime, num_frames=3, atol=1e-3)
+    assert result["matches"], result["max_abs_difference"]
+
+
+def test_runtime_refuses_graphs_of_another_checkpoint(modules, tmp_path):
+    export_dir = str(tmp_path)
+    export_graphs(modules, export_dir, MODEL_VERSION, formats=("torchscript",))
+    with pytest.raises(ValueError):
+        load_runtime(
+            "torchscript", "another-checkpoint", torch.device("cpu"), export_dir
+        )
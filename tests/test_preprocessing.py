@@ -0,0 +1,60 @@
+from PIL import Image
+from src.video_quality_eval.deep_learning.simpleVQA.preprocessing import (
+    IMAGENET_MEAN,
+    IMAGENET_STD,
+    normalize_frames,
+    resize_frame,
+)
+from torchvision import transforms
+import cv2
+import numpy as np
+import pytest
+
+
+def random_frame(height, width, seed=0):
+    rng = np.random.default_rng(seed)
+    # smooth content with some noise, as in a decoded video frame
+    small = rng.integers(0, 256, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8)
+    frame = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.integers(-8, 9, frame.shape)
+    return np.clip(frame.astype(np.int64) + noise, 0, 255).astype(np.uint8)
+
+
+def pil_resize(bgr, size, crop=None):
+    steps = [transforms.Resize(size)]
+    if crop is not None:
+        steps.append(transforms.CenterCrop(crop))
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    return np.asarray(transforms.Compose(steps)(Image.fromarray(rgb)))
+
+
+@pytest.mark.parametrize("height, width", [(240, 320), (720, 1280), (1920, 1080)])
+@pytest.mark.parametrize("size, crop", [(520, 448), ([224, 224], None)])
+def test_resize_frame_matches_pil_transforms(height, width, size, crop):
+    bgr = random_frame(height, width)
+    expected = pil_resize(bgr, size, crop)
+    resized = resize_frame(bgr, size, crop=crop)
+    assert resized.shape == expected.shape
+    difference = np.abs(resized.astype(np.int64) - expected.astype(np.int64))
+    assert difference.max() <= 2
+    assert difference.mean() <= 0.5
+
+
+def test_resize_frame_writes_to_out():
+    bgr = random_frame(360, 640)
+    out = np.empty((448, 448, 3), dtype=np.uint8)
+    resize_frame(bgr, 520, crop=448, out=out)
+    np.testing.assert_array_equal(out, resize_frame(bgr, 520, crop=448))
+
+
+def test_normalize_frames_matches_to_tensor_and_normalize():
+    frames = np.stack([random_frame(32, 48, seed) for seed in range(3)])
+    to_tensor = transforms.Compose(
+        [transforms.ToTensor(), transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)]
+    )
+    expected = np.stack([to_tensor(frame).numpy() for frame in frames])
+    np.testing.assert_allclose(
+        normalize_frames(frames, IMAGENET_MEAN, IMAGENET_STD).numpy(),
+        expected,
+        atol=1e-5,
+    )